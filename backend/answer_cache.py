@@ -0,0 +1,188 @@
+import os
+import re
+import time
+import zlib
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+
+from .vector_index import HashingEmbedder
+
+logger = logging.getLogger(__name__)
+
+# Cached answers kept across all videos (least recently used evicted first)
+MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_SIZE', 2048))
+# Seconds a cached answer is served before asking Gemini again
+TTL = float(os.getenv('ANSWER_CACHE_TTL', 6 * 3600))
+# Cosine similarity of normalised questions above which they count as the same question
+THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.85))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Filler that does not change what is being asked. Question words and negations are kept.
+_STOPWORDS = frozenset("""
+    a an the is are was were be been do does did of to in on at for from with by and or
+    it its this that these those there please can could would you me i my we us our
+    tell explain video lecture again
+""".split())
+
+
+def _stem(word):
+    # Plural / third-person "s" only; enough to match "partitions" with "partition"
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize_question(question):
+    """Lowercased, lightly stemmed content words of the question, in order."""
+    words = _WORD.findall(question.lower())
+    kept = [_stem(w) for w in words if w not in _STOPWORDS]
+    return " ".join(kept or words)
+
+
+def transcript_fingerprint(video):
+    """
+    Changes whenever the transcript does, so answers from an old transcript are never
+    served. Answers given from an audio-only file are kept apart too: every process
+    (not just the one that upgraded the file) stops serving them once visuals arrive.
+    """
+    transcript = (video.transcript or "").encode()
+    fingerprint = f"{len(transcript)}-{zlib.crc32(transcript):08x}"
+    if getattr(video, 'gemini_media', None) == 'audio':
+        fingerprint += "-audio"
+    return fingerprint
+
+
+class AnswerCache:
+    """
+    Per-video cache of Q&A answers. Questions are matched exactly after normalisation,
+    then by cosine similarity of their hashed embeddings against the other cached
+    questions of the same video. Entries are evicted LRU beyond max_entries and expire
+    after ttl seconds; each video's entries are tied to a transcript fingerprint.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, threshold=THRESHOLD,
+                 embedder=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.embedder = embedder or HashingEmbedder(dim=1024)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (video_key, normalised question) -> (answer, vector, expires)
+        self._entries = OrderedDict()
+        # video_key -> transcript fingerprint the cached answers were made from
+        self._fingerprints = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _check_fingerprint(self, video_key, fingerprint):
+        # Caller holds the lock
+        if self._fingerprints.get(video_key) != fingerprint:
+            self._drop(video_key)
+            self._fingerprints[video_key] = fingerprint
+
+    def _drop(self, video_key):
+        for key in [k for k in self._entries if k[0] == video_key]:
+            del self._entries[key]
+
+    def get(self, video_key, question, fingerprint):
+        """Cached answer for the question (or a near duplicate of it), or None."""
+        normalized = normalize_question(question)
+        now = self._clock()
+        with self._lock:
+            self._check_fingerprint(video_key, fingerprint)
+            entry = self._entries.get((video_key, normalized))
+            if entry and entry[2] > now:
+                self._entries.move_to_end((video_key, normalized))
+                self.exact_hits += 1
+                return entry[0]
+
+            candidates = [(key, e) for key, e in self._entries.items()
+                          if key[0] == video_key and e[2] > now]
+            if candidates:
+                vector = self.embedder.embed([normalized])[0]
+                scores = np.stack([e[1] for _, e in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.similar_hits += 1
+                    return entry[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, video_key, question, fingerprint, answer):
+        normalized = normalize_question(question)
+        vector = self.embedder.embed([normalized])[0]
+        with self._lock:
+            self._check_fingerprint(video_key, fingerprint)
+            self._entries[(video_key, normalized)] = (answer, vector, self._clock() + self.ttl)
+            self._entries.move_to_end((video_key, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, video_key):
+        with self._lock:
+            self._drop(video_key)
+            self._fingerprints.pop(video_key, None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "entries": size,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
+
+
+def cached_ask(video, question):
+    """
+    ask_question behind the answer cache. Returns the answer dict, marked with
+    "cached": True when it was served from the cache. Errors are never cached.
+    """
+    from .rag import ask_question, index_key
+    key = index_key(video)
+    fingerprint = transcript_fingerprint(video)
+
+    answer = answer_cache.get(key, question, fingerprint)
+    if answer is not None:
+        return dict(answer, cached=True)
+
+    answer = ask_question(video, question)
+    if 'text' in answer:
+        answer_cache.put(key, question, fingerprint, answer)
+    return answer
+
+
+def cached_stream(video, question):
+    """
+    stream_answer behind the answer cache. A cached answer is sent as a single token;
+    a streamed answer is cached once it completed.
+    """
+    from .rag import stream_answer, index_key
+    key = index_key(video)
+    fingerprint = transcript_fingerprint(video)
+
+    answer = answer_cache.get(key, question, fingerprint)
+    if answer is not None:
+        yield "meta", {"timestamps": answer.get("timestamps", []), "cached": True}
+        yield "token", {"text": answer["text"]}
+        yield "done", dict(answer, cached=True)
+        return
+
+    for event, data in stream_answer(video, question):
+        if event == "done":
+            answer_cache.put(key, question, fingerprint, data)
+        yield event, data
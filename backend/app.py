@@ -1,52 +1,96 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import json
+from flask import (Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash,
+                   make_response, Response, stream_with_context, abort)
 from werkzeug.utils import secure_filename
 from flask_login import login_user, logout_user, login_required, current_user
 from .extensions import db, login_manager
-from .models import User, Video, ChatMessage
-import threading
-
-# Initialize Flask app
-app = Flask(__name__, static_url_path='/static', static_folder='static')
-app.secret_key = "supersecretkey" # Change this in production
-app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024 # 100MB max upload
-# Database Configuration
-database_url = os.getenv('DATABASE_URL')
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///' + os.path.join(app.instance_path, 'app.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize Extensions
-db.init_app(app)
-login_manager.init_app(app)
+from .engine import engine_options
+from .models import User, Video, ChatMessage, Job, Upload
+from . import jobs
+from .jobs import init_job_queue
+from .migrations import upgrade_schema
+from .locks import host_lock
+from .quizzes import get_quiz, create_quiz, queue_quiz, quiz_etag, quiz_payload
+from . import ingest
+from .pagination import keyset_page
+from .transcripts import get_index as get_transcript_index, delete_segments
+from . import status
+from .status import bump_status_version, record_deletion, status_version, video_statuses, wait_for_change
+from .uploads import (PART_SIZE, create_upload, write_chunk, finish_upload, cleanup_upload, abort_upload,
+                      schedule_sweep)
+from .dedup import (canonical_youtube_url, spool_and_hash, find_content,
+                    create_content, store_content, attach_video, release_content)
+
+# Every page and API route; create_app() registers them on the app
+bp = Blueprint('main', __name__)
+
+# Library page size
+VIDEOS_PER_PAGE = int(os.getenv('VIDEOS_PER_PAGE', 24))
+# Chat messages rendered with the video page / returned per history request
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', 30))
 
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-# Ensure instance directory exists
-os.makedirs(app.instance_path, exist_ok=True)
+def create_app(config=None):
+    """
+    Application factory. Importing this module and building the app does no network
+    I/O: Gemini, the vector collection and the S3 client are set up on first use.
+    config overrides the defaults below (tests pass an in-memory database).
+    """
+    app = Flask(__name__, static_url_path='/static', static_folder='static')
+    app.secret_key = "supersecretkey" # Change this in production
+    app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024 # 100MB max per request; larger files use the chunked /uploads API
+    # Database Configuration
+    database_url = os.getenv('DATABASE_URL')
+    if database_url and database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///' + os.path.join(app.instance_path, 'app.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config or {})
+    # WAL and lock waits for SQLite, a checked pool for Postgres (see engine.py)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # Initialize Extensions
+    db.init_app(app)
+    login_manager.init_app(app)
 
-# Create DB Tables
-with app.app_context():
-    db.create_all()
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Ensure instance directory exists
+    os.makedirs(app.instance_path, exist_ok=True)
 
-@app.route('/')
+    # Create DB Tables (and bring older databases up to date). Every gunicorn worker
+    # builds its app; one at a time, so they do not race each other's DDL
+    with app.app_context(), host_lock(os.path.join(app.instance_path, 'schema-upgrade.lock')):
+        upgrade_schema()
+
+    app.register_blueprint(bp)
+
+    # Background job queue (also requeues work interrupted by a restart)
+    init_job_queue(app)
+    return app
+
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        videos = Video.query.filter_by(user_id=current_user.id).order_by(Video.created_at.desc()).all()
-        return render_template('index.html', videos=videos)
-    return redirect(url_for('login'))
+        # Newest first, one page at a time (transcripts are deferred, so rows stay small)
+        videos, next_cursor = keyset_page(Video.query.filter_by(user_id=current_user.id),
+                                          Video.created_at, Video.id,
+                                          cursor=request.args.get('before'), limit=VIDEOS_PER_PAGE)
+        return render_template('index.html', videos=videos, next_cursor=next_cursor,
+                               paged=bool(request.args.get('before')), audio_only=ingest.AUDIO_ONLY,
+                               status_wait=status.LONG_POLL_SECONDS)
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -55,16 +99,16 @@ def login():
         
         if user and user.check_password(password):
             login_user(user)
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
             flash('Invalid username or password')
             
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
         
     if request.method == 'POST':
         username = request.form.get('username')
@@ -78,80 +122,66 @@ def register():
             db.session.add(user)
             db.session.commit()
             login_user(user)
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
             
     return render_template('register.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
+
+def _audio_only_option(value):
+    """Per-upload audio-only choice from a form or JSON field; None means the default."""
+    if value is None or value == '':
+        return None
+    return value is True or str(value).lower() in ('1', 'true', 'on', 'yes')
 
-@app.route('/upload', methods=['GET', 'POST'])
+def _register_video(title, filename, content, created, audio_only=None):
+    """Creates the user's Video row for a content record and queues processing if needed."""
+    video = Video(title=title, filename=filename, status="pending", author=current_user)
+    db.session.add(video)
+    needs_processing = attach_video(video, content, created)
+    bump_status_version([video])
+    db.session.commit()
+
+    if needs_processing:
+        # Trigger background processing
+        payload = {'audio_only': audio_only} if audio_only is not None else None
+        jobs.job_queue.enqueue('process_video', video.id, payload=payload)
+    return video
+
+@bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload_video():
     if request.method == 'GET':
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
         
     youtube_url = request.form.get('youtube_url')
+    # The form sends a hidden "0" followed by the checkbox's "1" when it is ticked
+    audio_only = _audio_only_option((request.form.getlist('audio_only') or [None])[-1])
     
     if youtube_url:
         # Handle YouTube Download
-        from .utils import download_youtube_video
-        import uuid
-        
-        filename = f"youtube_{uuid.uuid4().hex}.mp4"
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        if download_youtube_video(youtube_url, save_path):
-            # Check if S3 is configured
-            s3_bucket = os.getenv('AWS_BUCKET_NAME')
-            
-            if s3_bucket:
-                # Upload to S3
-                from .utils import upload_to_s3
-                s3_key = f"uploads/{current_user.id}/{filename}"
-                
-                # Open the downloaded file to upload to S3
-                with open(save_path, 'rb') as f:
-                    if upload_to_s3(f, s3_bucket, s3_key, content_type='video/mp4'):
-                        # Save to DB with S3 Key
-                        video = Video(title=f"YouTube: {youtube_url}", filename=filename, s3_key=s3_key, status="pending", author=current_user)
-                        db.session.add(video)
-                        db.session.commit()
-                        
-                        # Trigger background processing
-                        from .processing import process_video
-                        app_ctx = app.app_context()
-                        threading.Thread(target=process_video, args=(video.id, app_ctx)).start()
-                        
-                        # Cleanup local file after S3 upload
-                        os.remove(save_path)
-                        
-                        flash('YouTube video processed and uploaded to S3!')
-                        return redirect(url_for('index'))
-                    else:
-                        flash('Failed to upload YouTube video to S3')
-                        return redirect(request.url)
-            else:
-                # Local Storage
-                db_path = f"static/uploads/{filename}"
-                
-                # Save to DB
-                video = Video(title=f"YouTube: {youtube_url}", filename=filename, file_path=db_path, status="pending", author=current_user)
-                db.session.add(video)
-                db.session.commit()
-                
-                # Trigger background processing
-                from .processing import process_video
-                app_ctx = app.app_context()
-                threading.Thread(target=process_video, args=(video.id, app_ctx)).start()
-                    
-                flash('YouTube video downloaded and processing started!')
-                return redirect(url_for('index'))
-        else:
-            flash('Failed to download YouTube video')
-            return redirect(request.url)
+        canonical_url, content_key = canonical_youtube_url(youtube_url)
+        title = f"YouTube: {canonical_url}"
+
+        # Same video pasted before: reuse its artifacts, no download at all
+        content = find_content(content_key) if content_key else None
+        if content:
+            _register_video(title, "youtube.mp4", content, created=False, audio_only=audio_only)
+            flash('YouTube video added to your library!')
+            return redirect(url_for('main.index'))
+
+        # Download in the background (youtube.ingest_youtube); the badge shows its progress
+        video = Video(title=title, filename="youtube.mp4", status="pending", author=current_user)
+        db.session.add(video)
+        bump_status_version([video])
+        db.session.commit()
+        jobs.job_queue.enqueue('ingest_youtube', video.id, payload={
+            'url': canonical_url, 'content_key': content_key, 'audio_only': audio_only})
+        flash('YouTube download started!')
+        return redirect(url_for('main.index'))
 
     if 'video' not in request.files:
         flash('No file part')
@@ -164,51 +194,148 @@ def upload_video():
     
     if file:
         filename = secure_filename(file.filename)
-        
-        # Check if S3 is configured
-        s3_bucket = os.getenv('AWS_BUCKET_NAME')
-        
-        if s3_bucket:
-            # Upload to S3
-            from .utils import upload_to_s3
-            s3_key = f"uploads/{current_user.id}/{filename}"
-            if upload_to_s3(file, s3_bucket, s3_key, content_type=file.content_type):
-                # Save to DB with S3 Key
-                video = Video(title=filename, filename=filename, s3_key=s3_key, status="pending", author=current_user)
-                db.session.add(video)
-                db.session.commit()
-                
-                # Trigger background processing
-                from .processing import process_video
-                app_ctx = app.app_context()
-                threading.Thread(target=process_video, args=(video.id, app_ctx)).start()
-                
-                flash('Video uploaded to S3 successfully!')
-                return redirect(url_for('index'))
-            else:
-                flash('Failed to upload to S3')
-                return redirect(request.url)
-        else:
-            # Fallback to Local Storage
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            
-            db_path = f"static/uploads/{filename}"
-            
-            # Save to DB
-            video = Video(title=filename, filename=filename, file_path=db_path, status="pending", author=current_user)
-            db.session.add(video)
-            db.session.commit()
-            
-            # Trigger background processing
-            from .processing import process_video
-            app_ctx = app.app_context()
-            threading.Thread(target=process_video, args=(video.id, app_ctx)).start()
-                
+
+        # Spool to disk, hashing as the bytes arrive
+        import uuid
+        spool_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f".{uuid.uuid4().hex}.part")
+        content_hash, _ = spool_and_hash(file.stream, spool_path)
+
+        content = find_content(content_hash)
+        if content:
+            # Duplicate upload: nothing to store, upload or transcribe again
+            os.remove(spool_path)
+            _register_video(filename, filename, content, created=False, audio_only=audio_only)
             flash('Video uploaded successfully!')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
+
+        stored = store_content(spool_path, filename, content_hash, file.content_type)
+        if not stored:
+            flash('Failed to upload to S3')
+            return redirect(request.url)
+
+        _register_video(filename, filename, *stored, audio_only=audio_only)
+        flash('Video uploaded successfully!')
+        return redirect(url_for('main.index'))
+
+def _get_upload(upload_id):
+    upload = Upload.query.get_or_404(upload_id)
+    if upload.user_id != current_user.id:
+        abort(403)
+    return upload
+
+def _upload_status(upload):
+    return {"id": upload.id, "offset": upload.offset, "size": upload.size,
+            "status": upload.status, "part_size": PART_SIZE}
 
-@app.route('/video/<int:video_id>')
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def create_chunked_upload():
+    """Starts a resumable upload (create, PATCH chunks, finalize), for files of any size."""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return {"error": "No filename provided"}, 400
+
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return {"error": "Invalid size"}, 400
+
+    upload, error = create_upload(current_user.id, filename, data.get('content_type'),
+                                  size, current_app.config['UPLOAD_FOLDER'])
+    if error:
+        return {"error": error}, 502
+    # Uploads abandoned by earlier clients are aborted in the background
+    schedule_sweep()
+    return _upload_status(upload), 201, {'Location': url_for('main.chunked_upload_status', upload_id=upload.id)}
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    # HEAD is answered from this too: clients read Upload-Offset to resume
+    upload = _get_upload(upload_id)
+    return _upload_status(upload), 200, {'Upload-Offset': str(upload.offset), 'Cache-Control': 'no-store'}
+
+@bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@login_required
+def append_upload_chunk(upload_id):
+    upload = _get_upload(upload_id)
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return {"error": "Upload-Offset header required"}, 400
+
+    new_offset, error = write_chunk(upload, offset, request.stream, current_app.config['UPLOAD_FOLDER'])
+    if new_offset is None:
+        if upload.status != 'uploading':
+            # Nothing to resume: no offset, so clients stop instead of resyncing
+            return {"error": error}, 409
+        return {"error": error}, 409, {'Upload-Offset': str(upload.offset)}
+    if error:
+        return {"error": error}, 413, {'Upload-Offset': str(new_offset)}
+    return '', 204, {'Upload-Offset': str(new_offset)}
+
+@bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_chunked_upload(upload_id):
+    upload = _get_upload(upload_id)
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    result, error = finish_upload(upload, upload_dir)
+    if error:
+        return {"error": error}, 409
+
+    content_hash = result["content_hash"]
+    content = find_content(content_hash)
+    created = False
+    if content is None:
+        if result["s3_key"]:
+            content, created = create_content(content_hash, s3_key=result["s3_key"])
+            if created and result["spool_path"]:
+                ingest.keep_spool(result["spool_path"], result["s3_key"])
+        else:
+            stored = store_content(result["local_path"], upload.filename, content_hash, upload.content_type)
+            content, created = stored
+
+    if not created and result["s3_key"]:
+        # Duplicate upload: the shared content already has the bytes
+        from .utils import delete_from_s3
+        delete_from_s3(os.getenv('AWS_BUCKET_NAME'), result["s3_key"])
+    cleanup_upload(upload, upload_dir)
+
+    audio_only = _audio_only_option((request.get_json(silent=True) or {}).get('audio_only'))
+    video = _register_video(upload.filename, upload.filename, content, created, audio_only=audio_only)
+    return {"video_id": video.id, "url": url_for('main.view_video', video_id=video.id)}
+
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    upload = _get_upload(upload_id)
+    abort_upload(upload, current_app.config['UPLOAD_FOLDER'])
+    return '', 204
+
+@bp.route('/video/<int:video_id>/delete', methods=['POST'])
+@login_required
+def delete_video(video_id):
+    video = Video.query.get_or_404(video_id)
+    if video.author != current_user:
+        return "Unauthorized", 403
+
+    content = video.content
+    Job.query.filter_by(video_id=video.id).delete()
+    if not content:
+        from .rag import delete_index
+        delete_segments(str(video.id))
+        delete_index(video.id)
+    record_deletion(video)
+    db.session.delete(video)
+    db.session.commit()
+
+    # Shared artifacts go away only with their last video
+    if content:
+        release_content(content)
+
+    flash('Video deleted')
+    return redirect(url_for('main.index'))
+
+@bp.route('/video/<int:video_id>')
 @login_required
 def view_video(video_id):
     video = Video.query.get_or_404(video_id)
@@ -234,10 +361,60 @@ def view_video(video_id):
     if not video_url and video.file_path:
         video_url = "/" + video.file_path
         
+    # Only the latest messages are rendered; older ones load on scroll via /video/<id>/chats
+    chats, older_cursor = keyset_page(ChatMessage.query.filter_by(video_id=video.id),
+                                      ChatMessage.timestamp, ChatMessage.id, limit=CHAT_PAGE_SIZE)
+
     print(f"DEBUG: Rendering video page for {video_id} with URL: {video_url}")
-    return render_template('video.html', video=video, video_url=video_url)
+    return render_template('video.html', video=video, video_url=video_url,
+                           chats=list(reversed(chats)), older_cursor=older_cursor)
 
-@app.route('/video/<int:video_id>/qa', methods=['POST'])
+@bp.route('/video/<int:video_id>/chats')
+@login_required
+def get_video_chats(video_id):
+    """Chat history newest first, one page per call; pass next_cursor back as ?before= for older messages."""
+    video = Video.query.get_or_404(video_id)
+    if video.author != current_user:
+        return {"error": "Unauthorized"}, 403
+
+    limit = min(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 100)
+    chats, next_cursor = keyset_page(ChatMessage.query.filter_by(video_id=video.id),
+                                     ChatMessage.timestamp, ChatMessage.id,
+                                     cursor=request.args.get('before'), limit=max(limit, 1))
+    return {
+        "messages": [
+            {"id": c.id, "text": c.text, "sender": c.sender, "timestamp": c.timestamp.isoformat()}
+            for c in chats
+        ],
+        "next_cursor": next_cursor
+    }
+
+@bp.route('/video/<int:video_id>/transcript')
+@login_required
+def get_video_transcript(video_id):
+    """
+    Transcript segments overlapping [start, end) seconds, at most WINDOW_LIMIT of them.
+    next_start continues the window, so the panel renders the transcript incrementally.
+    """
+    video = Video.query.get_or_404(video_id)
+    if video.author != current_user:
+        return {"error": "Unauthorized"}, 403
+
+    index = get_transcript_index(video)
+    if index is None:
+        return {"segments": [], "next_start": None}
+
+    start = request.args.get('start', 0.0, type=float)
+    end = request.args.get('end', type=float)
+    segments = index.window(start, end)
+    next_start = None
+    if segments:
+        following = segments[-1]["position"] + 1
+        if following < len(index) and (end is None or index.start_of(following) < end):
+            next_start = index.start_of(following)
+    return {"segments": segments, "next_start": next_start}
+
+@bp.route('/video/<int:video_id>/qa', methods=['POST'])
 @login_required
 def qa_video(video_id):
     video = Video.query.get_or_404(video_id)
@@ -253,8 +430,9 @@ def qa_video(video_id):
     db.session.add(user_msg)
     db.session.commit()
     
-    from .rag import ask_question
-    answer_data = ask_question(video, question)
+    # Repeated (or reworded) questions about the same lecture are answered from the cache
+    from .answer_cache import cached_ask
+    answer_data = cached_ask(video, question)
     
     # Save AI Message
     if 'text' in answer_data:
@@ -264,29 +442,126 @@ def qa_video(video_id):
     
     return answer_data
 
-@app.route('/video/<int:video_id>/quiz', methods=['GET'])
+@bp.route('/video/<int:video_id>/qa/stream', methods=['POST'])
+@login_required
+def qa_video_stream(video_id):
+    """Like qa_video, but streams the answer as Server-Sent Events while it is generated."""
+    video = Video.query.get_or_404(video_id)
+    if video.author != current_user:
+        return {"error": "Unauthorized"}, 403
+
+    question = request.json.get('question')
+    if not question:
+        return {"error": "No question provided"}, 400
+
+    user_msg = ChatMessage(text=question, sender='user', video=video)
+    db.session.add(user_msg)
+    db.session.commit()
+
+    from .answer_cache import cached_stream
+
+    def events():
+        for event, data in cached_stream(video, question):
+            if event == 'done':
+                # Persist the full answer once the stream is complete
+                db.session.add(ChatMessage(text=data['text'], sender='ai', video=video))
+                db.session.commit()
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/video/<int:video_id>/quiz', methods=['GET'])
 @login_required
 def get_video_quiz(video_id):
     video = Video.query.get_or_404(video_id)
     if video.author != current_user:
         return {"error": "Unauthorized"}, 403
         
-    from .rag import generate_quiz
-    quiz_data = generate_quiz(video)
-    return quiz_data
+    version = request.args.get('version', type=int)
+    after = request.args.get('after', type=int)
+    quiz = get_quiz(video.id, version=version, after=after)
+
+    if quiz is None:
+        if version is not None:
+            return {"error": "Quiz not found"}, 404
+        # Videos processed before quizzes were stored: generated in the background
+        if not queue_quiz(video):
+            return {"error": "The video has not finished processing"}, 409
+        return {"status": "generating"}, 202, {'Retry-After': '3'}
+
+    etag = quiz_etag(quiz)
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': etag}
+
+    response = make_response(quiz_payload(quiz))
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/video/<int:video_id>/quiz/regenerate', methods=['POST'])
+@login_required
+def regenerate_video_quiz(video_id):
+    video = Video.query.get_or_404(video_id)
+    if video.author != current_user:
+        return {"error": "Unauthorized"}, 403
+
+    if video.status != 'completed':
+        return {"error": "The video has not finished processing"}, 409
+    quiz, error = create_quiz(video)
+    if error:
+        # Gemini failed or answered without questions
+        return {"error": error}, 502
+
+    response = make_response(quiz_payload(quiz))
+    response.headers['ETag'] = quiz_etag(quiz)
+    return response
 
-@app.route('/api/videos/status')
+@bp.route('/api/videos/status')
 @login_required
 def get_videos_status():
-    videos = Video.query.filter_by(user_id=current_user.id).all()
+    """
+    Ids and statuses of the user's videos. ?since=<version> returns only the videos
+    changed (or deleted) after that version; an unchanged version is answered with
+    304. With &wait=<seconds> an unchanged request is held until something changes,
+    at most status.LONG_POLL_SECONDS, then answered.
+    """
+    since = request.args.get('since', type=int)
+    wait = min(request.args.get('wait', 0, type=float), status.LONG_POLL_SECONDS)
+    if since is not None and wait > 0:
+        version = wait_for_change(current_user.id, since, timeout=wait)
+    else:
+        version = status_version(current_user.id)
+    etag = f'"status-{current_user.id}-{version}"'
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': etag}
+
+    response = make_response({"version": version, "videos": video_statuses(current_user.id, since)})
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/api/metrics')
+@login_required
+def get_metrics():
+    from .poller import file_poller
+    from .gemini_files import file_cache
+    from .rag import qa_stats, first_token_stats
+    from .answer_cache import answer_cache
+    from .utils import presigned_urls
+    from .ratelimit import gemini_limiter
+    from . import resilience
     return {
-        "videos": [
-            {
-                "id": v.id,
-                "status": v.status
-            } for v in videos
-        ]
+        "jobs": jobs.job_queue.stats(),
+        "gemini_poller": file_poller.stats(),
+        "gemini_file_cache": file_cache.stats(),
+        "qa": dict(qa_stats, first_token_seconds=first_token_stats()),
+        "answer_cache": answer_cache.stats(),
+        "s3_presigned_urls": presigned_urls.stats(),
+        "ingest": ingest.stats(),
+        "gemini_rate_limit": gemini_limiter.stats(),
+        "circuit_breakers": resilience.stats()
     }
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    create_app().run(debug=True, port=5000)
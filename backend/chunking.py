@@ -0,0 +1,131 @@
+import re
+
+# One timestamp: 01:02:03, 1:02, 02:03.5, 00:01:23,456 (SRT), 83.2s, 1h2m3s, 2m 5s
+_TS = r"(?:\d{1,2}:)?\d{1,2}:\d{2}(?:[.,]\d+)?|(?:\d+\s?h\s?)?(?:\d+\s?m(?:in)?\s?)?\d+(?:\.\d+)?\s?s(?:ec)?\b"
+
+_LINE = re.compile(
+    r"^\s*(?:[-*•>]|\d+[.)](?=\s))?\s*(?:#+\s*)?"         # bullets, numbered lists, headings, quotes
+    r"[*_]*(?P<open>[\[(]?)[\[(*_]*\s*(?P<start>" + _TS + r")\s*"  # [00:01:23, (1:23, **00:01
+    r"(?:(?:-->|->|→|–|—|-|to)\s*(?P<end>" + _TS + r")\s*)?"
+    r"[\])*_]*\s*(?P<sep>[:\-–—|]?)\s*(?P<text>.*)$",
+    re.IGNORECASE,
+)
+_SECONDS_ONLY = re.compile(r"\d+(?:\.\d+)?\s?s(?:ec)?", re.IGNORECASE)
+_SRT_INDEX = re.compile(r"^\s*\d+\s*$")
+_MARKUP = re.compile(r"^[\s\-*•>#]+|\*\*|__")
+
+
+def parse_timestamp(value):
+    """Seconds for any of the supported timestamp spellings, or None."""
+    value = value.strip().lower().replace(',', '.')
+    if ':' in value:
+        seconds = 0.0
+        for part in value.split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    match = re.fullmatch(r"(?:(\d+)\s?h\s?)?(?:(\d+)\s?m(?:in)?\s?)?(\d+(?:\.\d+)?)\s?s(?:ec)?", value)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+
+def parse_line(line):
+    """
+    Splits one transcript line into (start, end, text).
+    start/end are None when the line carries no timestamp; text has list and
+    emphasis markup removed.
+    """
+    match = _LINE.match(line)
+    # Bare seconds ("45s") count only when bracketed or followed by a separator or a
+    # range; otherwise they are prose like "2010s were a decade" or "10 s later"
+    if match and not (_SECONDS_ONLY.fullmatch(match.group('start')) is None or match.group('open')
+                      or match.group('end') or match.group('sep')):
+        match = None
+    if match:
+        start = parse_timestamp(match.group('start'))
+        end = parse_timestamp(match.group('end')) if match.group('end') else None
+        return start, end, _MARKUP.sub('', match.group('text')).strip()
+    return None, None, _MARKUP.sub('', line).strip()
+
+
+def _estimate_tokens(text):
+    # Roughly 4 characters per token for English prose
+    return max(1, len(text) // 4)
+
+
+def iter_segments(lines):
+    """
+    Yields (start, end, text) for each line of text, carrying the last seen timestamp
+    forward to untimed lines. A line's end defaults to the next timestamped line's start.
+    """
+    current = 0.0
+    pending = []
+    for raw in lines:
+        if not raw.strip() or _SRT_INDEX.match(raw):
+            continue
+        start, end, text = parse_line(raw)
+        if start is not None:
+            for item in pending:
+                if item[1] is None:
+                    item[1] = start
+                yield tuple(item)
+            pending = []
+            current = start
+        # A timestamp-only line (SRT style, headings) just moves the clock forward
+        if text:
+            pending.append([current, end, text])
+    for item in pending:
+        yield (item[0], item[1] if item[1] is not None else item[0], item[2])
+
+
+def chunk_transcript(transcript, max_tokens=200, overlap_tokens=40):
+    """
+    Streams overlapping chunks of a transcript (a string or any iterable of lines).
+    Lines are merged until max_tokens is reached; the next chunk starts with the last
+    lines of the previous one, up to overlap_tokens, so answers that straddle a
+    boundary are still retrievable. Yields dicts with index, text, start_time, end_time.
+    """
+    lines = transcript.splitlines() if isinstance(transcript, str) else transcript
+    window = []
+    window_tokens = 0
+    index = 0
+
+    def emit():
+        return {
+            "index": index,
+            "text": " ".join(text for _, _, text, _ in window),
+            "start_time": window[0][0],
+            "end_time": max(end for _, end, _, _ in window),
+        }
+
+    for start, end, text in iter_segments(lines):
+        tokens = _estimate_tokens(text)
+        if window and window_tokens + tokens > max_tokens:
+            yield emit()
+            index += 1
+            # Keep a tail of the previous window as overlap
+            tail = []
+            tail_tokens = 0
+            for item in reversed(window):
+                if tail_tokens + item[3] > overlap_tokens:
+                    break
+                tail.insert(0, item)
+                tail_tokens += item[3]
+            window, window_tokens = tail, tail_tokens
+        window.append((start, end, text, tokens))
+        window_tokens += tokens
+
+    if window:
+        yield emit()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,200 @@
+import os
+import re
+import hashlib
+import logging
+from urllib.parse import urlparse, parse_qs
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from . import ingest
+from .models import VideoContent
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+_YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def canonical_youtube_url(url):
+    """
+    Normalises the many shapes of a YouTube link (watch?v=, youtu.be, shorts, embed,
+    extra tracking params) to (canonical_url, content_key).
+    Returns (url, None) if no video id can be found.
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif host in ('youtube.com', 'music.youtube.com', 'youtube-nocookie.com'):
+        if parsed.path == '/watch':
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        else:
+            parts = parsed.path.strip('/').split('/')
+            if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+                video_id = parts[1]
+
+    if not video_id or not _YOUTUBE_ID.match(video_id):
+        return url, None
+    return f"https://www.youtube.com/watch?v={video_id}", f"youtube:{video_id}"
+
+
+def spool_and_hash(stream, dest_path, chunk_size=CHUNK_SIZE):
+    """Copies an incoming stream to dest_path, hashing it on the way. Returns (key, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, 'wb') as out:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return f"sha256:{digest.hexdigest()}", size
+
+
+def hash_stream(stream, chunk_size=CHUNK_SIZE):
+    """Hashes a stream without storing it. Returns (key, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    return f"sha256:{digest.hexdigest()}", size
+
+
+def find_content(content_hash):
+    return VideoContent.query.filter_by(content_hash=content_hash).first()
+
+
+def create_content(content_hash, **fields):
+    """Creates the content record, or returns the one a concurrent upload just created."""
+    content = VideoContent(content_hash=content_hash, ref_count=0, **fields)
+    db.session.add(content)
+    try:
+        db.session.commit()
+        return content, True
+    except IntegrityError:
+        db.session.rollback()
+        return find_content(content_hash), False
+
+
+def store_content(local_path, filename, content_hash, content_type, source_url=None):
+    """
+    Moves a freshly received file into permanent storage (S3 or local) under its
+    content hash and creates the shared content record for it.
+    Returns (content, created), or None if the S3 upload failed.
+    """
+    ext = os.path.splitext(filename)[1] or '.mp4'
+    stored_name = content_hash.split(':', 1)[1] + ext
+
+    # Check if S3 is configured
+    s3_bucket = os.getenv('AWS_BUCKET_NAME')
+
+    if s3_bucket:
+        # Upload to S3
+        from .utils import upload_to_s3
+        s3_key = f"uploads/{stored_name}"
+        with open(local_path, 'rb') as f, ingest.timed('s3_upload', os.path.getsize(local_path)):
+            uploaded = upload_to_s3(f, s3_bucket, s3_key, content_type=content_type)
+        if not uploaded:
+            os.remove(local_path)
+            return None
+        # Keep the local copy for the Gemini upload instead of downloading it back from S3
+        ingest.keep_spool(local_path, s3_key)
+        return create_content(content_hash, s3_key=s3_key, source_url=source_url)
+
+    # Local Storage
+    os.replace(local_path, os.path.join(current_app.config['UPLOAD_FOLDER'], stored_name))
+    return create_content(content_hash, file_path=f"static/uploads/{stored_name}", source_url=source_url)
+
+
+def copy_content(video, content):
+    """Mirrors the shared artifacts onto a video row."""
+    video.s3_key = content.s3_key
+    video.file_path = content.file_path
+    video.gemini_file_uri = content.gemini_file_uri
+    video.gemini_file_name = content.gemini_file_name
+    video.gemini_media = content.gemini_media
+    video.transcript = content.transcript
+    video.status = content.status
+
+
+def attach_video(video, content, created):
+    """
+    Links a new video to its content record and takes a reference on it.
+    Returns True if the video needs its own processing job: the content is new, or an
+    earlier attempt failed. Otherwise it is either done already or in flight, and
+    propagate() will update this video when the running job finishes.
+    """
+    # The new video may already be pending in the session; don't flush it half-filled
+    with db.session.no_autoflush:
+        needs_processing = created or content.status == 'failed'
+        if content.status == 'failed':
+            content.status = 'pending'
+        copy_content(video, content)
+        video.content_id = content.id
+
+    db.session.execute(
+        db.update(VideoContent)
+        .where(VideoContent.id == content.id)
+        .values(ref_count=VideoContent.ref_count + 1)
+    )
+    return needs_processing
+
+
+def propagate(content):
+    """Pushes the content's state to every video that shares it."""
+    for video in content.videos:
+        copy_content(video, content)
+
+
+def release_content(content):
+    """
+    Drops one reference. The last reference removes the stored file, the Gemini
+    copy and the record itself.
+    """
+    db.session.execute(
+        db.update(VideoContent)
+        .where(VideoContent.id == content.id)
+        .values(ref_count=VideoContent.ref_count - 1)
+    )
+    db.session.commit()
+    content_id, content_hash = content.id, content.content_hash
+    s3_key, file_path, gemini_file_name = content.s3_key, content.file_path, content.gemini_file_name
+
+    # Only if still unreferenced: a concurrent attach_video may have taken it back
+    deleted = db.session.execute(
+        db.delete(VideoContent)
+        .where(VideoContent.id == content_id, VideoContent.ref_count <= 0)
+    ).rowcount
+    if deleted:
+        # Committed with the record
+        from .transcripts import delete_segments
+        delete_segments(f"c{content_id}")
+    db.session.commit()
+    if not deleted:
+        return False
+
+    if s3_key:
+        s3_bucket = os.getenv('AWS_BUCKET_NAME')
+        if s3_bucket:
+            from .utils import delete_from_s3
+            delete_from_s3(s3_bucket, s3_key)
+    if file_path:
+        local_path = os.path.join(current_app.root_path, file_path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+    if gemini_file_name:
+        from .gemini_files import delete_gemini_file
+        delete_gemini_file(gemini_file_name)
+
+    from .rag import delete_index
+    delete_index(f"c{content_id}")
+    logger.info(f"Removed unreferenced content {content_hash}")
+    return True
@@ -0,0 +1,190 @@
+import os
+import re
+import threading
+import logging
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Gemini deletes uploaded files 48h after upload. Refresh well before that so a
+# question never lands on an expired handle.
+REFRESH_MARGIN = timedelta(hours=int(os.getenv('GEMINI_REFRESH_MARGIN_HOURS', 2)))
+# Used when a handle carries no expiration_time
+DEFAULT_TTL = timedelta(hours=1)
+
+# Questions explicitly about what is on screen rather than what is said. Everyday
+# words ("see", "show", "graph", "written") are left out: lectures use them all the time
+_VISUAL = re.compile(
+    r"\b(?:on screen|on (?:the|this|that) (?:screen|slides?|(?:white|black)?board|projector)"
+    r"|in (?:the|this|that) (?:diagrams?|figures?|charts?|drawings?|images?|pictures?|slides?|frames?)"
+    r"|(?:diagram|figure|chart|drawing|slide)s? (?:shows?|says?|depicts?)"
+    r"|what (?:does|do|did) .{1,80}? look like)\b",
+    re.IGNORECASE,
+)
+# Sources with nothing to show (e.g. a YouTube audio-only download)
+AUDIO_EXTENSIONS = {'.m4a', '.mp3', '.wav', '.ogg', '.oga', '.opus', '.aac', '.flac'}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_gemini():
+    """Configures the Gemini client once per process. Returns False if no API key is set."""
+    global _configured
+    if _configured:
+        return True
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return False
+    with _configure_lock:
+        if not _configured:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _configured = True
+    return True
+
+
+def delete_gemini_file(name):
+    """Deletes an uploaded file. Failures are only logged: Gemini expires it after 48h anyway."""
+    from . import resilience
+    try:
+        if not configure_gemini():
+            raise RuntimeError("GOOGLE_API_KEY is not set")
+        import google.generativeai as genai
+        resilience.call('gemini', genai.delete_file, name)
+    except Exception as e:
+        logger.warning(f"Could not delete Gemini file {name}: {e}")
+        return False
+    file_cache.invalidate(name)
+    return True
+
+
+def _expiry_of(handle, now):
+    expires = getattr(handle, 'expiration_time', None)
+    if not expires:
+        return now + DEFAULT_TTL
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return expires
+
+
+class FileHandleCache:
+    """
+    Process-wide cache of Gemini file handles keyed by gemini_file_name, with each
+    entry's remote expiry time. A handle is served until REFRESH_MARGIN before it
+    expires; after that get() reports it stale so the caller can schedule a re-upload.
+    """
+
+    def __init__(self, get_file=None, refresh_margin=REFRESH_MARGIN, clock=None):
+        self._get_file = get_file
+        self.refresh_margin = refresh_margin
+        self._clock = clock or (lambda: datetime.now(timezone.utc))
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch(self, name):
+        if self._get_file is None:
+            import google.generativeai as genai
+            from . import resilience
+            return resilience.call('gemini', genai.get_file, name)
+        return self._get_file(name)
+
+    def put(self, handle):
+        with self._lock:
+            self._entries[handle.name] = (handle, _expiry_of(handle, self._clock()))
+
+    def invalidate(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def lookup(self, name):
+        """
+        Returns (handle, fresh). handle is None when the file is gone or unusable;
+        fresh is False when the file is missing or close to expiry and should be re-uploaded.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry:
+            handle, expires = entry
+            if now < expires - self.refresh_margin:
+                self.hits += 1
+                return handle, True
+            if now < expires:
+                self.hits += 1
+                return handle, False
+            self.invalidate(name)
+
+        self.misses += 1
+        try:
+            handle = self._fetch(name)
+        except Exception as e:
+            logger.warning(f"Gemini file {name} unavailable: {e}")
+            return None, False
+
+        if handle.state.name != "ACTIVE":
+            return None, handle.state.name == "PROCESSING"
+        expires = _expiry_of(handle, now)
+        if now >= expires:
+            return None, False
+        self.put(handle)
+        return handle, now < expires - self.refresh_margin
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "hits": self.hits, "misses": self.misses}
+
+
+file_cache = FileHandleCache()
+
+
+def get_video_file(video):
+    """
+    Returns a usable Gemini handle for the video, or None if there is none right now.
+    Missing or soon-to-expire files are re-uploaded in the background from S3 / local
+    storage, so callers should fall back to the transcript instead of failing.
+    """
+    if not video.gemini_file_name:
+        return None
+    handle, fresh = file_cache.lookup(video.gemini_file_name)
+    if not fresh:
+        schedule_refresh(video.id)
+    return handle
+
+
+def schedule_refresh(video_id):
+    from . import jobs
+    if jobs.job_queue is None:
+        return
+    if jobs.job_queue.backend.has_active_job('refresh_gemini_file', video_id):
+        return
+    logger.info(f"Scheduling Gemini re-upload for video {video_id}")
+    jobs.job_queue.enqueue('refresh_gemini_file', video_id)
+
+
+def needs_visuals(question):
+    """True when the question is about what the video shows, not only what is said."""
+    return bool(_VISUAL.search(question or ''))
+
+
+def has_video_stream(video):
+    """False when the video's source is an audio file: visual questions cannot be helped."""
+    return os.path.splitext(video.filename or '')[1].lower() not in AUDIO_EXTENSIONS
+
+
+def request_visuals(video):
+    """
+    Queues the upload of the full video for a video ingested audio-only (a no-op if
+    one is already queued). Until it is ACTIVE, questions use the audio and transcript.
+    """
+    from . import jobs
+    if jobs.job_queue is None or video.gemini_media != 'audio' or not has_video_stream(video):
+        return False
+    if jobs.job_queue.backend.has_active_job('refresh_gemini_file', video.id):
+        return False
+    logger.info(f"Uploading the full video {video.id} to Gemini for a visual question")
+    jobs.job_queue.enqueue('refresh_gemini_file', video.id, payload={'media': 'video'})
+    return True
@@ -0,0 +1,82 @@
+import os
+import time
+import shutil
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Local copies of freshly uploaded files, kept until Gemini has them so process_video
+# does not download from S3 what this machine received seconds ago
+SPOOL_PATH = os.getenv('INGEST_SPOOL_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'ingest_spool'))
+# Spooled files left behind (video deleted, Gemini never reached) are removed after this
+SPOOL_MAX_AGE = int(os.getenv('INGEST_SPOOL_MAX_AGE', 24 * 3600))
+# Send Gemini only the extracted audio track for transcription; the video itself is
+# uploaded later, if ever, when a question needs the visuals. Can be set per upload.
+AUDIO_ONLY = os.getenv('INGEST_AUDIO_ONLY', '0').lower() in ('1', 'true', 'yes')
+
+_lock = threading.Lock()
+# stage -> {"count", "bytes", "seconds"} for this process
+stage_stats = {}
+
+
+def record(stage, size_bytes, seconds):
+    with _lock:
+        stats = stage_stats.setdefault(stage, {"count": 0, "bytes": 0, "seconds": 0.0})
+        stats["count"] += 1
+        stats["bytes"] += size_bytes or 0
+        stats["seconds"] = round(stats["seconds"] + seconds, 3)
+
+
+@contextmanager
+def timed(stage, size_bytes):
+    """Counts one transfer of size_bytes under stage, timing the block."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(stage, size_bytes, time.monotonic() - started)
+
+
+def stats():
+    with _lock:
+        return {stage: dict(values) for stage, values in stage_stats.items()}
+
+
+def spool_path(s3_key):
+    return os.path.join(SPOOL_PATH, os.path.basename(s3_key))
+
+
+def keep_spool(local_path, s3_key):
+    """Moves the local copy of an object just written to S3 into the ingest spool."""
+    try:
+        os.makedirs(SPOOL_PATH, exist_ok=True)
+        shutil.move(local_path, spool_path(s3_key))
+    except OSError as e:
+        logger.warning(f"Could not keep local copy of {s3_key}: {e}")
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+
+def take_spool(s3_key):
+    """Path of the spooled copy of the object, or None (other host, restart, already sent)."""
+    path = spool_path(s3_key)
+    return path if os.path.exists(path) else None
+
+
+def sweep_spool(max_age=SPOOL_MAX_AGE):
+    if not os.path.isdir(SPOOL_PATH):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(SPOOL_PATH):
+        path = os.path.join(SPOOL_PATH, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,557 @@
+import os
+import json
+import uuid
+import threading
+import logging
+import contextvars
+import multiprocessing
+from datetime import datetime, timedelta
+from .locks import host_lock
+
+logger = logging.getLogger(__name__)
+
+# Statuses a job moves through: queued -> running -> done / failed
+ACTIVE_STATUSES = ('queued', 'running')
+# Time budget of one job attempt: every external call it makes shares it
+JOB_DEADLINE = int(os.getenv('JOB_DEADLINE', 30 * 60))
+
+# Job the current worker thread is running
+_current_job = contextvars.ContextVar('current_job', default=None)
+
+
+def will_retry():
+    """True when the running job has attempts left, so raising now means it runs again later."""
+    job = _current_job.get()
+    return job is not None and job.attempts < job.max_attempts
+
+
+class JobRecord:
+    """Plain snapshot of a job, shared by every backend."""
+
+    def __init__(self, id, kind, video_id=None, payload=None, status='queued', attempts=0,
+                 max_attempts=3, enqueued_at=None, available_at=None, started_at=None,
+                 finished_at=None, lease_expires_at=None, worker_id=None, last_error=None):
+        self.id = id
+        self.kind = kind
+        self.video_id = video_id
+        self.payload = payload or {}
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.enqueued_at = enqueued_at
+        self.available_at = available_at
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.lease_expires_at = lease_expires_at
+        self.worker_id = worker_id
+        self.last_error = last_error
+
+
+def _latency_stats(records):
+    """Average / p95 queue wait and run time (seconds) for finished jobs."""
+    waits = sorted((r.started_at - r.enqueued_at).total_seconds() for r in records
+                   if r.started_at and r.enqueued_at)
+    runs = sorted((r.finished_at - r.started_at).total_seconds() for r in records
+                  if r.finished_at and r.started_at)
+
+    def summarise(values):
+        if not values:
+            return {"avg": None, "p95": None}
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        return {"avg": round(sum(values) / len(values), 3), "p95": round(p95, 3)}
+
+    return {"wait_seconds": summarise(waits), "run_seconds": summarise(runs)}
+
+
+class LocalJobBackend:
+    """
+    In-memory stand-in for the job table.
+    Same semantics as DatabaseJobBackend (leases, retries) but nothing survives a restart,
+    so it is only meant for tests and single-process development.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._next_id = 1
+
+    def push(self, kind, video_id=None, payload=None, max_attempts=3):
+        with self._lock:
+            now = datetime.utcnow()
+            job = JobRecord(self._next_id, kind, video_id, payload, max_attempts=max_attempts,
+                            enqueued_at=now, available_at=now)
+            self._jobs[job.id] = job
+            self._next_id += 1
+            return job.id
+
+    def claim(self, worker_id, lease_seconds):
+        with self._lock:
+            now = datetime.utcnow()
+            for job in sorted(self._jobs.values(), key=lambda j: j.id):
+                if job.status == 'queued' and job.available_at <= now:
+                    job.status = 'running'
+                    job.attempts += 1
+                    job.started_at = now
+                    job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+                    job.worker_id = worker_id
+                    return JobRecord(**vars(job))
+            return None
+
+    def extend(self, job_id, worker_id, lease_seconds):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.status == 'running' and job.worker_id == worker_id:
+                job.lease_expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+                return True
+            return False
+
+    def ack(self, job_id, worker_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.worker_id == worker_id:
+                job.status = 'done'
+                job.finished_at = datetime.utcnow()
+                job.lease_expires_at = None
+
+    def nack(self, job_id, worker_id, error, retry_delay):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.worker_id != worker_id:
+                return
+            job.last_error = error
+            job.lease_expires_at = None
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.available_at = datetime.utcnow() + timedelta(seconds=retry_delay)
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+
+    def requeue_expired(self):
+        """Hand jobs whose worker stopped renewing its lease back to the queue."""
+        with self._lock:
+            now = datetime.utcnow()
+            count = 0
+            for job in self._jobs.values():
+                if job.status == 'running' and job.lease_expires_at and job.lease_expires_at < now:
+                    job.status = 'queued'
+                    job.available_at = now
+                    job.worker_id = None
+                    count += 1
+            return count
+
+    def has_active_job(self, kind, video_id):
+        with self._lock:
+            return any(j.kind == kind and j.video_id == video_id and j.status in ACTIVE_STATUSES
+                       for j in self._jobs.values())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return JobRecord(**vars(job)) if job else None
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in ('queued', 'running', 'done', 'failed')}
+        for job in jobs:
+            counts[job.status] += 1
+        queued = [j.enqueued_at for j in jobs if j.status == 'queued']
+        finished = sorted((j for j in jobs if j.finished_at), key=lambda j: j.finished_at)[-200:]
+        oldest = (datetime.utcnow() - min(queued)).total_seconds() if queued else 0.0
+        return {"depth": counts['queued'], "counts": counts,
+                "oldest_queued_seconds": round(oldest, 3), **_latency_stats(finished)}
+
+
+class DatabaseJobBackend:
+    """Persistent job table backend; safe to share between threads and processes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _to_record(self, job):
+        payload = json.loads(job.payload) if job.payload else {}
+        return JobRecord(job.id, job.kind, job.video_id, payload, job.status, job.attempts,
+                         job.max_attempts, job.enqueued_at, job.available_at, job.started_at,
+                         job.finished_at, job.lease_expires_at, job.worker_id, job.last_error)
+
+    def push(self, kind, video_id=None, payload=None, max_attempts=3):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            now = datetime.utcnow()
+            job = Job(kind=kind, video_id=video_id, payload=json.dumps(payload) if payload else None,
+                      max_attempts=max_attempts, enqueued_at=now, available_at=now)
+            db.session.add(job)
+            db.session.commit()
+            return job.id
+
+    def claim(self, worker_id, lease_seconds):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            now = datetime.utcnow()
+            candidates = (db.session.query(Job.id)
+                          .filter(Job.status == 'queued', Job.available_at <= now)
+                          .order_by(Job.id).limit(5).all())
+            for (job_id,) in candidates:
+                # Conditional update: only one worker (thread or process) can win the row
+                result = db.session.execute(
+                    db.update(Job)
+                    .where(Job.id == job_id, Job.status == 'queued')
+                    .values(status='running', attempts=Job.attempts + 1, started_at=now,
+                            lease_expires_at=now + timedelta(seconds=lease_seconds),
+                            worker_id=worker_id)
+                )
+                db.session.commit()
+                if result.rowcount == 1:
+                    return self._to_record(db.session.get(Job, job_id))
+            return None
+
+    def extend(self, job_id, worker_id, lease_seconds):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            result = db.session.execute(
+                db.update(Job)
+                .where(Job.id == job_id, Job.status == 'running', Job.worker_id == worker_id)
+                .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+            )
+            db.session.commit()
+            return result.rowcount == 1
+
+    def ack(self, job_id, worker_id):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            db.session.execute(
+                db.update(Job)
+                .where(Job.id == job_id, Job.worker_id == worker_id)
+                .values(status='done', finished_at=datetime.utcnow(), lease_expires_at=None)
+            )
+            db.session.commit()
+
+    def nack(self, job_id, worker_id, error, retry_delay):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            if not job or job.worker_id != worker_id:
+                return
+            job.last_error = error
+            job.lease_expires_at = None
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.available_at = datetime.utcnow() + timedelta(seconds=retry_delay)
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    def requeue_expired(self):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            now = datetime.utcnow()
+            result = db.session.execute(
+                db.update(Job)
+                .where(Job.status == 'running', Job.lease_expires_at < now)
+                .values(status='queued', available_at=now, worker_id=None)
+            )
+            db.session.commit()
+            return result.rowcount
+
+    def has_active_job(self, kind, video_id):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            return db.session.query(Job.id).filter(
+                Job.kind == kind, Job.video_id == video_id, Job.status.in_(ACTIVE_STATUSES)
+            ).first() is not None
+
+    def get(self, job_id):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            return self._to_record(job) if job else None
+
+    def stats(self):
+        from .extensions import db
+        from .models import Job
+        with self.app.app_context():
+            counts = {status: 0 for status in ('queued', 'running', 'done', 'failed')}
+            for status, count in db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status):
+                counts[status] = count
+            oldest = db.session.query(db.func.min(Job.enqueued_at)).filter(Job.status == 'queued').scalar()
+            finished = (Job.query.filter(Job.finished_at.isnot(None))
+                        .order_by(Job.finished_at.desc()).limit(200).all())
+            records = [self._to_record(j) for j in finished]
+        oldest_age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        return {"depth": counts['queued'], "counts": counts,
+                "oldest_queued_seconds": round(oldest_age, 3), **_latency_stats(records)}
+
+
+class JobQueue:
+    """
+    Bounded worker pool on top of a job backend.
+
+    Delivery is at-least-once: a job is only acked after its handler returns. Workers
+    renew a lease while a job runs; if a worker dies the lease lapses and the job is
+    handed to another worker. Handlers must therefore be safe to run twice.
+    With workers=0 the queue only enqueues; a separate process (backend.worker)
+    runs the jobs.
+    """
+
+    def __init__(self, app, backend, workers=2, mode='thread', lease_seconds=120,
+                 poll_interval=1.0, retry_delay=10):
+        self.app = app
+        self.backend = backend
+        self.workers = max(0, workers)
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.handlers = {}
+        self._started = False
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._running = {}  # job_id -> worker_id, for lease renewal
+        self._threads = []
+
+    def register(self, kind, handler):
+        """Handlers are called as handler(video_id, app_context, **payload)."""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, video_id=None, payload=None, max_attempts=3):
+        job_id = self.backend.push(kind, video_id, payload, max_attempts)
+        logger.info(f"Enqueued job {job_id} ({kind}) for video {video_id}")
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def start(self):
+        with self._lock:
+            if self._started or not self.workers:
+                return
+            self._started = True
+            self._stop.clear()
+
+        if self.mode == 'process':
+            # Child processes share the work through the database backend
+            ctx = multiprocessing.get_context('fork')
+            for i in range(self.workers):
+                proc = ctx.Process(target=self._process_main, args=(i,), daemon=True)
+                proc.start()
+                self._threads.append(proc)
+        else:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, args=(i,),
+                                          name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"Started {self.workers} job workers ({self.mode} mode)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        for worker in self._threads:
+            if isinstance(worker, threading.Thread):
+                worker.join(timeout)
+            else:
+                worker.terminate()
+        self._threads = []
+        self._started = False
+
+    def _process_main(self, index):
+        # Connections inherited across fork must not be reused by the child
+        from .extensions import db
+        with self.app.app_context():
+            db.engine.dispose(close=False)
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat_thread.start()
+        self._worker_loop(index)
+
+    def _worker_loop(self, index):
+        worker_id = f"{os.getpid()}-{index}-{uuid.uuid4().hex[:6]}"
+        while not self._stop.is_set():
+            try:
+                job = self.backend.claim(worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run(job, worker_id)
+
+    def _run(self, job, worker_id):
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            logger.error(f"No handler registered for job kind {job.kind}")
+            self.backend.nack(job.id, worker_id, f"unknown job kind {job.kind}", self.retry_delay)
+            return
+
+        from . import resilience
+        with self._lock:
+            self._running[job.id] = worker_id
+        token = _current_job.set(job)
+        try:
+            logger.info(f"Worker {worker_id} running job {job.id} ({job.kind}), attempt {job.attempts}")
+            with resilience.deadline(JOB_DEADLINE):
+                handler(job.video_id, self.app.app_context(), **job.payload)
+            self.backend.ack(job.id, worker_id)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            self.backend.nack(job.id, worker_id, str(e), self.retry_delay * job.attempts)
+        finally:
+            _current_job.reset(token)
+            with self._lock:
+                self._running.pop(job.id, None)
+
+    def _heartbeat_loop(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            with self._lock:
+                running = list(self._running.items())
+            for job_id, worker_id in running:
+                try:
+                    self.backend.extend(job_id, worker_id, self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f"Lease renewal failed for job {job_id}: {e}")
+            try:
+                if self.backend.requeue_expired():
+                    self._wakeup.set()
+            except Exception as e:
+                logger.warning(f"Requeue of expired jobs failed: {e}")
+
+    def recover(self):
+        """
+        Crash recovery, run once at startup.
+        Jobs left running by a dead worker go back to the queue, and videos stuck in
+        pending/processing without any live job (e.g. from before the job table existed)
+        get a fresh processing job, unless a poller still holds the lease on their Gemini
+        file (processing.WATCH_LEASE). Duplicates of content still in flight wait for the
+        video processing it: one video per content is requeued. A YouTube download
+        without a live job cannot be resumed (its link lives only in the job) and is
+        marked failed.
+        """
+        from .models import Video, VideoContent
+        from .extensions import db
+        from .status import bump_status_version
+
+        # Every web worker runs this at boot; one at a time, so a stale video is
+        # requeued once and not by each worker that sees it before the first commits
+        with host_lock(os.path.join(self.app.instance_path, 'job-recovery.lock')):
+            requeued = self.backend.requeue_expired()
+            with self.app.app_context():
+                now = datetime.utcnow()
+                kinds = ('ingest_youtube', 'process_video', 'transcribe_video')
+                stale = [(v.id, v.file_path or v.s3_key, v.content_id) for v in
+                         Video.query.filter(Video.status.in_(('pending', 'downloading', 'processing')),
+                                            db.or_(Video.gemini_watch_until.is_(None),
+                                                   Video.gemini_watch_until <= now))
+                         .with_entities(Video.id, Video.file_path, Video.s3_key, Video.content_id)]
+
+                in_flight = {}
+
+                def content_in_flight(content_id):
+                    # Some video of this unfinished content is leased or has a live job
+                    if content_id not in in_flight:
+                        status = db.session.get(VideoContent, content_id).status
+                        siblings = Video.query.filter(Video.content_id == content_id).with_entities(
+                            Video.id, Video.gemini_watch_until).all()
+                        in_flight[content_id] = status in ('pending', 'processing') and any(
+                            (until is not None and until > now)
+                            or any(self.backend.has_active_job(kind, sibling) for kind in kinds)
+                            for sibling, until in siblings)
+                    return in_flight[content_id]
+
+                lost = []
+                for video_id, stored, content_id in stale:
+                    if any(self.backend.has_active_job(kind, video_id) for kind in kinds):
+                        continue
+                    if content_id is not None and content_in_flight(content_id):
+                        continue
+                    if not stored:
+                        lost.append(video_id)
+                        continue
+                    logger.info(f"Requeueing stale video {video_id}")
+                    self.backend.push('process_video', video_id)
+                    requeued += 1
+                    if content_id is not None:
+                        in_flight[content_id] = True
+                if lost:
+                    logger.warning(f"Marking interrupted downloads failed: {lost}")
+                    videos = Video.query.filter(Video.id.in_(lost)).all()
+                    for video in videos:
+                        video.status = 'failed'
+                        video.download_progress = None
+                    bump_status_version(videos)
+                    db.session.commit()
+
+        if requeued or self.backend.stats()['depth']:
+            self.start()
+        return requeued
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats.update({"workers": self.workers, "mode": self.mode, "in_flight": len(self._running)})
+        return stats
+
+
+job_queue = None
+
+
+def init_job_queue(app):
+    """Creates the process-wide job queue for the app and runs crash recovery."""
+    global job_queue
+    from .processing import process_video, transcribe_video, refresh_gemini_file
+    from .quizzes import build_quiz_variants
+    from .youtube import ingest_youtube
+    from .uploads import sweep_uploads_job
+
+    app.config.setdefault('JOB_BACKEND', os.getenv('JOB_BACKEND', 'database'))
+    app.config.setdefault('JOB_WORKERS', int(os.getenv('JOB_WORKERS', 2)))
+    app.config.setdefault('JOB_WORKER_MODE', os.getenv('JOB_WORKER_MODE', 'thread'))
+    app.config.setdefault('JOB_LEASE_SECONDS', int(os.getenv('JOB_LEASE_SECONDS', 120)))
+
+    if app.config['JOB_BACKEND'] == 'local':
+        backend = LocalJobBackend()
+        # Worker processes can only share work through the database, and no other
+        # process can run this queue's jobs
+        app.config['JOB_WORKER_MODE'] = 'thread'
+        app.config['JOB_WORKERS'] = max(1, app.config['JOB_WORKERS'])
+    else:
+        backend = DatabaseJobBackend(app)
+
+    job_queue = JobQueue(
+        app,
+        backend,
+        workers=app.config['JOB_WORKERS'],
+        mode=app.config['JOB_WORKER_MODE'],
+        lease_seconds=app.config['JOB_LEASE_SECONDS'],
+    )
+    job_queue.register('ingest_youtube', ingest_youtube)
+    job_queue.register('process_video', process_video)
+    job_queue.register('transcribe_video', transcribe_video)
+    job_queue.register('refresh_gemini_file', refresh_gemini_file)
+    job_queue.register('build_quiz_variants', build_quiz_variants)
+    job_queue.register('sweep_uploads', sweep_uploads_job)
+
+    try:
+        job_queue.recover()
+    except Exception as e:
+        logger.error(f"Job recovery failed: {e}")
+
+    from .ingest import sweep_spool
+    sweep_spool()
+    return job_queue
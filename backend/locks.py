@@ -0,0 +1,19 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def host_lock(path):
+    """Runs the block in one process at a time on this host (flock); no-op without fcntl."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
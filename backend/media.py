@@ -0,0 +1,55 @@
+import os
+import shutil
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE = os.getenv('FFPROBE_BINARY', 'ffprobe')
+# Upper bound for one ffmpeg/ffprobe run
+COMMAND_TIMEOUT = int(os.getenv('FFMPEG_TIMEOUT', 600))
+# Bitrate of the audio track extracted for audio-only ingestion (speech is clear at 32k)
+AUDIO_BITRATE = os.getenv('INGEST_AUDIO_BITRATE', '32k')
+AUDIO_MIME_TYPE = 'audio/ogg'
+
+
+def available():
+    """True when both ffmpeg and ffprobe can be run on this host."""
+    return bool(shutil.which(FFMPEG) and shutil.which(FFPROBE))
+
+
+def _run(args):
+    return subprocess.run(args, capture_output=True, text=True, timeout=COMMAND_TIMEOUT, check=True)
+
+
+def probe_duration(path):
+    """Duration of a media file in seconds, or None if it can't be read."""
+    try:
+        result = _run([FFPROBE, '-v', 'error', '-show_entries', 'format=duration',
+                       '-of', 'default=noprint_wrappers=1:nokey=1', path])
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not probe duration of {path}: {e}")
+        return None
+
+
+def cut_range(path, start, length, output_path):
+    """
+    Copies [start, start + length) of the file into output_path without re-encoding.
+    Cuts land on keyframes, so a range may start slightly early. Raises on failure.
+    """
+    _run([FFMPEG, '-v', 'error', '-y', '-ss', f"{start:.3f}", '-i', path, '-t', f"{length:.3f}",
+          '-map', '0', '-c', 'copy', '-avoid_negative_ts', 'make_zero', output_path])
+    return output_path
+
+
+def extract_audio(path, output_path, bitrate=None):
+    """
+    Writes the file's audio track to output_path as mono Opus, which is all a
+    transcript needs and a small fraction of the video's size. Raises on failure
+    (e.g. a file without an audio track).
+    """
+    _run([FFMPEG, '-v', 'error', '-y', '-i', path, '-vn', '-map', '0:a:0', '-ac', '1',
+          '-c:a', 'libopus', '-b:a', bitrate or AUDIO_BITRATE, output_path])
+    return output_path
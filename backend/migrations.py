@@ -0,0 +1,79 @@
+import re
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from .extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns():
+    """
+    db.create_all() only creates missing tables. Databases created by an older
+    version of the app keep their old tables, so any column added to a model since
+    then is added here with ALTER TABLE. Works on SQLite and Postgres; new columns
+    must be nullable (or have a server default) for this to apply cleanly.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+
+    if added:
+        logger.info(f"Added missing columns: {', '.join(added)}")
+    return added
+
+
+def add_missing_indexes():
+    """
+    Creates model indexes missing from existing tables (create_all only indexes the
+    tables it creates). On Postgres they are built CONCURRENTLY so a large table
+    keeps accepting writes meanwhile.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    postgres = db.engine.dialect.name == 'postgresql'
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=db.engine.dialect))
+            if postgres:
+                ddl = re.sub(r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', ddl)
+                # CONCURRENTLY cannot run inside a transaction
+                with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    conn.execute(text(ddl))
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(text(ddl))
+            added.append(index.name)
+
+    if added:
+        logger.info(f"Added missing indexes: {', '.join(added)}")
+    return added
+
+
+def upgrade_schema():
+    """Brings an existing database up to the current models. Safe to run on every start."""
+    db.create_all()
+    add_missing_columns()
+    add_missing_indexes()
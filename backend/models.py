@@ -7,6 +7,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
+    status_version = db.Column(db.Integer, default=0, server_default='0', nullable=False) # Bumped on any video status change
     videos = db.relationship('Video', backref='author', lazy='dynamic')
 
     def set_password(self, password):
@@ -16,26 +17,62 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Video(db.Model):
+    __table_args__ = (
+        # Library listing: a user's videos newest first (keyset pagination on created_at, id)
+        db.Index('ix_video_user_created', 'user_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
     filename = db.Column(db.String(120), nullable=False)
     file_path = db.Column(db.String(200), nullable=True) # Local path (optional if using S3)
     s3_key = db.Column(db.String(200), nullable=True)    # S3 Key
-    status = db.Column(db.String(20), default='pending') # pending, processing, completed, failed
-    transcript = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), default='pending') # pending, downloading, processing, completed, failed
+    download_progress = db.Column(db.Integer, nullable=True) # Percent, while a YouTube link is downloading
+    transcript = db.deferred(db.Column(db.Text, nullable=True)) # Loaded on first access only
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Gemini Metadata
     gemini_file_uri = db.Column(db.String(200), nullable=True)
     gemini_file_name = db.Column(db.String(100), nullable=True)
+    gemini_media = db.Column(db.String(10), nullable=True) # What the Gemini file holds: audio or video (None: video)
+    gemini_watch_until = db.Column(db.DateTime, nullable=True) # Lease of the poller waiting on gemini_file_name
     
     # Foreign Key
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('video_content.id'), nullable=True, index=True) # Shared artifacts
+    status_version = db.Column(db.Integer, default=0, server_default='0', nullable=False) # Owner's status_version at the last change
     
     # Relationships
     chats = db.relationship('ChatMessage', backref='video', lazy='dynamic', cascade="all, delete-orphan")
+    quizzes = db.relationship('Quiz', backref='video', lazy='dynamic', cascade="all, delete-orphan")
+
+class VideoContent(db.Model):
+    """
+    Artifacts shared by every upload of the same bytes (or the same YouTube video).
+    Video rows mirror these fields; ref_count tracks how many videos point here.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(80), unique=True, nullable=False) # sha256:<hex> or youtube:<id>
+    source_url = db.Column(db.String(300), nullable=True) # Canonical YouTube URL
+    file_path = db.Column(db.String(200), nullable=True)
+    s3_key = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), default='pending') # pending, processing, completed, failed
+    transcript = db.deferred(db.Column(db.Text, nullable=True))
+    gemini_file_uri = db.Column(db.String(200), nullable=True)
+    gemini_file_name = db.Column(db.String(100), nullable=True)
+    gemini_media = db.Column(db.String(10), nullable=True)
+    ref_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    videos = db.relationship('Video', backref='content', lazy='dynamic')
 
 class ChatMessage(db.Model):
+    __table_args__ = (
+        # A video's chat history in order
+        db.Index('ix_chat_message_video_timestamp', 'video_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
     sender = db.Column(db.String(10), nullable=False) # 'user' or 'ai'
@@ -43,3 +80,76 @@ class ChatMessage(db.Model):
     
     # Foreign Key
     video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=True)
+    payload = db.Column(db.Text, nullable=True) # JSON encoded handler kwargs
+    status = db.Column(db.String(20), default='queued', index=True) # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    last_error = db.Column(db.Text, nullable=True)
+    worker_id = db.Column(db.String(64), nullable=True)
+
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow) # Not claimable before this (retry backoff)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True) # Running jobs past this are redelivered
+
+class Quiz(db.Model):
+    """Stored quiz variants for a video; version increases with every generation."""
+    __table_args__ = (db.UniqueConstraint('video_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False) # JSON: {"questions": [...]}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Upload(db.Model):
+    """
+    A resumable chunked upload in progress (see uploads.py). Bytes up to `offset` are
+    stored: as S3 multipart parts under s3_key, or in a local spool file.
+    """
+    id = db.Column(db.String(32), primary_key=True) # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(120), nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    size = db.Column(db.BigInteger, nullable=True) # Declared total, if known
+    offset = db.Column(db.BigInteger, default=0, nullable=False)
+    s3_key = db.Column(db.String(200), nullable=True)
+    s3_upload_id = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), default='uploading') # uploading, completed, aborted
+    writing_until = db.Column(db.DateTime, nullable=True) # Lease of the PATCH writing a chunk
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DeletedVideo(db.Model):
+    """
+    Tombstone of a deleted video, so a status delta (?since=<version>) can tell the
+    client to drop its card. Kept for status.DELETED_RETENTION.
+    """
+    __table_args__ = (db.Index('ix_deleted_video_user_version', 'user_id', 'status_version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status_version = db.Column(db.Integer, nullable=False) # Owner's status_version at the deletion
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TranscriptSegment(db.Model):
+    """
+    One timed line of a transcript, in order. Keyed like the vector index (rag.index_key):
+    videos sharing content share their segments.
+    """
+    __table_args__ = (db.UniqueConstraint('source_key', 'position'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(32), nullable=False, index=True) # "c<content_id>" or "<video_id>"
+    position = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.Float, nullable=False)
+    end_time = db.Column(db.Float, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    generation = db.Column(db.BigInteger, nullable=True) # store_segments run that wrote the row (time_ns)
@@ -0,0 +1,46 @@
+from datetime import datetime
+from .extensions import db
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor string, or None if it is malformed."""
+    try:
+        created_at, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(query, created_column, id_column, cursor=None, limit=24, newest_first=True):
+    """
+    One page of `query` ordered by (created, id), starting after `cursor`.
+    Unlike OFFSET, the database seeks straight to the cursor through the
+    (..., created, id) index, so deep pages cost the same as the first.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, row_id = position
+        if newest_first:
+            query = query.filter(db.or_(created_column < created_at,
+                                        db.and_(created_column == created_at, id_column < row_id)))
+        else:
+            query = query.filter(db.or_(created_column > created_at,
+                                        db.and_(created_column == created_at, id_column > row_id)))
+
+    if newest_first:
+        query = query.order_by(created_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(created_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
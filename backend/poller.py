@@ -0,0 +1,154 @@
+import time
+import heapq
+import threading
+import logging
+import itertools
+
+logger = logging.getLogger(__name__)
+
+MIN_DELAY = 2.0       # seconds before the first state check
+MAX_DELAY = 30.0      # never wait longer than this between checks
+MAX_WAIT = 30 * 60    # give up on a file that is still PROCESSING after this long
+
+
+def next_delay(size_bytes, elapsed):
+    """
+    Seconds until a file should be checked again.
+    Gemini's processing time grows with file size, so large files start with a longer
+    interval, and the interval keeps growing the longer a file has been pending.
+    """
+    size_mb = (size_bytes or 0) / (1024 * 1024)
+    base = min(MAX_DELAY, MIN_DELAY + size_mb / 50)
+    return min(MAX_DELAY, base * (1 + elapsed / 60))
+
+
+class _Watch:
+    def __init__(self, file_name, size_bytes, on_ready, on_failed, on_pending=None):
+        self.file_name = file_name
+        self.size_bytes = size_bytes
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.on_pending = on_pending
+        self.started = None
+        self.checks = 0
+
+
+class GeminiFilePoller:
+    """
+    One scheduler thread that tracks every Gemini file still in PROCESSING state.
+
+    Callers hand a file over with watch() and return immediately; the poller calls
+    on_ready(file) or on_failed(file_name, reason) from its own thread once the state
+    settles, and on_pending(file_name), if given, after every check that finds the file
+    still processing (e.g. to renew a lease). Callbacks should be quick (e.g. enqueue
+    the next job).
+    """
+
+    def __init__(self, get_file=None, max_wait=MAX_WAIT, clock=time.monotonic):
+        self._get_file = get_file
+        self.max_wait = max_wait
+        self._clock = clock
+        self._heap = []
+        self._watching = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.total_checks = 0
+
+    def watch(self, file_name, size_bytes, on_ready, on_failed, on_pending=None):
+        with self._cond:
+            if file_name in self._watching:
+                return
+            entry = _Watch(file_name, size_bytes, on_ready, on_failed, on_pending)
+            entry.started = self._clock()
+            self._watching[file_name] = entry
+            due = entry.started + next_delay(size_bytes, 0)
+            heapq.heappush(self._heap, (due, next(self._counter), file_name))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return list(self._watching)
+
+    def stats(self):
+        with self._cond:
+            return {"pending": len(self._watching), "checks": self.total_checks}
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="gemini-file-poller", daemon=True)
+            self._thread.start()
+
+    def _fetch(self, file_name):
+        if self._get_file is None:
+            import google.generativeai as genai
+            from . import resilience
+            # No retries: a sleep here would hold up every other watch, and a failed
+            # check is simply rescheduled with backoff
+            return resilience.call('gemini', genai.get_file, file_name, retries=0)
+        return self._get_file(file_name)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        wait = self._heap[0][0] - self._clock()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, file_name = heapq.heappop(self._heap)
+                entry = self._watching.get(file_name)
+            if entry is not None:
+                self._check(entry)
+
+    def _check(self, entry):
+        entry.checks += 1
+        self.total_checks += 1
+        elapsed = self._clock() - entry.started
+        try:
+            gemini_file = self._fetch(entry.file_name)
+            state = gemini_file.state.name
+        except Exception as e:
+            logger.warning(f"State check for {entry.file_name} failed: {e}")
+            gemini_file, state = None, "PROCESSING"
+
+        if state == "PROCESSING" and elapsed < self.max_wait:
+            with self._cond:
+                due = self._clock() + next_delay(entry.size_bytes, elapsed)
+                heapq.heappush(self._heap, (due, next(self._counter), entry.file_name))
+            if entry.on_pending is not None:
+                try:
+                    entry.on_pending(entry.file_name)
+                except Exception as e:
+                    logger.error(f"Poller callback for {entry.file_name} failed: {e}")
+            return
+
+        with self._cond:
+            self._watching.pop(entry.file_name, None)
+
+        try:
+            if state == "ACTIVE":
+                logger.info(f"Gemini file {entry.file_name} ready after {elapsed:.0f}s ({entry.checks} checks)")
+                entry.on_ready(gemini_file)
+            else:
+                reason = "timed out" if state == "PROCESSING" else f"state {state}"
+                logger.warning(f"Gemini file {entry.file_name} not usable: {reason}")
+                entry.on_failed(entry.file_name, reason)
+        except Exception as e:
+            logger.error(f"Poller callback for {entry.file_name} failed: {e}")
+
+
+file_poller = GeminiFilePoller()
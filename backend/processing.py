@@ -1,9 +1,13 @@
 import os
 import time
-import google.generativeai as genai
+from datetime import datetime, timedelta
 from flask import current_app
 from .models import Video
 from .extensions import db
+from .dedup import copy_content, propagate
+from .gemini_files import delete_gemini_file, file_cache
+from . import ingest, resilience
+from .status import bump_status_version
 import logging
 from .utils import generate_with_retry # This import was inside the function, moving it up for consistency
 
@@ -11,12 +15,16 @@ from .utils import generate_with_retry # This import was inside the function, mo
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def process_video(video_id, app_context):
+# A video waiting on Gemini has no job: this lease on the row, renewed at every state
+# check, tells crash recovery that some process's poller is still watching its file
+WATCH_LEASE = timedelta(seconds=int(os.getenv('GEMINI_WATCH_LEASE', 600)))
+
+def process_video(video_id, app_context, audio_only=None):
     """
     Background task to process video:
-    1. Upload to Gemini
-    2. Wait for processing
-    3. Generate Transcript
+    1. Upload to Gemini (only the audio track when audio_only, default INGEST_AUDIO_ONLY)
+    2. Hand the file to the shared poller (the job returns here)
+    3. Generate Transcript (transcribe_video, queued once Gemini is done)
     """
     # Use context manager for cleaner handling
     with app_context:
@@ -27,111 +35,422 @@ def process_video(video_id, app_context):
                 print(f"Video {video_id} not found")
                 return
 
-            video.status = "processing"
-            db.session.commit()
+            # Jobs are delivered at least once; a redelivered job must not redo finished work
+            if video.status == "completed":
+                print(f"Video {video_id} already processed, skipping")
+                return
+
+            # Another upload of the same content already finished the work
+            if video.content and video.content.status == "completed":
+                print(f"Video {video_id} reuses processed content {video.content.content_hash}")
+                copy_content(video, video.content)
+                bump_status_version([video])
+                db.session.commit()
+                return
+
+            update_video(video, status="processing")
 
             # Configure Gemini
             api_key = os.getenv("GOOGLE_API_KEY")
             if not api_key:
                 print("GOOGLE_API_KEY not found")
-                video.status = "failed"
-                db.session.commit()
+                update_video(video, status="failed")
                 return
                 
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
 
+            # Resuming after a restart: the file is already in Gemini, just wait for it again
+            if video.gemini_file_name and not video.transcript:
+                print(f"Resuming video {video_id}: waiting on {video.gemini_file_name}")
+                wait_for_gemini_file(video_id, video.gemini_file_name, 0)
+                return
+
             # 1. Upload to Gemini
             print(f"Uploading {video.filename} to Gemini...")
+            release_session(video)
             
-            video_path = None
-            temp_file = False
-            
-            if video.s3_key:
-                # Download from S3
-                s3_bucket = os.getenv('AWS_BUCKET_NAME')
-                if s3_bucket:
-                    from .utils import download_from_s3
-                    import tempfile
-                    
-                    # Create temp file
-                    fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(video.filename)[1])
-                    os.close(fd)
-                    
-                    print(f"Downloading from S3 to {temp_path}...")
-                    if download_from_s3(s3_bucket, video.s3_key, temp_path):
-                        video_path = temp_path
-                        temp_file = True
-                    else:
-                        print("Failed to download from S3")
-                        video.status = "failed"
-                        db.session.commit()
-                        return
-            
+            video_path, temp_file = get_local_copy(video)
             if not video_path:
-                # Fallback to local
-                video_path = os.path.join(current_app.root_path, video.file_path) if video.file_path else None
-            
-            if not video_path or not os.path.exists(video_path):
-                print(f"File not found at {video_path}")
-                video.status = "failed"
-                db.session.commit()
+                _mark_failed(video_id)
                 return
             
+            if audio_only is None:
+                audio_only = ingest.AUDIO_ONLY
             try:
-                upload_file = genai.upload_file(path=video_path, display_name=video.title)
-                video.gemini_file_uri = upload_file.uri
-                video.gemini_file_name = upload_file.name
-                db.session.commit()
+                upload_file, gemini_media, size_bytes = upload_to_gemini(video, video_path, audio_only)
+                transition(video_id, gemini_file_uri=upload_file.uri, gemini_file_name=upload_file.name,
+                           gemini_media=gemini_media)
             except Exception as e:
                 print(f"Gemini upload failed: {e}")
-                video.status = "failed"
-                db.session.commit()
+                if _retry_later(e):
+                    raise
+                _mark_failed(video_id)
                 return
             finally:
-                # Clean up temp file
-                if temp_file and video_path and os.path.exists(video_path):
+                # Clean up temp file, unless transcribe_video reads it again
+                if temp_file and video_path and os.path.exists(video_path) and \
+                        not _keep_local_copy(video, video_path):
                     os.remove(video_path)
 
-            # 2. Wait for Processing
+            # 2. Wait for Processing without holding this worker
             print("Waiting for Gemini processing...")
-            while upload_file.state.name == "PROCESSING":
-                time.sleep(5)
-                upload_file = genai.get_file(upload_file.name)
-                
+            wait_for_gemini_file(video_id, upload_file.name, size_bytes)
+
+        except Exception as e:
+            print(f"Unexpected error in process_video: {e}")
+            if _retry_later(e):
+                raise
+            # Try to update status if possible
+            try:
+                video = Video.query.get(video_id)
+                if video:
+                    update_video(video, status="failed")
+            except:
+                pass
+
+def upload_to_gemini(video, video_path, audio_only):
+    """
+    Uploads the video to Gemini, or just its audio track (extracted with ffmpeg) when
+    audio_only is set and extraction works. Returns (file, media, size_bytes).
+    """
+    import google.generativeai as genai
+    from . import media
+    path, gemini_media, mime_type = video_path, 'video', None
+    if audio_only and media.available():
+        import tempfile
+        fd, audio_path = tempfile.mkstemp(suffix='.ogg')
+        os.close(fd)
+        try:
+            started = time.monotonic()
+            media.extract_audio(video_path, audio_path)
+            ingest.record('audio_extract', os.path.getsize(audio_path), time.monotonic() - started)
+            path, gemini_media, mime_type = audio_path, 'audio', media.AUDIO_MIME_TYPE
+        except Exception as e:
+            print(f"Audio extraction failed, uploading the video instead: {e}")
+            os.remove(audio_path)
+
+    try:
+        size_bytes = os.path.getsize(path)
+        with ingest.timed('gemini_upload', size_bytes):
+            upload_file = resilience.call('gemini', genai.upload_file, path=path, display_name=video.title,
+                                          mime_type=mime_type)
+        return upload_file, gemini_media, size_bytes
+    finally:
+        if path != video_path:
+            os.remove(path)
+
+def get_local_copy(video):
+    """
+    Returns (path, is_temp) for a local copy of the video's source file, downloading
+    it from S3 when needed, or (None, False) if it can't be found.
+    A temp copy is removed by the caller once Gemini has it.
+    """
+    if video.s3_key:
+        # Still spooled from the upload on this machine: no S3 round trip
+        spooled = ingest.take_spool(video.s3_key)
+        if spooled:
+            ingest.record('spool_hit', os.path.getsize(spooled), 0.0)
+            return spooled, True
+
+        # Download from S3 (after a restart, or on another host)
+        s3_bucket = os.getenv('AWS_BUCKET_NAME')
+        if s3_bucket:
+            from .utils import download_from_s3
+            import tempfile
+            
+            # Create temp file
+            fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(video.filename)[1])
+            os.close(fd)
+            
+            print(f"Downloading from S3 to {temp_path}...")
+            started = time.monotonic()
+            if download_from_s3(s3_bucket, video.s3_key, temp_path):
+                ingest.record('s3_download', os.path.getsize(temp_path), time.monotonic() - started)
+                return temp_path, True
+            print("Failed to download from S3")
+            os.remove(temp_path)
+            return None, False
+    
+    # Fallback to local
+    video_path = os.path.join(current_app.root_path, video.file_path) if video.file_path else None
+    if not video_path or not os.path.exists(video_path):
+        print(f"File not found at {video_path}")
+        return None, False
+    return video_path, False
+
+def _keep_local_copy(video, video_path):
+    """
+    Chunked transcription (transcription.CHUNKED) cuts its ranges from the source file
+    in transcribe_video: the copy fetched for the Gemini upload goes back to the ingest
+    spool instead of being downloaded from S3 again. True if it was kept.
+    """
+    from .transcription import CHUNKED
+    if not CHUNKED or not video.s3_key:
+        return False
+    ingest.keep_spool(video_path, video.s3_key)
+    return True
+
+def transcribe_long_video(video):
+    """
+    Transcript of a long video built from time ranges transcribed in parallel, or None
+    when the single-request transcript should be used (see transcription.py).
+    """
+    from .transcription import CHUNKED, transcribe_in_ranges
+    if not CHUNKED:
+        return None
+    video_path, temp_file = get_local_copy(video)
+    if not video_path:
+        return None
+    try:
+        if video.gemini_media == 'audio':
+            return _transcribe_audio_in_ranges(video_path)
+        return transcribe_in_ranges(video_path)
+    finally:
+        if temp_file and os.path.exists(video_path):
+            os.remove(video_path)
+
+def _transcribe_audio_in_ranges(video_path):
+    from . import media
+    from .transcription import transcribe_in_ranges
+    import tempfile
+    if not media.available():
+        return None
+    fd, audio_path = tempfile.mkstemp(suffix='.ogg')
+    os.close(fd)
+    try:
+        try:
+            media.extract_audio(video_path, audio_path)
+        except Exception as e:
+            print(f"Audio extraction failed, transcribing ranges of the video: {e}")
+            return transcribe_in_ranges(video_path)
+        return transcribe_in_ranges(audio_path)
+    finally:
+        os.remove(audio_path)
+
+def update_video(video, **fields):
+    """
+    Records pipeline results on the video and, when its content is shared, on the
+    content record and every other video pointing at it.
+    """
+    for name, value in fields.items():
+        setattr(video, name, value)
+    affected = [video]
+    if video.content:
+        for name, value in fields.items():
+            setattr(video.content, name, value)
+        propagate(video.content)
+        affected = video.content.videos.all()
+    if 'status' in fields:
+        bump_status_version(affected)
+    db.session.commit()
+
+def release_session(video):
+    """
+    Ends the job's database session before a long wait on S3, Gemini or ffmpeg, so no
+    transaction, lock or pooled connection is held meanwhile. The video stays readable
+    as a detached snapshot; state changes after this go through transition().
+    """
+    db.session.refresh(video)
+    db.session.close()
+    return video
+
+def transition(video_id, **fields):
+    """
+    One pipeline step recorded in a short transaction of its own: re-reads the video,
+    applies update_video and commits. Returns the fresh video, or None if it is gone.
+    """
+    video = Video.query.get(video_id)
+    if video:
+        update_video(video, **fields)
+    return video
+
+def _retry_later(e):
+    """
+    True when a failed external call (Gemini degraded, circuit open, timeouts) should
+    be retried by the job queue instead of failing the video, i.e. attempts are left.
+    """
+    from . import jobs
+    return resilience.is_retryable(e) and jobs.will_retry()
+
+def _mark_failed(video_id):
+    transition(video_id, status="failed")
+
+def _lease_watch(video_id):
+    db.session.execute(db.update(Video).where(Video.id == video_id)
+                       .values(gemini_watch_until=datetime.utcnow() + WATCH_LEASE))
+    db.session.commit()
+
+def wait_for_gemini_file(video_id, file_name, size_bytes, on_ready=None, on_failed=None):
+    """
+    Registers the Gemini file with the shared poller. Once it is ACTIVE the transcript
+    stage is queued as its own job (unless another on_ready is given), so no thread is
+    parked while Gemini works; if it fails the video is marked failed (unless another
+    on_failed is given). The video's watch lease is held meanwhile (WATCH_LEASE).
+    """
+    from . import jobs
+    from .poller import file_poller
+
+    app = current_app._get_current_object()
+
+    if on_ready is None:
+        def on_ready(gemini_file):
+            # After a lapsed lease another process may be watching the same file
+            if not jobs.job_queue.backend.has_active_job('transcribe_video', video_id):
+                jobs.job_queue.enqueue('transcribe_video', video_id)
+
+    if on_failed is None:
+        def on_failed(name, reason):
+            print(f"Gemini processing failed for video {video_id}: {reason}")
+            with app.app_context():
+                _mark_failed(video_id)
+
+    def on_pending(name):
+        with app.app_context():
+            _lease_watch(video_id)
+
+    _lease_watch(video_id)
+    file_poller.watch(file_name, size_bytes, on_ready, on_failed, on_pending)
+
+def transcribe_video(video_id, app_context):
+    """
+    Background task, stage 2: generate the transcript once the Gemini file is ACTIVE.
+    """
+    with app_context:
+        try:
+            video = Video.query.get(video_id)
+            if not video or video.status == "completed":
+                return
+
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key or not video.gemini_file_name:
+                print(f"Cannot transcribe video {video_id}: missing API key or Gemini file")
+                _mark_failed(video_id)
+                return
+
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            release_session(video)
+            upload_file = resilience.call('gemini', genai.get_file, video.gemini_file_name)
+            file_cache.put(upload_file)
+
+            if upload_file.state.name == "PROCESSING":
+                # Redelivered before Gemini finished; go back to waiting
+                wait_for_gemini_file(video_id, upload_file.name, 0)
+                return
+
             if upload_file.state.name == "FAILED":
                 print("Gemini processing failed")
-                video.status = "failed"
-                db.session.commit()
+                _mark_failed(video_id)
                 return
 
             # 3. Generate Transcript (Summary)
             print("Generating transcript/summary...")
             model = genai.GenerativeModel('gemini-2.0-flash')
-            
+
             try:
-                response = generate_with_retry(
-                    model, 
-                    [upload_file, "Generate a detailed transcript of this video with timestamps."],
-                    retries=5,
-                    initial_delay=5
-                )
-                video.transcript = response.text
-                video.status = "completed"
-                db.session.commit()
+                transcript = transcribe_long_video(video)
+                if transcript is None:
+                    response = generate_with_retry(
+                        model,
+                        [upload_file, "Generate a detailed transcript of this video with timestamps."],
+                        retries=5,
+                        initial_delay=5
+                    )
+                    transcript = response.text
+                video = transition(video_id, transcript=transcript, status="completed")
+                if video is None:
+                    return
                 print(f"Video {video_id} processing completed.")
-                
+
+                # Index segments so questions can be answered from the relevant parts only
+                from .rag import index_transcript, index_key
+                from .transcripts import store_segments
+                store_segments(index_key(video), transcript)
+                index_transcript(index_key(video), transcript)
+                from .answer_cache import answer_cache
+                answer_cache.invalidate(index_key(video))
+
+                # First quiz right away, further variants in the background
+                from . import jobs
+                from .quizzes import create_quiz
+                quiz, error = create_quiz(video)
+                if error:
+                    print(f"Quiz generation failed: {error}")
+                jobs.job_queue.enqueue('build_quiz_variants', video_id)
+
             except Exception as e:
                 print(f"Transcript generation failed: {e}")
-                video.status = "failed"
-                db.session.commit()
+                if _retry_later(e):
+                    raise
+                _mark_failed(video_id)
 
         except Exception as e:
-            print(f"Unexpected error in process_video: {e}")
-            # Try to update status if possible
+            print(f"Unexpected error in transcribe_video: {e}")
+            if _retry_later(e):
+                raise
             try:
-                video = Video.query.get(video_id)
-                if video:
-                    video.status = "failed"
-                    db.session.commit()
+                _mark_failed(video_id)
             except:
                 pass
+
+def refresh_gemini_file(video_id, app_context, media=None):
+    """
+    Background task: re-upload a video whose Gemini file expired (or is about to).
+    The new file name is only persisted once Gemini reports it ACTIVE, so questions
+    keep using the old handle (or the transcript) until then.
+    media='video' replaces an audio-only file with the full video (see
+    gemini_files.request_visuals); by default the file is re-uploaded as it was.
+    """
+    with app_context:
+        video = Video.query.get(video_id)
+        if not video:
+            return
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            print("GOOGLE_API_KEY not found")
+            return
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        release_session(video)
+
+        video_path, temp_file = get_local_copy(video)
+        if not video_path:
+            print(f"Cannot refresh Gemini file for video {video_id}: source missing")
+            return
+
+        audio_only = (media or video.gemini_media) == 'audio'
+        try:
+            print(f"Re-uploading {video.filename} to Gemini...")
+            upload_file, gemini_media, size_bytes = upload_to_gemini(video, video_path, audio_only)
+        finally:
+            if temp_file and os.path.exists(video_path):
+                os.remove(video_path)
+
+        app = current_app._get_current_object()
+
+        def on_ready(gemini_file):
+            with app.app_context():
+                refreshed = Video.query.get(video_id)
+                if refreshed:
+                    if refreshed.gemini_file_name:
+                        file_cache.invalidate(refreshed.gemini_file_name)
+                    upgraded = refreshed.gemini_media != gemini_media
+                    update_video(refreshed, gemini_file_uri=gemini_file.uri, gemini_file_name=gemini_file.name,
+                                 gemini_media=gemini_media)
+                    if upgraded:
+                        # Answers given without the visuals should not be served again
+                        from .rag import index_key
+                        from .answer_cache import answer_cache
+                        answer_cache.invalidate(index_key(refreshed))
+            file_cache.put(gemini_file)
+            print(f"Gemini file for video {video_id} refreshed: {gemini_file.name}")
+
+        def on_failed(name, reason):
+            # The video is finished: it keeps its old handle and status, the next
+            # question past the expiry (or needing visuals) asks for a refresh again
+            print(f"Gemini refresh failed for video {video_id}: {reason}")
+            delete_gemini_file(name)
+
+        wait_for_gemini_file(video_id, upload_file.name, size_bytes, on_ready=on_ready, on_failed=on_failed)
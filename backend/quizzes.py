@@ -0,0 +1,87 @@
+import os
+import json
+import logging
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import Video, Quiz
+
+logger = logging.getLogger(__name__)
+
+# Quiz variants kept per video (the first is generated inline, the rest in the background)
+QUIZ_VARIANTS = int(os.getenv('QUIZ_VARIANTS', 3))
+
+
+def quiz_etag(quiz):
+    return f'"quiz-{quiz.video_id}-{quiz.version}"'
+
+
+def quiz_payload(quiz):
+    data = json.loads(quiz.data)
+    data["version"] = quiz.version
+    return data
+
+
+def get_quiz(video_id, version=None, after=None):
+    """
+    A stored quiz: a specific version, the one following `after` (wrapping around,
+    so students can cycle through variants), or the newest one.
+    """
+    query = Quiz.query.filter_by(video_id=video_id)
+    if version is not None:
+        return query.filter_by(version=version).first()
+    if after is not None:
+        following = query.filter(Quiz.version > after).order_by(Quiz.version.asc()).first()
+        return following or query.order_by(Quiz.version.asc()).first()
+    return query.order_by(Quiz.version.desc()).first()
+
+
+def create_quiz(video):
+    """Generates a new quiz variant with Gemini and stores it. Returns (quiz, error)."""
+    from .rag import generate_quiz
+
+    previous = [q for quiz in Quiz.query.filter_by(video_id=video.id)
+                for q in (item.get("question") for item in json.loads(quiz.data).get("questions", [])) if q]
+    data = generate_quiz(video, avoid_questions=previous)
+    if "error" in data:
+        return None, data["error"]
+    if not data.get("questions"):
+        return None, "Quiz generation returned no questions"
+
+    for _ in range(3):
+        latest = db.session.query(db.func.max(Quiz.version)).filter_by(video_id=video.id).scalar() or 0
+        quiz = Quiz(video_id=video.id, version=latest + 1, data=json.dumps(data))
+        db.session.add(quiz)
+        try:
+            db.session.commit()
+            return quiz, None
+        except IntegrityError:
+            # A concurrent generation took this version number
+            db.session.rollback()
+    return None, "Could not store quiz"
+
+
+def queue_quiz(video):
+    """
+    Queues quiz generation for a completed video with no stored quiz (processed before
+    quizzes were stored), unless it is already queued. False if no quiz can be made yet.
+    """
+    from . import jobs
+    if video.status != "completed" or jobs.job_queue is None:
+        return False
+    if not jobs.job_queue.backend.has_active_job('build_quiz_variants', video.id):
+        jobs.job_queue.enqueue('build_quiz_variants', video.id)
+    return True
+
+
+def build_quiz_variants(video_id, app_context, variants=QUIZ_VARIANTS):
+    """Background task: top the video up to `variants` stored quizzes."""
+    with app_context:
+        video = Video.query.get(video_id)
+        if not video or video.status != "completed":
+            return
+        while video.quizzes.count() < variants:
+            quiz, error = create_quiz(video)
+            if error:
+                # Let the job queue retry later
+                raise RuntimeError(f"Quiz variant for video {video_id} failed: {error}")
+            logger.info(f"Stored quiz v{quiz.version} for video {video_id}")
@@ -1,145 +1,278 @@
 import os
-# import chromadb
-import google.generativeai as genai
-# from chromadb.utils import embedding_functions
+import time
 import logging
-from .database import collection
+from .database import get_collection
+from .gemini_files import configure_gemini, get_video_file, has_video_stream, needs_visuals, request_visuals
+from .chunking import chunk_transcript, batched
+from .transcripts import resolve_timestamps
+from .resilience import Deadline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ChromaDB
-# chroma_client = chromadb.PersistentClient(path="./chroma_db")
-# collection = chroma_client.get_or_create_collection(name="video_knowledge")
+# Number of transcript segments sent with each question
+TOP_K = int(os.getenv("RAG_TOP_K", 6))
 
-# Configure Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    
-    # Debug: List available models
-    try:
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                logger.info(f"Available model: {m.name}")
-    except Exception as e:
-        logger.error(f"Failed to list models: {e}")
+# Time budget of one question, retries included
+QA_DEADLINE = int(os.getenv("QA_DEADLINE", 60))
 
-    # Try to find a valid model
-    # Based on available models from logs: gemini-2.0-flash
-    model = genai.GenerativeModel('gemini-2.0-flash')
-else:
-    logger.warning("GOOGLE_API_KEY not found. RAG will use mock responses.")
-    model = None
+# Chunking of transcripts for the index
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", 200))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", 40))
+INDEX_BATCH_SIZE = 128
 
-def index_transcript(video_id, transcript):
-    """Indexes the transcript into ChromaDB."""
-    try:
-        # Split transcript into chunks (naive splitting by line for now)
-        lines = transcript.strip().split('\n')
-        documents = []
-        metadatas = []
-        ids = []
-
-        for i, line in enumerate(lines):
-            if not line.strip():
-                continue
-            
-            # Parse timestamp and text
-            # Format: [123.45s -> 140.70s] Text content
-            try:
-                timestamp_part, text = line.split('] ', 1)
-                start_str = timestamp_part.strip('[')
-                start_time = float(start_str.split('s ->')[0])
-            except ValueError:
-                continue
+# Added to visual questions about a video whose Gemini file is still audio-only
+VISUALS_PENDING_NOTE = ("Only the lecture audio is available right now. If the question depends on "
+                        "what is shown on screen, say that the video is still being prepared.")
 
-            documents.append(text)
-            metadatas.append({"video_id": str(video_id), "start_time": start_time})
-            ids.append(f"{video_id}_{i}")
+# How questions were answered: from retrieved segments or from the whole video
+qa_stats = {"retrieval": 0, "full_video": 0, "visual": 0}
+# Seconds from a streamed question to its first answer token (most recent 500)
+first_token_seconds = []
 
-        if documents:
+def index_transcript(video_id, transcript, batch_size=INDEX_BATCH_SIZE):
+    """
+    Indexes the transcript into the vector collection as overlapping, timestamped
+    chunks (see chunking.py), written in batches. Any previous index for the same
+    key is replaced.
+    """
+    try:
+        key = str(video_id)
+        collection = get_collection()
+        try:
+            collection.delete(where={"video_id": key})
+        except Exception as e:
+            logger.warning(f"Could not clear old index for video {video_id}: {e}")
+
+        count = 0
+        chunks = chunk_transcript(transcript, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+        for batch in batched(chunks, batch_size):
             collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+                documents=[chunk["text"] for chunk in batch],
+                metadatas=[{"video_id": key, "start_time": chunk["start_time"],
+                            "end_time": chunk["end_time"]} for chunk in batch],
+                ids=[f"{key}_{chunk['index']}" for chunk in batch]
             )
-            logger.info(f"Indexed {len(documents)} segments for video {video_id}")
+            count += len(batch)
+
+        if count:
+            logger.info(f"Indexed {count} chunks for video {video_id}")
             return True
+        return False
     except Exception as e:
         logger.error(f"Indexing failed for video {video_id}: {e}")
         return False
 
-def ask_question(video, question):
+def delete_index(key):
+    """Drops every segment indexed under the key (a video id or shared content key)."""
+    try:
+        get_collection().delete(where={"video_id": str(key)})
+    except Exception as e:
+        logger.warning(f"Could not delete index {key}: {e}")
+
+def index_key(video):
     """
-    Asks a question about the video using Gemini Multimodal.
+    Key the transcript segments are stored under. Videos sharing content (see
+    dedup.py) share one index, so a duplicate upload is searchable immediately.
     """
+    return f"c{video.content_id}" if video.content_id else str(video.id)
+
+def format_time(seconds):
+    seconds = int(seconds or 0)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+# Keys indexed lazily by this process (videos processed before indexing existed)
+_backfilled = set()
+
+def retrieve_segments(video, question, top_k=TOP_K):
+    """Top-k transcript segments for the question, restricted to this video."""
+    key = index_key(video)
+    try:
+        results = get_collection().query(query_texts=[question], n_results=top_k, where={"video_id": key})
+    except Exception as e:
+        logger.error(f"Retrieval failed for video {video.id}: {e}")
+        return []
+
+    documents = (results.get('documents') or [[]])[0]
+    metadatas = (results.get('metadatas') or [[]])[0]
+    hits = [{"text": doc, "start_time": float(meta.get('start_time', 0.0)),
+             "end_time": meta.get('end_time')}
+            for doc, meta in zip(documents, metadatas) if doc]
+
+    if not hits and video.transcript and key not in _backfilled:
+        _backfilled.add(key)
+        if index_transcript(key, video.transcript):
+            return retrieve_segments(video, question, top_k)
+    return hits
+
+def build_prompt(hits, question):
+    """Compact prompt made of the retrieved segments in playback order."""
+    lines = []
+    for hit in sorted(hits, key=lambda h: h["start_time"]):
+        span = format_time(hit["start_time"])
+        if hit.get("end_time") is not None:
+            span += f" - {format_time(hit['end_time'])}"
+        lines.append(f"[{span}] {hit['text']}")
+    excerpts = "\n".join(lines)
+    return (
+        "You are a tutor answering a student's question about a lecture video.\n"
+        "Answer using the transcript excerpts below and mention the timestamps you rely on.\n"
+        "If they do not contain the answer, say so briefly.\n\n"
+        f"Transcript excerpts:\n{excerpts}\n\n"
+        f"Question: {question}"
+    )
+
+def prepare_question(video, question):
+    """
+    Builds the Gemini request for a question: sends only the transcript segments
+    relevant to it; the full video (plus transcript) is used only when nothing
+    relevant is indexed. Questions about what is on screen also get the video file;
+    for an audio-only video its upload is queued instead (see request_visuals).
+    Returns (content_parts, timestamps) or an error dict.
+    """
+    # Check if we have anything to answer from
+    if not video.gemini_file_name and not video.transcript:
+         return {"error": "Video not processed by Gemini yet."}
+
+    # Audio-only videos get their visuals uploaded the first time a question needs them;
+    # audio sources have none to upload
+    visual = needs_visuals(question) and has_video_stream(video)
+    visuals_pending = visual and video.gemini_media == 'audio'
+    if visual:
+        qa_stats["visual"] += 1
+    if visuals_pending:
+        request_visuals(video)
+
+    hits = retrieve_segments(video, question)
+    if hits:
+        qa_stats["retrieval"] += 1
+        content_parts = [build_prompt(hits, question)]
+        # The excerpts only carry what is said; show the model the video as well
+        video_file = get_video_file(video) if visual and not visuals_pending else None
+        if video_file:
+            content_parts.insert(0, video_file)
+        if visuals_pending:
+            content_parts.append(VISUALS_PENDING_NOTE)
+        return content_parts, sorted({hit["start_time"] for hit in hits[:3]})
+
+    qa_stats["full_video"] += 1
+    # Cached handle; an expired file is re-uploaded in the background and the
+    # answer falls back to the transcript meanwhile
+    video_file = get_video_file(video)
+    if not video_file and not video.transcript:
+         return {"error": "Video is still being prepared in Gemini, try again shortly."}
+
+    # Construct the prompt
+    content_parts = [video_file] if video_file else []
+    if visuals_pending:
+        content_parts.append(VISUALS_PENDING_NOTE)
+    if video.transcript:
+         content_parts.append(f"Transcript: {video.transcript}")
+    content_parts.append(f"Question: {question}")
+    return content_parts, []
+
+def ask_question(video, question):
+    """Asks a question about the video and waits for the whole answer."""
     try:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        if not configure_gemini():
             return {"error": "API Key missing"}
-            
-        genai.configure(api_key=api_key)
-        
-        # Check if we have the Gemini file name
-        if not video.gemini_file_name:
-             return {"error": "Video not processed by Gemini yet."}
 
-        # Get the file reference
-        try:
-            video_file = genai.get_file(video.gemini_file_name)
-        except Exception as e:
-             logger.error(f"Could not retrieve file from Gemini: {e}")
-             return {"error": "Video file expired or not found in Gemini."}
+        prepared = prepare_question(video, question)
+        if isinstance(prepared, dict):
+            return prepared
+        content_parts, timestamps = prepared
 
+        import google.generativeai as genai
         model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Construct the prompt
-        content_parts = [video_file]
-        if video.transcript:
-             content_parts.append(f"Transcript: {video.transcript}")
-        content_parts.append(f"Question: {question}")
-
         from .utils import generate_with_retry
         # Higher retries for Q&A as it's user facing
-        response = generate_with_retry(model, content_parts, retries=3, initial_delay=2)
-        
-        answer_text = response.text
-        timestamps = [] # We'd need to parse them from the answer
+        response = generate_with_retry(model, content_parts, retries=3, initial_delay=2, lane='interactive',
+                                       deadline=Deadline(QA_DEADLINE))
         
         return {
-            "text": answer_text,
-            "timestamps": timestamps
+            "text": response.text,
+            "timestamps": resolve_timestamps(video, timestamps, response.text)
         }
 
     except Exception as e:
         logger.error(f"Q&A failed: {e}")
         return {"error": str(e)}
 
-def generate_quiz(video):
+def _record_first_token(seconds, keep=500):
+    first_token_seconds.append(seconds)
+    del first_token_seconds[:-keep]
+
+def first_token_stats():
+    values = sorted(first_token_seconds)
+    if not values:
+        return {"count": 0, "p50": None, "p95": None}
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return {"count": len(values), "p50": round(values[len(values) // 2], 3), "p95": round(p95, 3)}
+
+def stream_answer(video, question):
+    """
+    Streaming variant of ask_question. Yields (event, data) pairs:
+    ("meta", {"timestamps"}) before generation, ("token", {"text"}) per chunk,
+    ("restart", {}) when a rate-limited stream starts over, then either
+    ("done", {"text", "timestamps"}) with the full answer or ("error", {"error"}).
+    """
+    started = time.monotonic()
+    try:
+        if not configure_gemini():
+            yield "error", {"error": "API Key missing"}
+            return
+
+        prepared = prepare_question(video, question)
+        if isinstance(prepared, dict):
+            yield "error", prepared
+            return
+        content_parts, timestamps = prepared
+        yield "meta", {"timestamps": timestamps}
+
+        import google.generativeai as genai
+        model = genai.GenerativeModel('gemini-2.0-flash')
+        from .utils import stream_with_retry, STREAM_RESTART
+        parts = []
+        for chunk in stream_with_retry(model, content_parts, retries=3, initial_delay=2, lane='interactive',
+                                       deadline=Deadline(QA_DEADLINE)):
+            if chunk is STREAM_RESTART:
+                parts = []
+                yield "restart", {}
+                continue
+            if not parts:
+                _record_first_token(time.monotonic() - started)
+            parts.append(chunk)
+            yield "token", {"text": chunk}
+
+        text = "".join(parts)
+        yield "done", {"text": text, "timestamps": resolve_timestamps(video, timestamps, text)}
+
+    except Exception as e:
+        logger.error(f"Streaming Q&A failed: {e}")
+        yield "error", {"error": str(e)}
+
+def generate_quiz(video, avoid_questions=None):
     """
     Generates a 5-question quiz based on the video content.
     Returns a JSON object with questions and answers.
+    avoid_questions lists questions from earlier variants that should not be repeated.
     """
     try:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        if not configure_gemini():
             return {"error": "API Key missing"}
-            
-        genai.configure(api_key=api_key)
         
         # Check if we have the Gemini file name
         if not video.gemini_file_name:
              return {"error": "Video not processed by Gemini yet."}
 
-        # Get the file reference
-        try:
-            video_file = genai.get_file(video.gemini_file_name)
-        except Exception as e:
-             logger.error(f"Could not retrieve file from Gemini: {e}")
-             return {"error": "Video file expired or not found in Gemini."}
+        video_file = get_video_file(video)
+        if not video_file and not video.transcript:
+             return {"error": "Video is still being prepared in Gemini, try again shortly."}
 
+        import google.generativeai as genai
         model = genai.GenerativeModel('gemini-2.0-flash', generation_config={"response_mime_type": "application/json"})
         
         prompt = """
@@ -157,7 +290,11 @@ def generate_quiz(video):
         }
         """
         
-        content_parts = [video_file, prompt]
+        if avoid_questions:
+            prompt += "\nAsk about different points than these earlier questions:\n"
+            prompt += "\n".join(f"- {q}" for q in avoid_questions)
+
+        content_parts = [video_file, prompt] if video_file else [prompt]
         if video.transcript:
              content_parts.append(f"Transcript context: {video.transcript}")
 
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Gemini quota shared by everything that calls generate_content (0 disables a limit)
+RPM = int(os.getenv('GEMINI_RPM', 2000))
+TPM = int(os.getenv('GEMINI_TPM', 4_000_000))
+# Batch work leaves this fraction of each bucket to interactive callers, which is
+# what keeps questions fast when several processes share one budget
+BATCH_RESERVE = float(os.getenv('GEMINI_BATCH_RESERVE', 0.2))
+# Shared state file: every process on the host (web workers, `python -m backend.worker`)
+# draws from one budget. "none" keeps a separate budget per process
+SHARED_STATE_PATH = os.getenv('GEMINI_RATE_LIMIT_FILE') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'gemini-rate-limit.json')
+if SHARED_STATE_PATH.lower() == 'none':
+    SHARED_STATE_PATH = ''
+# Tokens assumed for an uploaded file (video or audio) until the response reports usage
+FILE_TOKENS = int(os.getenv('GEMINI_FILE_TOKEN_ESTIMATE', 30000))
+
+# Served in this order: an interactive caller goes ahead of every waiting batch caller
+LANES = ('interactive', 'batch')
+
+
+def estimate_tokens(content):
+    """Rough input size of a generate_content request, settled later from usage_metadata."""
+    parts = content if isinstance(content, (list, tuple)) else [content]
+    total = 0
+    for part in parts:
+        if isinstance(part, str):
+            total += len(part) // 4 + 1
+        elif part is not None:
+            total += FILE_TOKENS
+    return total
+
+
+def _shortfall(capacity, levels, needs, reserve):
+    """Seconds until both buckets hold `needs` above `reserve` of their capacity (0: now)."""
+    wait = 0.0
+    for cap, level, need in zip(capacity, levels, needs):
+        if not cap or not need:
+            continue
+        # A request larger than the whole bucket only waits for a full one
+        target = min(cap, need + reserve * cap)
+        if level < target:
+            wait = max(wait, (target - level) * 60.0 / cap)
+    return wait
+
+
+class Buckets:
+    """
+    Request and token buckets for one process, refilled continuously at rpm/tpm.
+    The token level goes negative when a response used more than was estimated.
+    """
+
+    def __init__(self, rpm, tpm, clock=time.time):
+        self.capacity = (float(rpm), float(tpm))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+
+    def _initial_state(self):
+        return {"levels": list(self.capacity), "updated": self._clock(), "paused_until": 0.0}
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            yield self._state
+
+    def _update(self, change):
+        """Refills the buckets and applies change(state, now) atomically; returns its result."""
+        with self._transaction() as state:
+            now = self._clock()
+            elapsed = max(0.0, now - state["updated"])
+            state["levels"] = [min(cap, level + cap * elapsed / 60.0)
+                               for cap, level in zip(self.capacity, state["levels"])]
+            state["updated"] = now
+            return change(state, now)
+
+    def try_take(self, tokens, reserve=0.0, honor_pause=True):
+        """Takes one request and `tokens` if available. Returns 0, or the seconds to wait."""
+        def take(state, now):
+            if honor_pause and state["paused_until"] > now:
+                return state["paused_until"] - now
+            wait = _shortfall(self.capacity, state["levels"], (1, tokens), reserve)
+            if wait == 0:
+                state["levels"] = [state["levels"][0] - 1, state["levels"][1] - tokens]
+            return wait
+        return self._update(take)
+
+    def adjust(self, tokens):
+        """Charges (or refunds, when negative) tokens once a response reports its usage."""
+        def charge(state, now):
+            state["levels"][1] = min(self.capacity[1], state["levels"][1] - tokens)
+        self._update(charge)
+
+    def pause(self, seconds):
+        """Holds every caller back after a 429: the quota is spent whatever the buckets say."""
+        def hold(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+        self._update(hold)
+
+    def snapshot(self):
+        def read(state, now):
+            return {"requests": round(state["levels"][0], 1), "tokens": round(state["levels"][1]),
+                    "paused_for": round(max(0.0, state["paused_until"] - now), 2)}
+        return self._update(read)
+
+
+class SharedBuckets(Buckets):
+    """
+    Buckets kept in a small JSON file under flock, so every process on the host
+    (gunicorn workers, job worker processes) spends the same budget.
+    """
+
+    def __init__(self, path, rpm, tpm, clock=time.time):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._file = None
+        self._file_pid = None
+        super().__init__(rpm, tpm, clock)
+
+    @contextmanager
+    def _transaction(self):
+        # The thread lock orders this process's callers, flock the other processes
+        with self._lock:
+            if self._file_pid != os.getpid():
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a+')
+                self._file_pid = os.getpid()
+            self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+            try:
+                self._file.seek(0)
+                try:
+                    state = json.loads(self._file.read() or 'null')
+                except ValueError:
+                    state = None
+                if not isinstance(state, dict) or len(state.get("levels") or []) != 2:
+                    state = self._initial_state()
+                yield state
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.write(json.dumps(state))
+                self._file.flush()
+            finally:
+                self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+
+
+def make_buckets(rpm=RPM, tpm=TPM, path=SHARED_STATE_PATH):
+    if path:
+        try:
+            return SharedBuckets(path, rpm, tpm)
+        except ImportError:
+            logger.warning("fcntl unavailable, Gemini rate limit is per process")
+    return Buckets(rpm, tpm)
+
+
+class RateLimiter:
+    """
+    Admits Gemini calls against the buckets, in lane order: waiting interactive
+    callers are served before any batch caller, first come first served within a
+    lane. Batch callers also leave BATCH_RESERVE of the budget untouched.
+    """
+
+    def __init__(self, buckets, batch_reserve=BATCH_RESERVE, clock=time.monotonic, keep=500):
+        self.buckets = buckets
+        self.batch_reserve = batch_reserve
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = []
+        self._tickets = itertools.count()
+        self._waits = {lane: deque(maxlen=keep) for lane in LANES}
+        self._admitted = {lane: 0 for lane in LANES}
+
+    def acquire(self, lane='batch', tokens=0, honor_pause=True):
+        """
+        Blocks until the call may be sent; returns the seconds waited. honor_pause=False
+        is for a caller retrying after its own 429 backoff, which probes the quota
+        while everyone else is still held back.
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane}")
+        reserve = self.batch_reserve if lane == 'batch' else 0.0
+        ticket = (LANES.index(lane), next(self._tickets))
+        started = self._clock()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] == ticket:
+                        wait = self.buckets.try_take(tokens, reserve, honor_pause)
+                        if wait == 0:
+                            break
+                    # Woken early when the head of the queue changes
+                    self._cond.wait(timeout=min(wait, 1.0) if wait else 1.0)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+        waited = self._clock() - started
+        with self._cond:
+            self._waits[lane].append(waited)
+            self._admitted[lane] += 1
+        return waited
+
+    def settle(self, estimated, response):
+        """Corrects the token bucket with the usage the response reports."""
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'total_token_count', None)
+        if isinstance(actual, int) and actual != estimated:
+            self.buckets.adjust(actual - estimated)
+
+    def pause(self, seconds):
+        self.buckets.pause(seconds)
+
+    def stats(self):
+        lanes = {}
+        with self._cond:
+            for lane in LANES:
+                waits = sorted(self._waits[lane])
+                lanes[lane] = {
+                    "admitted": self._admitted[lane],
+                    "waiting": sum(1 for rank, _ in self._queue if LANES[rank] == lane),
+                    "wait_p50": round(waits[len(waits) // 2], 3) if waits else None,
+                    "wait_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                    "wait_max": round(waits[-1], 3) if waits else None,
+                }
+        return {"lanes": lanes, "buckets": self.buckets.snapshot(),
+                "shared": isinstance(self.buckets, SharedBuckets)}
+
+
+gemini_limiter = RateLimiter(make_buckets())
@@ -0,0 +1,316 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one attempt at an external call, in seconds
+CALL_TIMEOUT = {
+    'gemini': float(os.getenv('GEMINI_CALL_TIMEOUT', 300)),
+    's3': float(os.getenv('S3_CALL_TIMEOUT', 60)),
+    'youtube': float(os.getenv('YOUTUBE_CALL_TIMEOUT', 30)),
+}
+# Longest backoff between attempts unless the server asks for more
+MAX_BACKOFF = float(os.getenv('RETRY_MAX_BACKOFF', 60))
+# Consecutive retryable failures that open a service's circuit, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', 5))
+BREAKER_RESET = float(os.getenv('CIRCUIT_BREAKER_RESET', 30))
+
+RATE_LIMIT, TRANSIENT, PERMANENT = 'rate_limit', 'transient', 'permanent'
+
+_TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+_THROTTLE_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                   'TooManyRequestsException', 'RequestThrottled'}
+_TRANSIENT_CODES = {'RequestTimeout', 'RequestTimeoutException', 'InternalError', 'ServiceUnavailable',
+                    'PriorThrottled'}
+# Messages of errors raised without a status (yt-dlp, transport errors wrapped in strings)
+_RATE_LIMIT_TEXT = re.compile(r"\b429\b|resource.?exhausted|too many requests|rate.?limit", re.IGNORECASE)
+_TRANSIENT_TEXT = re.compile(
+    r"\b50[0234]\b|timed? ?out|timeout|temporar(?:il)?y|unavailable|connection (?:reset|aborted|refused)"
+    r"|broken pipe|remote end closed|incomplete ?read|deadline exceeded", re.IGNORECASE)
+_PERMANENT_TEXT = re.compile(r"video unavailable|private video|sign in to confirm|not available in your country"
+                             r"|unsupported url|copyright", re.IGNORECASE)
+# "Please retry in 33.6s", "retry_delay { seconds: 33 }"
+_RETRY_IN = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+    def __init__(self, service, retry_after):
+        super().__init__(f"{service} is unavailable right now, retrying in {retry_after:.0f}s")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the call could be made (again)."""
+
+
+def _status_of(e):
+    code = getattr(e, 'code', None)
+    if isinstance(code, int):
+        return code
+    code = getattr(e, 'status_code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(e, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return getattr(response, 'status_code', None)
+
+
+def classify(e):
+    """RATE_LIMIT, TRANSIENT (worth retrying) or PERMANENT for an exception from any client."""
+    if isinstance(e, CircuitOpenError):
+        return TRANSIENT
+    if isinstance(e, DeadlineExceeded):
+        return PERMANENT
+    status = _status_of(e)
+    response = getattr(e, 'response', None)
+    error_code = response.get('Error', {}).get('Code') if isinstance(response, dict) else None
+    if status == 429 or error_code in _THROTTLE_CODES:
+        return RATE_LIMIT
+    if (status in _TRANSIENT_STATUS) or error_code in _TRANSIENT_CODES:
+        return TRANSIENT
+    if isinstance(status, int) and 400 <= status < 500:
+        return PERMANENT
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    # botocore transport errors, urllib3/requests errors, yt-dlp's DownloadError
+    name = type(e).__name__
+    if name in ('EndpointConnectionError', 'ConnectionClosedError', 'ReadTimeoutError',
+                'ConnectTimeoutError', 'ProxyConnectionError', 'ServiceUnavailable',
+                'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout'):
+        return TRANSIENT
+    text = str(e)
+    if _RATE_LIMIT_TEXT.search(text):
+        return RATE_LIMIT
+    if _PERMANENT_TEXT.search(text):
+        return PERMANENT
+    if _TRANSIENT_TEXT.search(text):
+        return TRANSIENT
+    return PERMANENT
+
+
+def is_retryable(e):
+    return classify(e) != PERMANENT
+
+
+def retry_after(e):
+    """Seconds the server asked the client to wait (Retry-After header or hint in the message), or None."""
+    if isinstance(e, CircuitOpenError):
+        return e.retry_after
+    response = getattr(e, 'response', None)
+    headers = None
+    if isinstance(response, dict):
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders')
+    elif response is not None:
+        headers = getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+    match = _RETRY_IN.search(str(e))
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
+
+
+class Deadline:
+    """A point in time by which a whole request (all of its calls and retries) must be done."""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Bounds every call made in the block; a nested deadline can only shorten an outer one."""
+    outer = _deadline.get()
+    inner = Deadline(seconds)
+    if outer is not None and outer.expires_at < inner.expires_at:
+        inner = outer
+    token = _deadline.set(inner)
+    try:
+        yield inner
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def call_timeout(service, deadline=None):
+    """Timeout for the next attempt: the service's per-call limit, cut to the deadline."""
+    deadline = deadline or current_deadline()
+    timeout = CALL_TIMEOUT.get(service, 60.0)
+    if deadline is not None:
+        timeout = min(timeout, deadline.remaining())
+    return max(timeout, 1.0)
+
+
+class CircuitBreaker:
+    """
+    Fails fast once a service keeps failing: after `threshold` consecutive retryable
+    failures the circuit opens and calls raise CircuitOpenError for `reset_timeout`
+    seconds. Then one probe call is let through (half open); its outcome closes the
+    circuit or opens it again. A probe whose outcome never arrives (its caller went
+    away) stops counting after `probe_timeout` and the next call probes instead.
+    Permanent errors (bad input) say nothing about the service's health and are not
+    counted.
+    """
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET, clock=time.monotonic,
+                 probe_timeout=None):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout if probe_timeout is not None else CALL_TIMEOUT.get(name, 60.0)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._probe_started = None
+        self.counts = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """Admits a call or raises CircuitOpenError. True when the call is the half-open probe."""
+        with self._lock:
+            self.counts["calls"] += 1
+            now = self._clock()
+            if self.state == 'open':
+                waited = now - self.opened_at
+                if waited < self.reset_timeout:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - waited)
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open':
+                if self._probing and now - self._probe_started < self.probe_timeout:
+                    self.counts["rejected"] += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probing = True
+                self._probe_started = now
+                return True
+            return False
+
+    def release_probe(self):
+        """Hands the probe back without an outcome (its caller gave up), so the next call probes."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, kind):
+        with self._lock:
+            self.counts["failures"] += 1
+            self._probing = False
+            if kind == PERMANENT:
+                if self.state == 'half_open':
+                    # The service answered; it is up
+                    self.state = 'closed'
+                    self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.counts["opened"] += 1
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = self._clock()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, state=self.state, consecutive_failures=self.failures)
+
+
+breakers = {name: CircuitBreaker(name) for name in ('gemini', 's3', 'youtube')}
+
+
+def backoff(service, error, attempt, retries, delay, deadline=None):
+    """
+    Records a failed attempt and decides what happens next. Returns the seconds to
+    wait before retrying, or None when the error should be raised: it is permanent,
+    the circuit is open, the retries are used up, or the wait would overrun the deadline. Waits use the
+    server's hint when it gives one, exponential backoff with jitter otherwise.
+    """
+    if isinstance(error, CircuitOpenError):
+        # Shed the load now; the caller (e.g. the job queue) tries again later
+        return None
+    kind = classify(error)
+    breaker = breakers[service]
+    breaker.record_failure(kind)
+    if kind == PERMANENT or attempt >= retries:
+        return None
+    hint = retry_after(error)
+    wait = hint if hint is not None else min(MAX_BACKOFF, delay + random.uniform(0, 1))
+    deadline = deadline or current_deadline()
+    if deadline is not None and wait >= deadline.remaining():
+        logger.warning(f"{service}: not retrying {kind} error, {deadline.remaining():.0f}s left of the deadline")
+        return None
+    with breaker._lock:
+        breaker.counts["retries"] += 1
+    return wait
+
+
+def call(service, fn, *args, retries=3, initial_delay=1, deadline=None, **kwargs):
+    """
+    Calls fn(*args, **kwargs) through the service's circuit breaker, retrying
+    retryable errors with backoff() until the retries or the deadline run out.
+    """
+    deadline = deadline or current_deadline()
+    breaker = breakers[service]
+    delay = initial_delay
+    for attempt in range(retries + 1):
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded(f"{service} call abandoned, deadline passed")
+        probe = False
+        try:
+            probe = breaker.before_call()
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            wait = backoff(service, e, attempt, retries, delay, deadline)
+            if wait is None:
+                raise
+            logger.warning(f"{service} call failed ({classify(e)}: {e}), retrying in {wait:.1f}s "
+                           f"(attempt {attempt + 1}/{retries})")
+            time.sleep(wait)
+            delay *= 2
+            continue
+        except BaseException:
+            # Interrupted without an outcome (e.g. a worker timeout)
+            if probe:
+                breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+def stats():
+    return {name: breaker.stats() for name, breaker in breakers.items()}
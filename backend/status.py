@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import User, Video, DeletedVideo
+
+# How often a waiting status request re-reads the version (changes made by other
+# processes; changes committed in this process wake waiters immediately)
+POLL_INTERVAL = float(os.getenv('STATUS_POLL_INTERVAL', 1.0))
+
+# Longest a status request may wait for a change (?wait=<seconds>). Each waiting
+# request holds a server thread, so this is off (0) by default and clients make
+# plain conditional polls; enable it only with threads to spare for every open tab
+LONG_POLL_SECONDS = float(os.getenv('STATUS_LONG_POLL_SECONDS', 0))
+# Deleted videos are reported to clients polling with an older version for this long
+DELETED_RETENTION = timedelta(days=int(os.getenv('STATUS_DELETED_RETENTION_DAYS', 7)))
+
+_changed = threading.Condition()
+
+
+def bump_status_version(videos):
+    """
+    Gives the owners of these videos a new status version and stamps the videos with
+    it, so clients can ask for changes since the version they have. The caller commits.
+    """
+    # New videos (and users) need their ids
+    db.session.flush()
+    by_user = {}
+    for video in videos:
+        user_id = video.user_id
+        by_user.setdefault(user_id, []).append(video)
+
+    for user_id, owned in by_user.items():
+        db.session.execute(
+            db.update(User)
+            .where(User.id == user_id)
+            .values(status_version=User.status_version + 1)
+        )
+        version = db.session.execute(db.select(User.status_version).where(User.id == user_id)).scalar()
+        for video in owned:
+            video.status_version = version
+    db.session.info['status_changed'] = True
+
+
+def record_deletion(video):
+    """
+    Bumps the owner's version for a video about to be deleted and leaves a tombstone,
+    so clients holding an older version learn to drop it. The caller deletes and commits.
+    """
+    bump_status_version([video])
+    db.session.add(DeletedVideo(video_id=video.id, user_id=video.user_id,
+                                status_version=video.status_version))
+    db.session.execute(db.delete(DeletedVideo).where(
+        DeletedVideo.deleted_at < datetime.utcnow() - DELETED_RETENTION))
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_waiters(session):
+    if session.info.pop('status_changed', False):
+        with _changed:
+            _changed.notify_all()
+
+
+def status_version(user_id):
+    return db.session.execute(db.select(User.status_version).where(User.id == user_id)).scalar() or 0
+
+
+def video_statuses(user_id, since=None):
+    """
+    [{id, status}] for the user's videos, only those changed after `since` if given;
+    videos deleted since then are included with status "deleted". Videos still
+    downloading also carry their progress in percent.
+    """
+    statuses = []
+    query = db.select(Video.id, Video.status, Video.download_progress).where(Video.user_id == user_id)
+    if since is not None:
+        query = query.where(Video.status_version > since)
+        # First, so a live video that reuses a deleted id wins
+        deleted = db.select(DeletedVideo.video_id).where(
+            DeletedVideo.user_id == user_id, DeletedVideo.status_version > since)
+        statuses.extend({"id": id, "status": "deleted"} for id in db.session.execute(deleted).scalars())
+    for id, status, progress in db.session.execute(query):
+        entry = {"id": id, "status": status}
+        if status == 'downloading' and progress is not None:
+            entry["progress"] = progress
+        statuses.append(entry)
+    return statuses
+
+
+def wait_for_change(user_id, since, timeout):
+    """Blocks until the user's status version differs from `since` or timeout passes. Returns the version."""
+    deadline = time.monotonic() + timeout
+    while True:
+        # End the read transaction so each check sees other processes' commits
+        db.session.rollback()
+        version = status_version(user_id)
+        remaining = deadline - time.monotonic()
+        if version != since or remaining <= 0:
+            return version
+        with _changed:
+            _changed.wait(min(POLL_INTERVAL, remaining))
@@ -0,0 +1,179 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .chunking import iter_segments
+from . import media
+
+logger = logging.getLogger(__name__)
+
+# Long videos are transcribed as overlapping time ranges, several at once, instead of
+# one request that is slow, hits output limits and fails as a whole
+CHUNKED = os.getenv('TRANSCRIBE_CHUNKED', '0').lower() in ('1', 'true', 'yes')
+# Only videos longer than this are split
+MIN_DURATION = int(os.getenv('TRANSCRIBE_CHUNK_MIN_DURATION', 20 * 60))
+RANGE_SECONDS = int(os.getenv('TRANSCRIBE_RANGE_SECONDS', 10 * 60))
+# Each range also covers this many seconds of the next one, so a sentence cut at a
+# boundary is heard whole by one of the two requests
+OVERLAP_SECONDS = int(os.getenv('TRANSCRIBE_OVERLAP_SECONDS', 20))
+# Ranges being transcribed at once, per video
+PARALLELISM = int(os.getenv('TRANSCRIBE_PARALLELISM', 4))
+# Rounds in which failed ranges are tried again (successful ranges are kept)
+RANGE_ATTEMPTS = int(os.getenv('TRANSCRIBE_RANGE_ATTEMPTS', 3))
+
+PROMPT = "Generate a detailed transcript of this video with timestamps."
+
+# [start, end) is the media sent for the range; lines starting in [keep_from, keep_to)
+# are kept, which splits each overlap at its midpoint between the two ranges
+TimeRange = namedtuple('TimeRange', 'index start end keep_from keep_to')
+
+
+def plan_ranges(duration, range_seconds=None, overlap=None):
+    range_seconds = range_seconds or RANGE_SECONDS
+    overlap = OVERLAP_SECONDS if overlap is None else overlap
+    ranges = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + range_seconds + overlap)
+        keep_to = start + range_seconds + overlap / 2 if end < duration else float('inf')
+        keep_from = ranges[-1].keep_to if ranges else 0.0
+        ranges.append(TimeRange(len(ranges), start, end, keep_from, keep_to))
+        start += range_seconds
+        if end >= duration:
+            break
+    return ranges
+
+
+def _normalized(text):
+    return " ".join(text.lower().split())
+
+
+def stitch(results):
+    """
+    Joins range transcripts, given as (TimeRange, text) in any order, into one
+    transcript with timestamps shifted by each range's start. Lines repeated across a
+    boundary (spoken in the overlap, timed slightly differently by each request) are
+    kept once.
+    """
+    from .rag import format_time
+    margin = OVERLAP_SECONDS / 4
+    lines = []
+    recent = []
+    for time_range, text in sorted(results, key=lambda item: item[0].start):
+        for start, _, line in iter_segments(text.splitlines()):
+            start += time_range.start
+            # The two requests may time a line near the midpoint a few seconds apart;
+            # the margin keeps it from being dropped by both
+            if not time_range.keep_from - margin <= start < time_range.keep_to + margin:
+                continue
+            key = _normalized(line)
+            if any(key == seen and abs(start - at) <= OVERLAP_SECONDS for at, seen in recent):
+                continue
+            recent = recent[-7:] + [(start, key)]
+            lines.append((start, line))
+    lines.sort(key=lambda item: item[0])
+    return "\n".join(f"[{format_time(start)}] {line}" for start, line in lines)
+
+
+def _wait_active(gemini_file, size_bytes):
+    """
+    Blocks this range's thread until its clip is ACTIVE. The state checks are made by
+    the shared poller (see poller.py), with its backoff, like every other Gemini file.
+    """
+    from .poller import file_poller
+    if gemini_file.state.name == "ACTIVE":
+        return gemini_file
+    settled = threading.Event()
+    outcome = {}
+
+    def on_ready(ready_file):
+        outcome['file'] = ready_file
+        settled.set()
+
+    def on_failed(name, reason):
+        outcome['reason'] = reason
+        settled.set()
+
+    file_poller.watch(gemini_file.name, size_bytes, on_ready, on_failed)
+    # The poller gives up on its own after max_wait; the margin covers its last check
+    if not settled.wait(file_poller.max_wait + 60):
+        outcome['reason'] = "timed out"
+    if 'file' not in outcome:
+        raise RuntimeError(f"Gemini could not process {gemini_file.name}: {outcome['reason']}")
+    return outcome['file']
+
+
+def transcribe_range(path, time_range, workdir):
+    """Cuts one range out of the file, uploads it to Gemini and transcribes it."""
+    import google.generativeai as genai
+    from .utils import generate_with_retry
+    from .gemini_files import delete_gemini_file
+    from . import resilience
+
+    clip = media.cut_range(path, time_range.start, time_range.end - time_range.start,
+                           os.path.join(workdir, f"range-{time_range.index:04d}{os.path.splitext(path)[1]}"))
+    gemini_file = None
+    try:
+        gemini_file = resilience.call('gemini', genai.upload_file, path=clip)
+        gemini_file = _wait_active(gemini_file, os.path.getsize(clip))
+        model = genai.GenerativeModel('gemini-2.0-flash')
+        response = generate_with_retry(model, [gemini_file, PROMPT], retries=5, initial_delay=5)
+        return response.text
+    finally:
+        os.remove(clip)
+        if gemini_file is not None:
+            delete_gemini_file(gemini_file.name)
+
+
+def transcribe_ranges(path, ranges, transcribe=transcribe_range, parallelism=None, attempts=None):
+    """
+    Transcribes every range, at most `parallelism` at a time. Ranges that fail are
+    retried on their own, up to `attempts` rounds. Returns the stitched transcript;
+    raises RuntimeError if some range never succeeded.
+    """
+    parallelism = parallelism or PARALLELISM
+    attempts = attempts or RANGE_ATTEMPTS
+    done = {}
+    pending = list(ranges)
+    workdir = tempfile.mkdtemp(prefix="ranges-")
+    try:
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="transcribe") as pool:
+            for attempt in range(1, attempts + 1):
+                # Each range runs in a copy of this context: the job's deadline and identity
+                futures = {r: pool.submit(contextvars.copy_context().run, transcribe, path, r, workdir)
+                           for r in pending}
+                pending = []
+                for time_range, future in futures.items():
+                    try:
+                        done[time_range] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Range {time_range.index} ({time_range.start:.0f}s) failed "
+                                       f"on attempt {attempt}/{attempts}: {e}")
+                        pending.append(time_range)
+                if not pending:
+                    break
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if pending:
+        raise RuntimeError(f"{len(pending)} of {len(ranges)} transcript ranges failed")
+    return stitch(done.items())
+
+
+def transcribe_in_ranges(path):
+    """
+    Chunked transcript of the media file at `path`, or None when chunking does not
+    apply (disabled, ffmpeg missing, or the video is short enough for one request).
+    """
+    if not CHUNKED or not media.available():
+        return None
+    duration = media.probe_duration(path)
+    if not duration or duration <= MIN_DURATION:
+        return None
+    ranges = plan_ranges(duration)
+    logger.info(f"Transcribing {duration:.0f}s in {len(ranges)} ranges, {PARALLELISM} at a time")
+    return transcribe_ranges(path, ranges)
@@ -0,0 +1,156 @@
+import re
+import time
+import threading
+import logging
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from .extensions import db
+from .models import TranscriptSegment
+from .chunking import iter_segments, parse_timestamp, batched
+
+logger = logging.getLogger(__name__)
+
+# Segment indexes kept in memory (one per transcript, least recently used evicted).
+# Each is checked against the segments table before use, since any process may
+# rewrite or delete a transcript's segments
+CACHE_SIZE = 64
+# Segments returned per transcript window request
+WINDOW_LIMIT = 200
+
+# Clock times mentioned in an answer: 1:02:03, 01:23, [12:05 - 12:40]
+_MENTIONED_TIME = re.compile(r"(?<![\d:])(?:\d{1,2}:)?\d{1,2}:\d{2}(?![\d:])")
+
+
+class SegmentIndex:
+    """
+    Sorted start/end times of a transcript's segments. Time -> segment and window
+    lookups bisect the start times, so they cost O(log n) however long the lecture.
+    """
+
+    def __init__(self, rows):
+        # rows: (start_time, end_time, text), in transcript order
+        rows = sorted(rows, key=lambda row: row[0])
+        self.starts = [row[0] for row in rows]
+        self.ends = [row[1] for row in rows]
+        self.texts = [row[2] for row in rows]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, seconds):
+        """Position of the segment playing at `seconds` (the last one starting at or before it), or None."""
+        position = bisect_right(self.starts, seconds) - 1
+        if position < 0:
+            return 0 if self.starts else None
+        return position
+
+    def start_of(self, position):
+        return self.starts[position]
+
+    def snap(self, seconds):
+        """Start of the segment containing `seconds`: a position the player can seek to."""
+        position = self.at(seconds)
+        return seconds if position is None else self.starts[position]
+
+    def window(self, start, end=None, limit=WINDOW_LIMIT):
+        """Segments overlapping [start, end), at most `limit` of them, as dicts."""
+        first = self.at(start) or 0
+        last = len(self.starts) if end is None else bisect_left(self.starts, end)
+        last = min(last, first + limit)
+        return [{"position": i, "start_time": self.starts[i], "end_time": self.ends[i], "text": self.texts[i]}
+                for i in range(first, last)]
+
+
+_lock = threading.Lock()
+_indexes = OrderedDict() # key -> (stamp, SegmentIndex)
+
+
+def invalidate(key):
+    with _lock:
+        _indexes.pop(key, None)
+
+
+def _stamp(key):
+    """(count, generation) of the stored segments: changes whenever store_segments or delete_segments runs."""
+    return tuple(db.session.execute(
+        db.select(db.func.count(TranscriptSegment.id), db.func.max(TranscriptSegment.generation))
+        .where(TranscriptSegment.source_key == key)
+    ).one())
+
+
+def store_segments(key, transcript, batch_size=500):
+    """Replaces the stored segments for `key` with the lines of `transcript`. Returns the count."""
+    TranscriptSegment.query.filter_by(source_key=key).delete()
+    generation = time.time_ns()
+    count = 0
+    for batch in batched(iter_segments(transcript.splitlines()), batch_size):
+        db.session.bulk_insert_mappings(TranscriptSegment, [
+            {"source_key": key, "position": count + i, "start_time": start,
+             "end_time": end if end is not None else start, "text": text, "generation": generation}
+            for i, (start, end, text) in enumerate(batch)
+        ])
+        count += len(batch)
+    db.session.commit()
+    invalidate(key)
+    return count
+
+
+def delete_segments(key):
+    TranscriptSegment.query.filter_by(source_key=key).delete()
+    invalidate(key)
+
+
+def get_index(video):
+    """
+    The video's SegmentIndex, built on first use from the segments table (which is
+    backfilled from the transcript text for videos transcribed before it existed).
+    Returns None if the video has no transcript.
+    """
+    from .rag import index_key
+    key = index_key(video)
+    stamp = _stamp(key)
+    with _lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == stamp:
+            _indexes.move_to_end(key)
+            return cached[1]
+
+    rows = db.session.execute(
+        db.select(TranscriptSegment.start_time, TranscriptSegment.end_time, TranscriptSegment.text)
+        .where(TranscriptSegment.source_key == key)
+        .order_by(TranscriptSegment.position)
+    ).all()
+    if not rows:
+        if not video.transcript or not store_segments(key, video.transcript):
+            return None
+        return get_index(video)
+
+    index = SegmentIndex(rows)
+    with _lock:
+        _indexes[key] = (stamp, index)
+        while len(_indexes) > CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def resolve_timestamps(video, times, answer_text=None, limit=5):
+    """
+    Seekable positions for an answer: the given times (e.g. of retrieved segments) and
+    any clock times the answer mentions, each snapped to the start of its segment.
+    """
+    candidates = list(times or [])
+    if answer_text:
+        candidates += [parse_timestamp(m) for m in _MENTIONED_TIME.findall(answer_text)]
+    candidates = [t for t in candidates if t is not None]
+    if not candidates:
+        return []
+
+    try:
+        index = get_index(video)
+    except Exception as e:
+        logger.warning(f"Segment index unavailable for video {video.id}: {e}")
+        index = None
+    if index:
+        # A time past the end (a rounded or misread mention) points at the last segment
+        candidates = [index.snap(min(t, index.ends[-1])) for t in candidates]
+    return sorted(set(candidates))[:limit]
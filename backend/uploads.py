@@ -0,0 +1,437 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from .extensions import db
+from .models import Upload
+from .dedup import CHUNK_SIZE, hash_stream
+from . import ingest, resilience
+
+logger = logging.getLogger(__name__)
+
+# S3 multipart part size (S3 requires at least 5MB for every part but the last)
+PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', 8 * 1024 * 1024))
+# Parts sent to S3 concurrently, across all uploads of this process
+PART_THREADS = int(os.getenv('UPLOAD_PART_THREADS', 4))
+# How long one PATCH may hold an upload; a request that died holding it is outlived
+CHUNK_LEASE = timedelta(seconds=int(os.getenv('UPLOAD_CHUNK_LEASE', 15 * 60)))
+# Uploads nobody wrote to for this long are aborted: S3 parts and staging files freed
+UPLOAD_TTL = timedelta(hours=int(os.getenv('UPLOAD_TTL_HOURS', 24)))
+# A sweep for abandoned uploads is queued at most this often per process
+SWEEP_INTERVAL = int(os.getenv('UPLOAD_SWEEP_INTERVAL', 3600))
+
+_lock = threading.Lock()
+# upload id -> (offset, sha256 state). The hash is computed as chunks arrive; when a
+# chunk was received by another process the state is dropped and finish_upload
+# re-reads the stored bytes instead.
+_hashers = {}
+# upload id -> {part number: Future} for parts being sent to S3 by this process
+_pending = {}
+_pool = None
+_last_sweep = None
+
+
+def _part_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PART_THREADS, thread_name_prefix="s3-part")
+    return _pool
+
+
+def _bucket():
+    return os.getenv('AWS_BUCKET_NAME')
+
+
+def staging_dir(upload, upload_dir):
+    return os.path.join(upload_dir, '.uploads', upload.id)
+
+
+def _part_path(staging, number):
+    return os.path.join(staging, f"part-{number:05d}")
+
+
+def _send_part(bucket, key, s3_upload_id, number, path):
+    from .utils import get_s3_client
+    def attempt(f):
+        f.seek(0)
+        get_s3_client().upload_part(Bucket=bucket, Key=key, UploadId=s3_upload_id,
+                                    PartNumber=number, Body=f)
+
+    try:
+        with open(path, 'rb') as f, ingest.timed('s3_upload', os.fstat(f.fileno()).st_size):
+            resilience.call('s3', attempt, f)
+    except FileNotFoundError:
+        # Already sent (and set aside) by another worker
+        return
+    # Kept until finalize, which joins the parts into the ingest spool for Gemini
+    os.replace(path, path + '.sent')
+
+
+def _join_parts(upload, staging):
+    """Joins the sent parts into one local file, or returns None if any is missing."""
+    names = sorted(name for name in os.listdir(staging) if name.endswith('.sent'))
+    paths = [os.path.join(staging, name) for name in names]
+    if sum(os.path.getsize(path) for path in paths) != upload.offset:
+        return None
+    joined = os.path.join(staging, 'data')
+    with open(joined, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, out, CHUNK_SIZE)
+            os.remove(path)
+    return joined
+
+
+def _wait_part(upload_id, number):
+    with _lock:
+        future = _pending.get(upload_id, {}).pop(number, None)
+    if future:
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning(f"Part {number} of upload {upload_id} failed, it will be resent: {e}")
+
+
+class _SpoolWriter:
+    """Local storage: appends to one spool file, dropping anything past `offset` first."""
+
+    def __init__(self, path, offset):
+        self._file = open(path, 'ab')
+        self._file.truncate(offset)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+class _PartWriter:
+    """
+    S3 storage: cuts the byte stream into PART_SIZE part files on disk. Each full
+    part is handed to the part pool, so S3 transfers overlap with receiving the next
+    chunk; a part file is removed once S3 has it.
+    """
+
+    def __init__(self, upload, staging, offset, part_size=None):
+        self.upload = upload
+        self.staging = staging
+        self.position = offset
+        self.part_size = part_size or PART_SIZE
+        self._file = None
+        self._number = None
+
+    def _open(self):
+        self._number = self.position // self.part_size + 1
+        # A resend of this part must not race an in-flight transfer of the old bytes
+        _wait_part(self.upload.id, self._number)
+        self._file = open(_part_path(self.staging, self._number), 'ab')
+        self._file.truncate(self.position % self.part_size)
+
+    def _submit(self, number):
+        upload = self.upload
+        future = _part_pool().submit(_send_part, _bucket(), upload.s3_key, upload.s3_upload_id,
+                                     number, _part_path(self.staging, number))
+        with _lock:
+            _pending.setdefault(upload.id, {})[number] = future
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            if self._file is None:
+                self._open()
+            room = self.part_size - self.position % self.part_size
+            piece = view[:room]
+            self._file.write(piece)
+            self.position += len(piece)
+            view = view[len(piece):]
+            if self.position % self.part_size == 0:
+                self._file.close()
+                self._file = None
+                self._submit(self._number)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def create_upload(user_id, filename, content_type, size, upload_dir):
+    """
+    Starts a resumable upload: an S3 multipart upload when S3 is configured, a local
+    spool file otherwise. Returns (upload, error).
+    """
+    upload = Upload(id=uuid.uuid4().hex, user_id=user_id, filename=filename,
+                    content_type=content_type, size=size, offset=0, status='uploading')
+    bucket = _bucket()
+    if bucket:
+        from .utils import get_s3_client
+        ext = os.path.splitext(filename)[1] or '.mp4'
+        upload.s3_key = f"uploads/{upload.id}{ext}"
+        params = {'Bucket': bucket, 'Key': upload.s3_key}
+        if content_type:
+            params['ContentType'] = content_type
+        try:
+            upload.s3_upload_id = resilience.call('s3', get_s3_client().create_multipart_upload, **params)['UploadId']
+        except Exception as e:
+            logger.error(f"Could not start multipart upload: {e}")
+            return None, "Could not start upload"
+
+    os.makedirs(staging_dir(upload, upload_dir), exist_ok=True)
+    db.session.add(upload)
+    db.session.commit()
+    with _lock:
+        _hashers[upload.id] = (0, hashlib.sha256())
+    return upload, None
+
+
+def _claim(upload, offset, busy="Another chunk is being written"):
+    """
+    Reserves the upload for one chunk at `offset` (or for finishing it), so concurrent
+    requests (a client retrying while its first request is still running) never write
+    the same bytes twice. Returns an error when the offset moved or another request
+    holds it.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        db.update(Upload)
+        .where(Upload.id == upload.id, Upload.status == 'uploading', Upload.offset == offset,
+               db.or_(Upload.writing_until.is_(None), Upload.writing_until < now))
+        .values(writing_until=now + CHUNK_LEASE, updated_at=now)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+        return None
+    db.session.refresh(upload)
+    if upload.status != 'uploading':
+        return "Upload is not in progress"
+    if offset != upload.offset:
+        return f"Offset mismatch, upload is at {upload.offset}"
+    return busy
+
+
+def write_chunk(upload, offset, stream, upload_dir):
+    """
+    Appends the bytes of `stream` at `offset`, which must match the upload's current
+    offset. Bytes received before a dropped connection are kept, so the client can
+    resume from the returned offset. Returns (offset, error).
+    """
+    error = _claim(upload, offset)
+    if error:
+        return None, error
+
+    with _lock:
+        state = _hashers.pop(upload.id, None)
+    hasher = state[1] if state and state[0] == offset else None
+
+    staging = staging_dir(upload, upload_dir)
+    os.makedirs(staging, exist_ok=True)
+    if upload.s3_upload_id:
+        writer = _PartWriter(upload, staging, offset)
+    else:
+        writer = _SpoolWriter(os.path.join(staging, 'data'), offset)
+
+    position = offset
+    try:
+        while True:
+            block = stream.read(CHUNK_SIZE)
+            if not block:
+                break
+            if upload.size is not None and position + len(block) > upload.size:
+                error = "Chunk exceeds the declared upload size"
+                break
+            writer.write(block)
+            if hasher:
+                hasher.update(block)
+            position += len(block)
+    except Exception as e:
+        # Client went away mid-chunk; keep what arrived
+        logger.warning(f"Chunk for upload {upload.id} interrupted at {position}: {e}")
+    finally:
+        writer.close()
+
+    upload.offset = position
+    upload.writing_until = None
+    db.session.commit()
+    if hasher:
+        with _lock:
+            _hashers[upload.id] = (position, hasher)
+    return position, error
+
+
+def _complete_multipart(upload, staging):
+    from .utils import get_s3_client
+    bucket = _bucket()
+    client = get_s3_client()
+
+    with _lock:
+        pending = _pending.pop(upload.id, {})
+    for number, future in pending.items():
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning(f"Part {number} of upload {upload.id} failed, resending: {e}")
+    # The last (short) part, failed parts and parts accepted by another worker
+    for name in sorted(os.listdir(staging)):
+        if name.startswith('part-') and not name.endswith('.sent'):
+            _send_part(bucket, upload.s3_key, upload.s3_upload_id, int(name[5:]), os.path.join(staging, name))
+
+    def list_parts():
+        parts = []
+        paginator = client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=bucket, Key=upload.s3_key, UploadId=upload.s3_upload_id):
+            parts.extend(page.get('Parts', []))
+        return parts
+
+    parts = resilience.call('s3', list_parts)
+    if sum(part['Size'] for part in parts) != upload.offset:
+        return "Some parts are still being uploaded, try again"
+
+    resilience.call(
+        's3', client.complete_multipart_upload,
+        Bucket=bucket, Key=upload.s3_key, UploadId=upload.s3_upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']}
+                                   for p in sorted(parts, key=lambda p: p['PartNumber'])]}
+    )
+    return None
+
+
+def finish_upload(upload, upload_dir):
+    """
+    Completes the upload. Returns ({"content_hash", "s3_key", "local_path", "spool_path"},
+    error). local_path (local storage) is the file still to be moved into place;
+    spool_path (S3) is a local copy the caller may keep for the Gemini upload. The
+    caller then calls cleanup_upload.
+    """
+    if upload.status != 'uploading':
+        return None, "Upload is not in progress"
+    if upload.offset == 0:
+        return None, "Upload is empty"
+    if upload.size is not None and upload.offset != upload.size:
+        return None, f"Upload incomplete: {upload.offset} of {upload.size} bytes received"
+    # Held like a chunk's lease: a second finalize, or a PATCH racing this one, is refused
+    error = _claim(upload, upload.offset, busy="The upload is being written or finalised")
+    if error:
+        return None, error
+
+    try:
+        result, error = _finish(upload, upload_dir)
+    except Exception:
+        _release(upload)
+        raise
+    if error:
+        _release(upload)
+        return None, error
+    upload.status = 'completed'
+    upload.writing_until = None
+    db.session.commit()
+    return result, None
+
+
+def _release(upload):
+    upload.writing_until = None
+    db.session.commit()
+
+
+def _finish(upload, upload_dir):
+    staging = staging_dir(upload, upload_dir)
+    with _lock:
+        state = _hashers.pop(upload.id, None)
+    content_hash = None
+    if state and state[0] == upload.offset:
+        content_hash = f"sha256:{state[1].hexdigest()}"
+
+    result = {"s3_key": None, "local_path": None, "spool_path": None}
+    if upload.s3_upload_id:
+        try:
+            error = _complete_multipart(upload, staging)
+        except Exception as e:
+            logger.error(f"Completing upload {upload.id} failed: {e}")
+            error = "Could not complete upload"
+        if error:
+            if state:
+                with _lock:
+                    _hashers[upload.id] = state
+            return None, error
+        result["s3_key"] = upload.s3_key
+        result["spool_path"] = _join_parts(upload, staging)
+        if content_hash is None:
+            from .utils import get_s3_client
+            content_hash, _ = resilience.call(
+                's3', lambda: hash_stream(get_s3_client().get_object(Bucket=_bucket(), Key=upload.s3_key)['Body']))
+    else:
+        result["local_path"] = os.path.join(staging, 'data')
+        if content_hash is None:
+            with open(result["local_path"], 'rb') as f:
+                content_hash, _ = hash_stream(f)
+
+    result["content_hash"] = content_hash
+    return result, None
+
+
+def cleanup_upload(upload, upload_dir):
+    shutil.rmtree(staging_dir(upload, upload_dir), ignore_errors=True)
+
+
+def abort_upload(upload, upload_dir, idle_since=None):
+    """
+    Cancels an upload and frees its S3 parts and local spool. With `idle_since`, only
+    if nothing was written since then. Returns False if it was no longer in progress.
+    """
+    query = db.update(Upload).where(Upload.id == upload.id, Upload.status == 'uploading')
+    if idle_since is not None:
+        query = query.where(Upload.updated_at < idle_since)
+    aborted = db.session.execute(query.values(status='aborted')).rowcount
+    db.session.commit()
+    if not aborted:
+        return False
+
+    with _lock:
+        pending = _pending.pop(upload.id, {})
+        _hashers.pop(upload.id, None)
+    for future in pending.values():
+        future.cancel()
+    if upload.s3_upload_id:
+        from .utils import get_s3_client
+        try:
+            resilience.call('s3', get_s3_client().abort_multipart_upload, Bucket=_bucket(),
+                            Key=upload.s3_key, UploadId=upload.s3_upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort multipart upload {upload.id}: {e}")
+    cleanup_upload(upload, upload_dir)
+    return True
+
+
+def sweep_uploads(upload_dir, ttl=UPLOAD_TTL):
+    """Aborts uploads nobody has written to within `ttl`. Returns how many."""
+    cutoff = datetime.utcnow() - ttl
+    stale = Upload.query.filter(Upload.status == 'uploading', Upload.updated_at < cutoff).all()
+    swept = sum(abort_upload(upload, upload_dir, idle_since=cutoff) for upload in stale)
+    if swept:
+        logger.info(f"Aborted {swept} abandoned uploads")
+    return swept
+
+
+def sweep_uploads_job(video_id, app_context):
+    """Background task running sweep_uploads."""
+    from flask import current_app
+    with app_context:
+        sweep_uploads(current_app.config['UPLOAD_FOLDER'])
+
+
+def schedule_sweep():
+    """Queues a sweep of abandoned uploads, at most once per SWEEP_INTERVAL in this process."""
+    global _last_sweep
+    from . import jobs
+    now = time.monotonic()
+    with _lock:
+        if jobs.job_queue is None or (_last_sweep is not None and now - _last_sweep < SWEEP_INTERVAL):
+            return
+        _last_sweep = now
+    if not jobs.job_queue.backend.has_active_job('sweep_uploads', None):
+        jobs.job_queue.enqueue('sweep_uploads')
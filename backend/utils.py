@@ -1,20 +1,113 @@
 import time
 import logging
 import os
-import random
-import boto3
-from botocore.exceptions import ClientError
-from google.api_core import exceptions
+import threading
+from collections import OrderedDict
+from botocore.exceptions import ClientError, BotoCoreError
+from . import resilience
 
 logger = logging.getLogger(__name__)
 
+# Connections kept per S3 client; uploads/downloads from several job workers share them
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 32))
+# Presigned URLs are reused until this many seconds before they expire
+PRESIGN_REUSE_MARGIN = int(os.getenv('S3_PRESIGN_REUSE_MARGIN', 300))
+
+_s3_client = None
+_s3_client_pid = None
+_s3_lock = threading.Lock()
+
 def get_s3_client():
-    return boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_REGION', 'us-east-1')
-    )
+    """
+    Process-wide S3 client. boto3 clients are thread-safe, so one client (one
+    credential lookup, one connection pool) serves every request and job thread.
+    A forked worker process builds its own instead of sharing pooled sockets.
+    S3_ENDPOINT_URL points it at a local S3 stand-in (MinIO, moto_server).
+    """
+    global _s3_client, _s3_client_pid
+    if _s3_client is not None and _s3_client_pid == os.getpid():
+        return _s3_client
+    with _s3_lock:
+        if _s3_client is None or _s3_client_pid != os.getpid():
+            import boto3
+            from botocore.config import Config
+            session = boto3.session.Session(
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=os.getenv('AWS_REGION', 'us-east-1')
+            )
+            _s3_client = session.client(
+                's3',
+                endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=True,
+                    connect_timeout=10,
+                    read_timeout=resilience.CALL_TIMEOUT['s3'],
+                    # Retries are made by resilience.call, under its deadline and circuit breaker
+                    retries={'total_max_attempts': 1},
+                )
+            )
+            _s3_client_pid = os.getpid()
+            presigned_urls.clear()
+    return _s3_client
+
+def reset_s3_client():
+    """Drops the shared client, e.g. after changing credentials or the endpoint."""
+    global _s3_client
+    with _s3_lock:
+        _s3_client = None
+    presigned_urls.clear()
+
+class PresignedUrlCache:
+    """
+    Presigned GET URLs keyed by (bucket, key, content type, lifetime), reused until
+    PRESIGN_REUSE_MARGIN seconds before they expire. Bounded, oldest evicted first.
+    """
+
+    def __init__(self, max_entries=4096, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and self._clock() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, cache_key, url, expiration):
+        reuse_for = max(0, expiration - PRESIGN_REUSE_MARGIN)
+        with self._lock:
+            self._entries[cache_key] = (url, self._clock() + reuse_for)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, bucket, object_name):
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[:2] == (bucket, object_name)]:
+                del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "hits": self.hits, "misses": self.misses}
+
+presigned_urls = PresignedUrlCache()
+
+# What the S3 helpers report as a failed operation (after any retries)
+S3_ERRORS = (ClientError, BotoCoreError, resilience.CircuitOpenError, resilience.DeadlineExceeded)
 
 def upload_to_s3(file_obj, bucket, object_name, content_type=None):
     """Upload a file to an S3 bucket"""
@@ -22,16 +115,30 @@ def upload_to_s3(file_obj, bucket, object_name, content_type=None):
     extra_args = {}
     if content_type:
         extra_args['ContentType'] = content_type
-        
-    try:
+
+    start = file_obj.tell() if getattr(file_obj, 'seekable', lambda: False)() else None
+
+    def attempt():
+        # A retry sends the file again from the beginning
+        if start is not None:
+            file_obj.seek(start)
         s3_client.upload_fileobj(file_obj, bucket, object_name, ExtraArgs=extra_args)
-    except ClientError as e:
+
+    try:
+        resilience.call('s3', attempt, retries=3 if start is not None else 0)
+    except S3_ERRORS as e:
         logger.error(e)
         return False
+    presigned_urls.invalidate(bucket, object_name)
     return True
 
 def generate_presigned_url(bucket, object_name, expiration=3600, response_content_type=None):
-    """Generate a presigned URL to share an S3 object"""
+    """Generate a presigned URL to share an S3 object (cached, see PresignedUrlCache)"""
+    cache_key = (bucket, object_name, response_content_type, expiration)
+    url = presigned_urls.get(cache_key)
+    if url:
+        return url
+
     s3_client = get_s3_client()
     try:
         params = {'Bucket': bucket, 'Key': object_name}
@@ -44,51 +151,143 @@ def generate_presigned_url(bucket, object_name, expiration=3600, response_conten
     except ClientError as e:
         logger.error(e)
         return None
+    presigned_urls.put(cache_key, response, expiration)
     return response
 
 def download_from_s3(bucket, object_name, file_name):
     """Download a file from S3"""
     s3_client = get_s3_client()
     try:
-        s3_client.download_file(bucket, object_name, file_name)
-    except ClientError as e:
+        resilience.call('s3', s3_client.download_file, bucket, object_name, file_name)
+    except S3_ERRORS as e:
+        logger.error(e)
+        return False
+    return True
+
+def delete_from_s3(bucket, object_name):
+    """Delete an object from S3"""
+    s3_client = get_s3_client()
+    try:
+        resilience.call('s3', s3_client.delete_object, Bucket=bucket, Key=object_name)
+    except S3_ERRORS as e:
         logger.error(e)
         return False
+    presigned_urls.invalidate(bucket, object_name)
     return True
 
-def generate_with_retry(model, content, retries=3, initial_delay=1):
+def generate_with_retry(model, content, retries=3, initial_delay=1, lane='batch', deadline=None):
     """
-    Generates content using the Gemini model with retry logic for rate limits (429).
+    Generates content using the Gemini model. Each attempt is admitted by the shared
+    rate limiter (see ratelimit.py) in the given lane and bounded by the per-call
+    timeout and the deadline (see resilience.py). Transient errors and 429s are
+    retried with backoff or the server's Retry-After; after a 429 every caller is
+    held back while this one waits.
     """
+    from .ratelimit import gemini_limiter, estimate_tokens
+    deadline = deadline or resilience.current_deadline()
+    breaker = resilience.breakers['gemini']
+    estimate = estimate_tokens(content)
     delay = initial_delay
     for attempt in range(retries + 1):
+        if deadline is not None and deadline.expired:
+            raise resilience.DeadlineExceeded("Gemini request abandoned, deadline passed")
+        gemini_limiter.acquire(lane, estimate, honor_pause=attempt == 0)
+        probe = False
         try:
-            return model.generate_content(content)
+            probe = breaker.before_call()
+            response = model.generate_content(
+                content, request_options={"timeout": resilience.call_timeout('gemini', deadline)})
         except Exception as e:
-            # Check for 429 or ResourceExhausted
-            is_rate_limit = "429" in str(e) or "Resource exhausted" in str(e)
-            
-            if is_rate_limit and attempt < retries:
-                sleep_time = delay + random.uniform(0, 1)
-                logger.warning(f"Rate limit hit. Retrying in {sleep_time:.2f}s (Attempt {attempt+1}/{retries})")
-                time.sleep(sleep_time)
-                delay *= 2 # Exponential backoff
-            else:
-                raise e
-
-def download_youtube_video(url, output_path):
+            sleep_time = resilience.backoff('gemini', e, attempt, retries, delay, deadline)
+            if sleep_time is None:
+                raise
+            logger.warning(f"Gemini {resilience.classify(e)} error. Retrying in {sleep_time:.2f}s (Attempt {attempt+1}/{retries})")
+            if resilience.classify(e) == resilience.RATE_LIMIT:
+                gemini_limiter.pause(sleep_time)
+            time.sleep(sleep_time)
+            delay *= 2 # Exponential backoff
+            continue
+        except BaseException:
+            if probe:
+                breaker.release_probe()
+            raise
+        breaker.record_success()
+        gemini_limiter.settle(estimate, response)
+        return response
+
+# Yielded by stream_with_retry when a stream failed part-way and is started over
+STREAM_RESTART = object()
+
+def stream_with_retry(model, content, retries=3, initial_delay=1, lane='batch', deadline=None):
     """
-    Downloads a YouTube video using yt-dlp.
-    Returns the filename if successful, None otherwise.
+    Streams generated text chunk by chunk, with the same rate limiting, deadline and
+    retries as generate_with_retry. A stream cut off after some text was sent is
+    retried from the start; STREAM_RESTART is yielded first so the consumer can
+    discard the partial text.
+    """
+    from .ratelimit import gemini_limiter, estimate_tokens
+    deadline = deadline or resilience.current_deadline()
+    breaker = resilience.breakers['gemini']
+    estimate = estimate_tokens(content)
+    delay = initial_delay
+    for attempt in range(retries + 1):
+        if deadline is not None and deadline.expired:
+            raise resilience.DeadlineExceeded("Gemini request abandoned, deadline passed")
+        gemini_limiter.acquire(lane, estimate, honor_pause=attempt == 0)
+        sent = False
+        last = None
+        probe = False
+        try:
+            probe = breaker.before_call()
+            for chunk in model.generate_content(
+                    content, stream=True, request_options={"timeout": resilience.call_timeout('gemini', deadline)}):
+                last = chunk
+                text = getattr(chunk, 'text', '')
+                if text:
+                    sent = True
+                    yield text
+        except Exception as e:
+            sleep_time = resilience.backoff('gemini', e, attempt, retries, delay, deadline)
+            if sleep_time is None:
+                raise
+            logger.warning(f"Gemini {resilience.classify(e)} error mid-stream. Retrying in {sleep_time:.2f}s (Attempt {attempt+1}/{retries})")
+            if resilience.classify(e) == resilience.RATE_LIMIT:
+                gemini_limiter.pause(sleep_time)
+            time.sleep(sleep_time)
+            delay *= 2
+            if sent:
+                yield STREAM_RESTART
+            continue
+        except BaseException:
+            # The consumer closed the stream (e.g. the client disconnected): no outcome,
+            # but the probe must not stay taken
+            if probe:
+                breaker.release_probe()
+            raise
+        breaker.record_success()
+        # Usage is reported on the final chunk
+        gemini_limiter.settle(estimate, last)
+        return
+
+def download_youtube_video(url, output_path, format_spec=None, progress_hook=None, max_filesize=None):
+    """
+    Downloads a YouTube video using yt-dlp, in the format selected by format_spec
+    (see youtube.format_spec). progress_hook receives yt-dlp's progress dicts.
+    Returns True if successful; raises the download error otherwise.
     """
     import yt_dlp
     
     ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'format': format_spec or 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'merge_output_format': 'mp4',
         'outtmpl': output_path,
         'quiet': False, # Enable output for debugging
         'no_warnings': False,
         'nocheckcertificate': True,
+        'socket_timeout': resilience.CALL_TIMEOUT['youtube'],
+        'progress_hooks': [progress_hook] if progress_hook else [],
+        # Formats larger than this are skipped, and a download that grows past it is aborted
+        'max_filesize': max_filesize,
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -122,15 +321,19 @@ def download_youtube_video(url, output_path):
         except Exception as e:
             logger.error(f"Failed to create cookie file: {e}")
 
-    try:
-        logger.info(f"Starting YouTube download for URL: {url}")
+    def attempt():
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             ydl.download([url])
+
+    try:
+        logger.info(f"Starting YouTube download for URL: {url}")
+        # yt-dlp resumes a partial download on retry
+        resilience.call('youtube', attempt, retries=2, initial_delay=5)
         logger.info("YouTube download completed successfully")
         return True
     except Exception as e:
         logger.error(f"Error downloading YouTube video: {e}")
-        return False
+        raise
     finally:
         # Cleanup cookie file
         if cookie_file_path and os.path.exists(cookie_file_path):
@@ -0,0 +1,271 @@
+import os
+import io
+import re
+import json
+import shutil
+import zlib
+import threading
+import logging
+import numpy as np
+from .locks import host_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.getenv('VECTOR_INDEX_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'vector_index'))
+
+# Rows scored per matrix product, bounds memory on very long transcripts
+SCORE_BATCH = 65536
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: unigrams and bigrams hashed into a fixed number of buckets with
+    sublinear term frequency, L2 normalised. IDF weighting is applied at query time by
+    NumpyCollection, which keeps the document frequencies.
+    Any object with `dim` and `embed(texts) -> float32 array (n, dim)` can replace it.
+    """
+
+    def __init__(self, dim=2048):
+        self.dim = dim
+
+    def features(self, text):
+        tokens = _TOKEN.findall(text.lower())
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return [zlib.crc32(g.encode()) % self.dim for g in grams]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, counts = np.unique(self.features(text), return_counts=True)
+            if len(buckets):
+                matrix[row, buckets] = 1.0 + np.log(counts)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def _append_rows(path, rows):
+    """
+    Appends rows to a 2-D .npy file in place. numpy pads .npy headers so the first
+    axis can grow without moving the data; if the header would change size the file
+    is rewritten instead.
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.float32)
+    if not os.path.exists(path):
+        np.save(path, rows)
+        return
+
+    with open(path, 'r+b') as fp:
+        np.lib.format.read_magic(fp)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        header_len = fp.tell()
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': fortran_order,
+            'shape': (shape[0] + rows.shape[0], shape[1]),
+        })
+        if len(header.getvalue()) == header_len:
+            fp.seek(0, os.SEEK_END)
+            fp.write(rows.tobytes())
+            fp.seek(0)
+            fp.write(header.getvalue())
+            return
+
+    existing = np.load(path)
+    _save_atomic(path, np.vstack([existing, rows]))
+
+
+def _stamp(path):
+    """Identifies a file's current contents (None if missing), to notice another process's writes."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _save_atomic(path, array):
+    """Writes an .npy file by replacing it, so a concurrent reader never sees it half written."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class _Shard:
+    """Vectors and documents of one index key (one video)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, 'vectors.npy')
+        self.docs_path = os.path.join(directory, 'docs.jsonl')
+        self._vectors = None
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.ids.append(record['id'])
+                    self.documents.append(record['document'])
+                    self.metadatas.append(record['metadata'])
+        self.id_set = set(self.ids)
+        self.stamp = _stamp(self.docs_path)
+
+    def vectors(self):
+        if self._vectors is None and os.path.exists(self.vectors_path):
+            self._vectors = np.load(self.vectors_path, mmap_mode='r')
+        return self._vectors
+
+    def append(self, ids, documents, metadatas, vectors):
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors = None  # drop the old map before the file grows
+        _append_rows(self.vectors_path, vectors)
+        with open(self.docs_path, 'a') as f:
+            for id_, doc, meta in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": id_, "document": doc, "metadata": meta}) + "\n")
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+        self.id_set.update(ids)
+        self.stamp = _stamp(self.docs_path)
+
+
+class NumpyCollection:
+    """
+    Embedded stand-in for a ChromaDB collection with the same add/query/delete surface.
+    Each `video_id` gets its own memory-mapped matrix, so a filtered query only touches
+    that video's rows; scoring is a batched cosine similarity with top-k selection.
+
+    Every web and job worker process opens the same directory: writes hold a host-wide
+    file lock, and shards and document frequencies are reloaded when their files
+    change under this process.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, embedder=None, partition_key='video_id'):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.partition_key = partition_key
+        self._lock = threading.RLock()
+        self._shards = {}
+        self._df_path = os.path.join(path, 'df.npy')
+        self._lock_path = os.path.join(path, 'index.lock')
+        self._df_stamp = None
+        os.makedirs(path, exist_ok=True)
+        # Document frequency per bucket; the last slot holds the document count
+        self._df = np.zeros(self.embedder.dim + 1, dtype=np.int64)
+        self._load_df()
+
+    def _load_df(self):
+        stamp = _stamp(self._df_path)
+        if stamp != self._df_stamp:
+            self._df = (np.load(self._df_path) if stamp
+                        else np.zeros(self.embedder.dim + 1, dtype=np.int64))
+            self._df_stamp = stamp
+
+    def _save_df(self):
+        _save_atomic(self._df_path, self._df)
+        self._df_stamp = _stamp(self._df_path)
+
+    def _shard(self, key):
+        shard = self._shards.get(key)
+        if shard is None or _stamp(shard.docs_path) != shard.stamp:
+            safe = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+            shard = _Shard(os.path.join(self.path, safe))
+            self._shards[key] = shard
+        return shard
+
+    def _keys(self):
+        return [name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name))]
+
+    def add(self, documents, metadatas, ids):
+        vectors = self.embedder.embed(documents)
+        with self._lock, host_lock(self._lock_path):
+            self._load_df()
+            groups = {}
+            for row, (doc, meta, id_) in enumerate(zip(documents, metadatas, ids)):
+                key = str(meta.get(self.partition_key, '_'))
+                if id_ in self._shard(key).id_set:
+                    continue
+                groups.setdefault(key, []).append(row)
+
+            for key, rows in groups.items():
+                self._shard(key).append([ids[r] for r in rows], [documents[r] for r in rows],
+                                        [metadatas[r] for r in rows], vectors[rows])
+                self._df[:-1] += (vectors[rows] > 0).sum(axis=0)
+                self._df[-1] += len(rows)
+            if groups:
+                self._save_df()
+
+    def _idf(self):
+        total = max(int(self._df[-1]), 1)
+        return np.log((1 + total) / (1 + self._df[:-1])).astype(np.float32) + 1.0
+
+    def query(self, query_texts, n_results=10, where=None):
+        with self._lock:
+            self._load_df()
+            queries = self.embedder.embed(query_texts) * self._idf()
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            queries /= norms
+
+            if where and self.partition_key in where:
+                keys = [str(where[self.partition_key])]
+            else:
+                keys = self._keys()
+            extra = {k: v for k, v in (where or {}).items() if k != self.partition_key}
+
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            candidates = [[] for _ in query_texts]
+            for key in keys:
+                shard = self._shard(key)
+                matrix = shard.vectors()
+                if matrix is None:
+                    continue
+                rows = min(len(shard.ids), matrix.shape[0])
+                for start in range(0, rows, SCORE_BATCH):
+                    block = np.asarray(matrix[start:min(rows, start + SCORE_BATCH)])
+                    scores = queries @ block.T
+                    for q, row_scores in enumerate(scores):
+                        k = min(n_results, len(row_scores))
+                        top = np.argpartition(-row_scores, k - 1)[:k]
+                        for i in top:
+                            meta = shard.metadatas[start + i]
+                            if row_scores[i] <= 0 or any(meta.get(f) != v for f, v in extra.items()):
+                                continue
+                            candidates[q].append((float(row_scores[i]), shard, start + i))
+
+            for hits in candidates:
+                hits = sorted(hits, key=lambda h: -h[0])[:n_results]
+                result["ids"].append([shard.ids[i] for _, shard, i in hits])
+                result["documents"].append([shard.documents[i] for _, shard, i in hits])
+                result["metadatas"].append([shard.metadatas[i] for _, shard, i in hits])
+                result["distances"].append([1.0 - score for score, _, _ in hits])
+            return result
+
+    def delete(self, where=None):
+        """Drops a whole video's segments (where={'video_id': ...})."""
+        if not where or self.partition_key not in where:
+            raise ValueError(f"delete needs a '{self.partition_key}' filter")
+        with self._lock, host_lock(self._lock_path):
+            self._load_df()
+            key = str(where[self.partition_key])
+            shard = self._shard(key)
+            matrix = shard.vectors()
+            if matrix is not None:
+                self._df[:-1] -= (np.asarray(matrix) > 0).sum(axis=0)
+                self._df[-1] -= matrix.shape[0]
+                self._save_df()
+            shard._vectors = None
+            self._shards.pop(key, None)
+            shutil.rmtree(shard.directory, ignore_errors=True)
+
+    def count(self):
+        with self._lock:
+            self._load_df()
+            return int(self._df[-1])
@@ -0,0 +1,38 @@
+"""
+Dedicated job worker, for deployments whose web processes only enqueue:
+
+    JOB_WORKERS=0 gunicorn -c gunicorn.conf.py 'backend.app:create_app()'
+    JOB_WORKERS=4 python -m backend.worker
+
+Jobs are shared through the database backend, so any number of these can run
+next to any number of web workers.
+"""
+import signal
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    from .app import create_app
+    from . import jobs
+
+    app = create_app()
+    queue = jobs.job_queue
+    if app.config['JOB_BACKEND'] != 'database' or not queue.workers:
+        raise SystemExit("backend.worker needs JOB_BACKEND=database and JOB_WORKERS > 0")
+
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: stopping.set())
+
+    queue.start()
+    logger.info(f"Job worker running {queue.workers} workers ({queue.mode} mode)")
+    stopping.wait()
+    logger.info("Job worker stopping")
+    queue.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from flask import current_app
+from .extensions import db
+from .models import Video
+from .dedup import find_content, hash_stream, store_content, attach_video
+from .status import bump_status_version
+
+logger = logging.getLogger(__name__)
+
+# Format cap: the tallest video stream fetched, and optionally its total bitrate (kbit/s)
+MAX_HEIGHT = int(os.getenv('YOUTUBE_MAX_HEIGHT', 720))
+MAX_TBR = int(os.getenv('YOUTUBE_MAX_TBR', 0))
+# Downloads larger than this are refused (bytes, 0 for no limit)
+MAX_FILESIZE = int(os.getenv('YOUTUBE_MAX_FILESIZE', 2 * 1024 ** 3))
+# Fetch only the audio track: smallest download, but visuals can never be requested later
+AUDIO_FORMAT = os.getenv('YOUTUBE_DOWNLOAD_AUDIO_ONLY', '0').lower() in ('1', 'true', 'yes')
+# Downloads running at once in this process; further jobs wait for a slot
+MAX_CONCURRENT = int(os.getenv('YOUTUBE_MAX_CONCURRENT', 2))
+# Progress is written (and pushed to the status stream) at most this often
+PROGRESS_INTERVAL = float(os.getenv('YOUTUBE_PROGRESS_INTERVAL', 2.0))
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+
+
+def format_spec(max_height=None, max_tbr=None, audio=None):
+    """yt-dlp format selector honouring the caps, falling back to the best capped single file."""
+    max_height = MAX_HEIGHT if max_height is None else max_height
+    max_tbr = MAX_TBR if max_tbr is None else max_tbr
+    audio = AUDIO_FORMAT if audio is None else audio
+    if audio:
+        return 'bestaudio[ext=m4a]/bestaudio'
+    cap = f"[height<={max_height}]" if max_height else ""
+    if max_tbr:
+        cap += f"[tbr<={max_tbr}]"
+    return (f"bestvideo{cap}[ext=mp4]+bestaudio[ext=m4a]/best{cap}[ext=mp4]/"
+            f"bestvideo{cap}+bestaudio/best{cap}/worst")
+
+
+class ProgressReporter:
+    """
+    yt-dlp progress hook that stores the download's overall percent on the video.
+    A video+audio download is two files in a row; progress covers both, weighted by
+    their announced sizes. Writes are throttled to PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, video, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.video = video
+        self.interval = interval
+        self._clock = clock
+        self._done_bytes = 0
+        self._last_write = None
+        self.percent = 0
+
+    def _expected(self, status):
+        info = status.get('info_dict') or {}
+        formats = info.get('requested_formats') or [info]
+        expected = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+        return expected or status.get('total_bytes') or status.get('total_bytes_estimate')
+
+    def __call__(self, status):
+        if status.get('status') == 'finished':
+            self._done_bytes += status.get('total_bytes') or status.get('downloaded_bytes') or 0
+            return
+        if status.get('status') != 'downloading':
+            return
+        expected = self._expected(status)
+        if not expected:
+            return
+        percent = min(99, int((self._done_bytes + (status.get('downloaded_bytes') or 0)) * 100 / expected))
+        now = self._clock()
+        if percent <= self.percent or (self._last_write is not None and now - self._last_write < self.interval):
+            return
+        self.percent = percent
+        self._last_write = now
+        set_progress(self.video, percent)
+
+
+def set_progress(video, percent, status='downloading'):
+    video.status = status
+    video.download_progress = percent
+    bump_status_version([video])
+    db.session.commit()
+
+
+def _register(video, content, created, audio_only):
+    """Attaches the downloaded content to the video and queues processing, like a file upload."""
+    from . import jobs
+    needs_processing = attach_video(video, content, created)
+    video.download_progress = None
+    bump_status_version([video])
+    db.session.commit()
+    if needs_processing:
+        payload = {'audio_only': audio_only} if audio_only is not None else None
+        jobs.job_queue.enqueue('process_video', video.id, payload=payload)
+
+
+def _download(video, url):
+    """Downloads into the upload folder; returns the local path. Raises on failure."""
+    from .utils import download_youtube_video
+    ext = '.m4a' if AUDIO_FORMAT else '.mp4'
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"youtube_{uuid.uuid4().hex}{ext}")
+    set_progress(video, 0)
+    try:
+        download_youtube_video(url, path, format_spec=format_spec(), progress_hook=ProgressReporter(video),
+                               max_filesize=MAX_FILESIZE or None)
+    except Exception:
+        for leftover in (path, path + '.part'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if not os.path.exists(path):
+        # yt-dlp skips (without raising) a download over max_filesize
+        raise ValueError(f"No format of {url} fits the download size limit")
+    return path
+
+
+def ingest_youtube(video_id, app_context, url, content_key=None, audio_only=None):
+    """
+    Background task: downloads a YouTube link into storage, then hands the video to
+    process_video. At most MAX_CONCURRENT downloads run at once per process.
+    """
+    with app_context:
+        video = Video.query.get(video_id)
+        # Redelivered after the download was already registered
+        if not video or video.content_id:
+            return
+
+        with _slots:
+            # Someone may have added the same video while this job was queued
+            content = find_content(content_key) if content_key else None
+            if content:
+                _register(video, content, False, audio_only)
+                return
+
+            try:
+                path = _download(video, url)
+            except Exception as e:
+                logger.error(f"YouTube download of {url} failed: {e}")
+                from .processing import _retry_later
+                if _retry_later(e):
+                    set_progress(video, None, status='pending')
+                    raise
+                set_progress(video, None, status='failed')
+                return
+
+        if not content_key:
+            with open(path, 'rb') as f:
+                content_key, _ = hash_stream(f)
+        content_type = 'audio/mp4' if path.endswith('.m4a') else 'video/mp4'
+        stored = store_content(path, os.path.basename(path), content_key, content_type, source_url=url)
+        if not stored:
+            set_progress(video, None, status='failed')
+            return
+        video.filename = os.path.basename(path)
+        _register(video, *stored, audio_only)
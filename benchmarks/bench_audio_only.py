@@ -0,0 +1,96 @@
+"""
+Upload size and time to a usable Gemini file, for the full video vs its extracted
+audio track (INGEST_AUDIO_ONLY).
+
+    python benchmarks/bench_audio_only.py --input lecture.mp4 --mbps 20
+    python benchmarks/bench_audio_only.py --duration 600 --gemini
+
+Without --input a test clip (720p test pattern with a tone) of --duration seconds is
+generated with ffmpeg. Upload time is estimated from --mbps; with --gemini (and
+GOOGLE_API_KEY set) both files are really uploaded and the wait until Gemini reports
+them ACTIVE is measured too, then the files are deleted.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import media
+
+
+def make_clip(path, duration):
+    subprocess.run([media.FFMPEG, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f"testsrc2=size=1280x720:rate=30:duration={duration}",
+                    '-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}",
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-shortest', path], check=True)
+
+
+def gemini_seconds(path, mime_type):
+    import google.generativeai as genai
+    started = time.perf_counter()
+    handle = genai.upload_file(path=path, mime_type=mime_type)
+    uploaded = time.perf_counter()
+    while handle.state.name == "PROCESSING":
+        time.sleep(2)
+        handle = genai.get_file(handle.name)
+    active = time.perf_counter()
+    genai.delete_file(handle.name)
+    return round(uploaded - started, 2), round(active - uploaded, 2), handle.state.name
+
+
+def measure(mode, video_path, workdir, args):
+    started = time.perf_counter()
+    path, mime_type = video_path, None
+    if mode == 'audio':
+        path, mime_type = media.extract_audio(video_path, os.path.join(workdir, 'audio.ogg')), media.AUDIO_MIME_TYPE
+    prepare = time.perf_counter() - started
+
+    size = os.path.getsize(path)
+    result = {
+        "bytes": size,
+        "prepare_s": round(prepare, 2),
+        "est_upload_s": round(size * 8 / (args.mbps * 1e6), 2),
+    }
+    if args.gemini:
+        upload, processing, state = gemini_seconds(path, mime_type)
+        result.update(upload_s=upload, processing_s=processing, state=state,
+                      end_to_end_s=round(prepare + upload + processing, 2))
+    else:
+        result["end_to_end_s"] = round(prepare + result["est_upload_s"], 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', help="video file (default: generate a test clip)")
+    parser.add_argument('--duration', type=int, default=600, help="seconds of generated clip")
+    parser.add_argument('--mbps', type=float, default=20.0, help="uplink used to estimate upload time")
+    parser.add_argument('--gemini', action='store_true', help="really upload both files to Gemini")
+    args = parser.parse_args()
+
+    if not media.available():
+        sys.exit("ffmpeg and ffprobe are required")
+    if args.gemini:
+        from backend.gemini_files import configure_gemini
+        if not configure_gemini():
+            sys.exit("--gemini needs GOOGLE_API_KEY")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = args.input
+        if not video_path:
+            video_path = os.path.join(workdir, 'clip.mp4')
+            make_clip(video_path, args.duration)
+
+        results = {mode: measure(mode, video_path, workdir, args) for mode in ('video', 'audio')}
+    for mode, result in results.items():
+        print(f"{mode}:".ljust(7), result)
+    print("size ratio:", round(results["video"]["bytes"] / results["audio"]["bytes"], 1))
+    print("end-to-end speedup:", round(results["video"]["end_to_end_s"] / results["audio"]["end_to_end_s"], 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Chunking / indexing benchmark over synthetic multi-hour transcripts.
+
+    python benchmarks/bench_chunker.py --hours 4
+
+Transcripts mix the timestamp styles Gemini produces (hh:mm:ss, mm:ss, bracketed
+seconds ranges, markdown bullets, untimed continuation lines).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.chunking import chunk_transcript, batched
+from backend.vector_index import NumpyCollection
+
+WORDS = ("the algorithm pivot array partition merge recursion complexity stack queue graph "
+         "vertex edge weight shortest path dynamic programming memo table proof induction").split()
+
+
+def synthetic_transcript(hours, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    t = 0.0
+    while t < hours * 3600:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25)))
+        h, rest = divmod(int(t), 3600)
+        m, s = divmod(rest, 60)
+        style = rng.randrange(5)
+        if style == 0:
+            lines.append(f"[{h:02d}:{m:02d}:{s:02d}] {text}")
+        elif style == 1:
+            lines.append(f"- **{h * 60 + m:02d}:{s:02d}** {text}")
+        elif style == 2:
+            lines.append(f"[{t:.1f}s -> {t + 5:.1f}s] {text}")
+        elif style == 3:
+            lines.append(f"* ({h}:{m:02d}:{s:02d}) Speaker 1: {text}")
+        else:
+            lines.append(text)  # untimed continuation
+        t += rng.uniform(3, 8)
+    return "\n".join(lines)
+
+
+def bench(hours, batch_size):
+    transcript = synthetic_transcript(hours)
+    line_count = transcript.count("\n") + 1
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = list(chunk_transcript(transcript))
+    chunk_time = time.perf_counter() - start
+    _, chunk_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {}
+    for label, size in (("single add", len(chunks)), (f"batches of {batch_size}", batch_size)):
+        with tempfile.TemporaryDirectory() as path:
+            collection = NumpyCollection(path=path)
+            tracemalloc.start()
+            start = time.perf_counter()
+            for batch in batched(chunks, size):
+                collection.add(
+                    documents=[c["text"] for c in batch],
+                    metadatas=[{"video_id": "1", "start_time": c["start_time"], "end_time": c["end_time"]}
+                               for c in batch],
+                    ids=[f"1_{c['index']}" for c in batch],
+                )
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            for _ in range(20):
+                collection.query(query_texts=["shortest path dynamic programming"], n_results=6,
+                                 where={"video_id": "1"})
+            query_ms = (time.perf_counter() - start) / 20 * 1000
+            results[label] = (elapsed, peak, query_ms)
+
+    print(f"{hours}h transcript: {line_count} lines, {len(transcript) / 1e6:.1f} MB text")
+    print(f"  chunking: {len(chunks)} chunks in {chunk_time * 1000:.0f} ms "
+          f"({line_count / chunk_time:,.0f} lines/s, peak {chunk_peak / 1e6:.1f} MB)")
+    for label, (elapsed, peak, query_ms) in results.items():
+        print(f"  index ({label}): {elapsed * 1000:.0f} ms, peak {peak / 1e6:.1f} MB, "
+              f"query {query_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=float, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--batch-size', type=int, default=128)
+    args = parser.parse_args()
+    for hours in args.hours:
+        bench(hours, args.batch_size)
@@ -0,0 +1,171 @@
+"""
+Load test of the serving model: Q&A throughput as gunicorn workers and threads grow.
+
+    python benchmarks/bench_serving.py --clients 32 --seconds 10 --latency 1.0
+
+Each profile starts gunicorn with gunicorn.conf.py (worker class, processes and
+threads set through its environment variables) on a scratch SQLite database
+holding one user and one processed video. Clients log in and POST questions to
+/video/<id>/qa. Gemini is replaced by a sleep of --latency seconds, which is what
+blocks a sync worker, so no API key or network is needed.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+import urllib.parse
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name: (worker class, processes, threads)
+PROFILES = {
+    "sync-1": ("sync", 1, 1),
+    "gthread-1x8": ("gthread", 1, 8),
+    "gthread-2x8": ("gthread", 2, 8),
+    "gthread-4x8": ("gthread", 4, 8),
+}
+
+USERNAME, PASSWORD = "bench", "bench"
+
+
+def create_app():
+    """gunicorn entry point for the benchmark: the real app with Gemini answers faked."""
+    from backend.app import create_app as create_real_app
+    from backend import answer_cache
+
+    latency = float(os.environ['BENCH_GEMINI_LATENCY'])
+
+    def fake_ask(video, question):
+        time.sleep(latency)
+        return {"text": f"Answer to {question}", "timestamps": []}
+
+    answer_cache.cached_ask = fake_ask
+    return create_real_app()
+
+
+def seed(database_url):
+    """One user and one processed video; returns the video id."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['JOB_WORKERS'] = '0'
+    from backend.app import create_app as create_real_app
+    from backend.extensions import db
+    from backend.models import User, Video
+
+    app = create_real_app()
+    with app.app_context():
+        user = User(username=USERNAME)
+        user.set_password(PASSWORD)
+        video = Video(title="Lecture", filename="lecture.mp4", status="completed",
+                      transcript="[0s] welcome", author=user)
+        db.session.add_all([user, video])
+        db.session.commit()
+        return video.id
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(profile, port, env):
+    worker_class, processes, threads = PROFILES[profile]
+    env = dict(env, PORT=str(port), GUNICORN_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(processes), GUNICORN_THREADS=str(threads))
+    server = subprocess.Popen(
+        ["gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "--pythonpath", os.path.join(ROOT, "benchmarks"),
+         "--log-level", "warning", "bench_serving:create_app()"],
+        cwd=ROOT, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({profile}) did not come up")
+
+
+def client(base, video_id, stop, latencies, errors, lock):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    opener.open(f"{base}/login", data=urllib.parse.urlencode(
+        {"username": USERNAME, "password": PASSWORD}).encode(), timeout=30)
+    n = 0
+    while not stop.is_set():
+        n += 1
+        body = json.dumps({"question": f"question {threading.get_ident()} {n}"}).encode()
+        request = urllib.request.Request(f"{base}/video/{video_id}/qa", data=body,
+                                         headers={"Content-Type": "application/json"})
+        started = time.perf_counter()
+        try:
+            with opener.open(request, timeout=120) as response:
+                ok = "text" in json.loads(response.read())
+        except Exception:
+            ok = False
+        finished = time.perf_counter()
+        with lock:
+            (latencies if ok else errors).append((finished, finished - started))
+
+
+def run_profile(profile, args, env, video_id):
+    port = free_port()
+    server = start_server(profile, port, env)
+    stop, lock = threading.Event(), threading.Lock()
+    latencies, errors = [], []
+    clients = [threading.Thread(target=client, args=(f"http://127.0.0.1:{port}", video_id, stop,
+                                                      latencies, errors, lock), daemon=True)
+               for _ in range(args.clients)]
+    try:
+        for thread in clients:
+            thread.start()
+        window_start = time.perf_counter()
+        time.sleep(args.seconds)
+        window_end = time.perf_counter()
+        stop.set()
+        for thread in clients:
+            thread.join(timeout=args.latency + 30)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    # Only requests that completed inside the window; the rest were still queued
+    latencies = sorted(elapsed for finished, elapsed in latencies if window_start <= finished <= window_end)
+    return {
+        "requests_per_s": round(len(latencies) / args.seconds, 2),
+        "p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 3) if latencies else None,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--latency', type=float, default=1.0, help="simulated Gemini answer time")
+    parser.add_argument('--profiles', default=",".join(PROFILES))
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    database_url = "sqlite:///" + os.path.join(scratch, "bench.db")
+    video_id = seed(database_url)
+    env = dict(os.environ, DATABASE_URL=database_url, JOB_WORKERS="0", JOB_BACKEND="database",
+               BENCH_GEMINI_LATENCY=str(args.latency),
+               GEMINI_RATE_LIMIT_FILE=os.path.join(scratch, "rate-limit.json"))
+
+    for profile in args.profiles.split(","):
+        print(f"{profile:14}", run_profile(profile, args, env, video_id), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Worker boot cost: cold import of backend.app, create_app() and the first request,
+each measured in a fresh interpreter (what every gunicorn worker and test run pays).
+
+    python benchmarks/bench_startup.py --runs 5
+
+The app gets an in-memory database and a dummy GOOGLE_API_KEY, so nothing talks to
+Gemini, ChromaDB or S3; before the factory, importing backend.rag listed the Gemini
+models over the network at this point.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, tempfile, time
+started = time.perf_counter()
+import backend.app
+imported = time.perf_counter()
+app = backend.app.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'JOB_BACKEND': 'local',
+                              'UPLOAD_FOLDER': tempfile.mkdtemp()})
+created = time.perf_counter()
+status = app.test_client().get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "create_app_s": created - imported,
+    "first_request_s": served - created,
+    "total_s": served - started,
+    "status": status,
+    "heavy_modules": [m for m in ('google.generativeai', 'chromadb', 'boto3', 'numpy') if m in sys.modules],
+}))
+"""
+
+
+def measure_once(probe=PROBE, env=None):
+    """Runs the probe in a new interpreter and returns its timings."""
+    env = dict(os.environ, GOOGLE_API_KEY=os.getenv('GOOGLE_API_KEY', 'bench'), **(env or {}))
+    output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    for key in ("import_s", "create_app_s", "first_request_s", "total_s"):
+        values = [run[key] for run in runs]
+        print(f"{key:16} p50={statistics.median(values) * 1000:8.1f}ms  max={max(values) * 1000:8.1f}ms")
+    print("heavy modules loaded:", runs[-1]["heavy_modules"] or "none")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+S3 URL cost of a view_video page load, before and after the shared client and
+presigned URL cache.
+
+    python benchmarks/bench_view_video.py --requests 200
+
+"before" builds a new boto3 client per call (what get_s3_client() used to do) and
+signs a fresh URL; "after" goes through backend.utils. Signing is local, so no
+bucket or network access is needed; dummy credentials are used if none are set.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+
+from backend import utils
+
+
+def old_presigned_url(bucket, key, content_type):
+    client = boto3.client(
+        's3',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION', 'us-east-1')
+    )
+    return client.generate_presigned_url('get_object', ExpiresIn=3600, Params={
+        'Bucket': bucket, 'Key': key, 'ResponseContentType': content_type})
+
+
+def new_presigned_url(bucket, key, content_type):
+    return utils.generate_presigned_url(bucket, key, response_content_type=content_type)
+
+
+def measure(fn, requests, videos):
+    timings = []
+    for i in range(requests):
+        key = f"uploads/{i % videos:04d}.mp4"
+        started = time.perf_counter()
+        fn("bench-bucket", key, "video/mp4")
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "total_ms": round(sum(timings), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--videos', type=int, default=20, help="distinct videos viewed")
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+    print("before:", measure(old_presigned_url, args.requests, args.videos))
+    utils.reset_s3_client()
+    print("after: ", measure(new_presigned_url, args.requests, args.videos))
+    print("cache: ", utils.presigned_urls.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# Serving profile: several worker processes, each serving requests on a thread pool,
+# so a question waiting seconds on Gemini (or a long-polled status request) holds one thread
+# instead of the whole server.
+#
+#     gunicorn -c gunicorn.conf.py 'backend.app:create_app()'
+#
+# Shared state lives in the database (jobs, statuses) or in files every worker opens
+# (GEMINI_RATE_LIMIT_FILE), so workers can be added freely. Caches are per process.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# gthread by default; gevent also works when installed (pip install gevent)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Request threads per worker (gthread), or greenlets per worker (gevent)
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker builds its own app after the fork: job threads, the Gemini poller and
+# database connections must not be shared between processes
+preload_app = False
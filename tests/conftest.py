@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+
+class Clock:
+    """A clock for code taking a `clock` callable; tests move `now` by hand."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def clock_fixture():
+    """Monotonic-style clock in seconds, starting at 0."""
+    return Clock(0.0)
+
+
+@pytest.fixture(name="utc_clock")
+def utc_clock_fixture():
+    """Wall clock returning aware UTC datetimes."""
+    return Clock(datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+
+@pytest.fixture(name="gemini_file")
+def gemini_file_fixture():
+    """Builds stand-ins for Gemini file handles: gemini_file(name, state="ACTIVE", expiration_time=None)."""
+    def make(name, state="ACTIVE", expiration_time=None):
+        return SimpleNamespace(name=name, uri=f"https://gemini/{name}", state=SimpleNamespace(name=state),
+                               expiration_time=expiration_time)
+    return make
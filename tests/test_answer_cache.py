@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from backend import rag
+from backend import answer_cache as cache_module
+from backend.answer_cache import AnswerCache, normalize_question, transcript_fingerprint, cached_ask
+
+
+ANSWER = {"text": "It partitions around a pivot.", "timestamps": [30.0]}
+
+
+def test_normalisation_drops_filler_but_keeps_meaning():
+    assert normalize_question("How does Quicksort partition the array?") == "how quicksort partition array"
+    assert normalize_question("Can you explain how quicksort partitions arrays, please") == \
+        "how quicksort partition array"
+    assert normalize_question("Why is it not stable?") == "why not stable"
+
+
+def test_reworded_question_hits_but_different_question_misses():
+    cache = AnswerCache()
+    cache.put("1", "How does quicksort partition the array?", "f", ANSWER)
+
+    assert cache.get("1", "how does quicksort partition an array", "f") == ANSWER
+    assert cache.get("1", "so how does quicksort partition arrays", "f") == ANSWER
+    assert cache.get("1", "How does mergesort split the array?", "f") is None
+    assert cache.get("2", "How does quicksort partition the array?", "f") is None
+    assert cache.stats() == {"entries": 1, "exact_hits": 1, "similar_hits": 1, "misses": 2, "hit_rate": 0.5}
+
+
+def test_ttl_lru_and_transcript_changes(clock):
+    cache = AnswerCache(max_entries=2, ttl=60, clock=clock)
+    cache.put("1", "what is a pivot", "f", ANSWER)
+    clock.now = 61
+    assert cache.get("1", "what is a pivot", "f") is None
+
+    cache.put("1", "what is a pivot", "f", ANSWER)
+    cache.put("1", "what is recursion", "f", ANSWER)
+    cache.put("1", "what is big o notation", "f", ANSWER)
+    assert cache.get("1", "what is a pivot", "f") is None
+    assert cache.get("1", "what is recursion", "f") == ANSWER
+
+    # A new transcript invalidates everything cached for the video
+    assert cache.get("1", "what is recursion", "g") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cached_ask_only_calls_gemini_once(monkeypatch):
+    monkeypatch.setattr(cache_module, "answer_cache", AnswerCache())
+    calls = []
+
+    def fake_ask(video, question):
+        calls.append(question)
+        return dict(ANSWER) if len(calls) == 1 else {"error": "quota"}
+
+    monkeypatch.setattr(rag, "ask_question", fake_ask)
+    video = SimpleNamespace(id=1, content_id=None, transcript="[0s] hello")
+
+    assert cached_ask(video, "What is a pivot?") == ANSWER
+    assert cached_ask(video, "what is the pivot") == dict(ANSWER, cached=True)
+    assert cached_ask(video, "what is recursion") == {"error": "quota"}
+    assert cached_ask(video, "what is recursion") == {"error": "quota"}
+    assert calls == ["What is a pivot?", "what is recursion", "what is recursion"]
+
+
+def test_fingerprint_follows_transcript():
+    a = SimpleNamespace(transcript="one")
+    b = SimpleNamespace(transcript="two")
+    assert transcript_fingerprint(a) != transcript_fingerprint(b)
+    assert transcript_fingerprint(SimpleNamespace(transcript=None)) == "0-00000000"
+
+
+def test_fingerprint_changes_when_visuals_arrive():
+    audio = SimpleNamespace(transcript="one", gemini_media="audio")
+    video = SimpleNamespace(transcript="one", gemini_media="video")
+    assert transcript_fingerprint(audio) != transcript_fingerprint(video)
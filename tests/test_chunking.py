@@ -0,0 +1,69 @@
+import pytest
+
+from backend.chunking import parse_timestamp, parse_line, iter_segments, chunk_transcript, batched
+
+
+@pytest.mark.parametrize("value,seconds", [
+    ("01:23", 83.0),
+    ("1:02:03", 3723.0),
+    ("00:01:23,456", 83.456),
+    ("12.5s", 12.5),
+    ("1h2m3s", 3723.0),
+    ("2m 5s", 125.0),
+    ("not a time", None),
+])
+def test_parse_timestamp(value, seconds):
+    assert parse_timestamp(value) == seconds
+
+
+@pytest.mark.parametrize("line,expected", [
+    ("[12.3s -> 14.5s] Hello there", (12.3, 14.5, "Hello there")),
+    ("00:01:23 Intro", (83.0, None, "Intro")),
+    ("**[00:01:23]** Bold intro", (83.0, None, "Bold intro")),
+    ("- (01:23) bullet point", (83.0, None, "bullet point")),
+    ("1. [00:10 - 00:15] numbered", (10.0, 15.0, "numbered")),
+    ("**00:00 - 00:15:** intro words", (0.0, 15.0, "intro words")),
+    ("00:00:01,000 --> 00:00:04,000", (1.0, 4.0, "")),
+    ("10 seconds later we sort", (None, None, "10 seconds later we sort")),
+    ("2010s were a decade", (None, None, "2010s were a decade")),
+    ("10 s later we see", (None, None, "10 s later we see")),
+    ("- 45s is the limit", (None, None, "45s is the limit")),
+    ("[45s] bracketed seconds", (45.0, None, "bracketed seconds")),
+    ("12.5s: after a separator", (12.5, None, "after a separator")),
+    ("* plain bullet", (None, None, "plain bullet")),
+])
+def test_parse_line_formats(line, expected):
+    assert parse_line(line) == expected
+
+
+def test_untimed_lines_inherit_time_and_srt_is_understood():
+    srt = "1\n00:00:01,000 --> 00:00:04,000\nHello and welcome.\n\n2\n00:00:04,000 --> 00:00:09,000\nToday: sorting.\nmore on sorting\n"
+    assert list(iter_segments(srt.splitlines())) == [
+        (1.0, 4.0, "Hello and welcome."),
+        (4.0, 4.0, "Today: sorting."),
+        (4.0, 4.0, "more on sorting"),
+    ]
+
+
+def test_chunks_respect_budget_and_overlap():
+    lines = [f"[{i * 10}s] sentence number {i} with a few extra words" for i in range(50)]
+    chunks = list(chunk_transcript("\n".join(lines), max_tokens=40, overlap_tokens=12))
+
+    assert [c["index"] for c in chunks] == list(range(len(chunks)))
+    assert all(len(c["text"]) // 4 <= 48 for c in chunks)
+    # Consecutive chunks share their boundary line
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current["start_time"] < previous["end_time"]
+        assert previous["text"].split(" sentence")[-1] in current["text"]
+    assert chunks[0]["start_time"] == 0.0
+    assert chunks[-1]["end_time"] == 490.0
+
+
+def test_chunker_streams_from_an_iterator():
+    lines = (f"[{i}s] line {i}" for i in range(1000))
+    first = next(chunk_transcript(lines, max_tokens=10, overlap_tokens=0))
+    assert first["start_time"] == 0.0
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,111 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backend import answer_cache, jobs, processing
+from backend.app import create_app
+from backend.extensions import db
+from backend.models import ChatMessage, User, Video
+
+JOBS = 12
+CLIENTS = 4
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.delenv("AWS_BUCKET_NAME", raising=False)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / "app.db"),
+        'UPLOAD_FOLDER': str(tmp_path / "uploads"),
+        'JOB_BACKEND': 'database',
+        'JOB_WORKERS': 4,
+    })
+    yield app
+    jobs.job_queue.stop()
+
+
+@pytest.fixture(name="gemini")
+def gemini_fixture(monkeypatch):
+    """Uploads and answers take a while, like the real thing, without any network."""
+    def upload(video, path, audio_only):
+        time.sleep(0.05)
+        return SimpleNamespace(uri=f"uri/{video.id}", name=f"files/{video.id}"), "video", 10
+
+    def gemini_done(video_id, file_name, size_bytes, on_ready=None):
+        time.sleep(0.05)
+        processing.transition(video_id, transcript="[0s] hello", status="completed")
+
+    def ask(video, question):
+        time.sleep(0.01)
+        return {"text": "answer", "timestamps": []}
+
+    monkeypatch.setattr(processing, "get_local_copy", lambda video: ("lecture.mp4", False))
+    monkeypatch.setattr(processing, "upload_to_gemini", upload)
+    monkeypatch.setattr(processing, "wait_for_gemini_file", gemini_done)
+    monkeypatch.setattr(answer_cache, "cached_ask", ask)
+
+
+def test_sqlite_runs_in_wal_mode(app):
+    with app.app_context():
+        assert db.session.execute(db.text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.session.execute(db.text("PRAGMA busy_timeout")).scalar() == 30000
+
+
+def test_jobs_and_web_traffic_share_sqlite_without_lock_errors(app, gemini):
+    with app.app_context():
+        user = User(username="student")
+        user.set_password("secret")
+        videos = [Video(title=f"v{i}", filename=f"v{i}.mp4", file_path=f"static/uploads/v{i}.mp4",
+                        status="pending", author=user) for i in range(JOBS)]
+        db.session.add_all([user, *videos])
+        db.session.commit()
+        video_ids = [video.id for video in videos]
+
+    for video_id in video_ids:
+        jobs.job_queue.enqueue('process_video', video_id)
+
+    errors = []
+    done = threading.Event()
+
+    def browse(index):
+        client = app.test_client()
+        client.post("/login", data={"username": "student", "password": "secret"})
+        n = 0
+        while not done.is_set():
+            n += 1
+            video_id = video_ids[(index + n) % JOBS]
+            for response in (client.get("/api/videos/status"),
+                             client.post(f"/video/{video_id}/qa", json={"question": f"q{index}-{n}"})):
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    def run(index):
+        try:
+            browse(index)
+        except Exception as e:
+            errors.append(repr(e))
+
+    clients = [threading.Thread(target=run, args=(i,)) for i in range(CLIENTS)]
+    for thread in clients:
+        thread.start()
+
+    def all_completed():
+        with app.app_context():
+            return Video.query.filter_by(status="completed").count() == JOBS
+
+    deadline = time.time() + 30
+    while time.time() < deadline and not all_completed():
+        time.sleep(0.05)
+    done.set()
+    for thread in clients:
+        thread.join()
+
+    assert all_completed()
+    assert errors == []
+    with app.app_context():
+        assert ChatMessage.query.filter_by(sender="ai").count() > 0
+        assert jobs.job_queue.backend.stats()['counts']['failed'] == 0
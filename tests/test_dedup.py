@@ -0,0 +1,158 @@
+import io
+
+import pytest
+from sqlalchemy import event
+from flask import Flask
+
+from backend.extensions import db
+from backend.models import TranscriptSegment, User, Video, VideoContent
+from backend.dedup import (canonical_youtube_url, spool_and_hash, hash_stream, create_content,
+                           attach_video, find_content, release_content)
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path):
+    app = Flask(__name__)
+    app.root_path = str(tmp_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s&list=PL123",
+    "https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=tracking",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+])
+def test_youtube_urls_are_canonicalised(url):
+    assert canonical_youtube_url(url) == (
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ")
+
+
+def test_unknown_url_has_no_content_key():
+    assert canonical_youtube_url("https://example.com/video.mp4") == ("https://example.com/video.mp4", None)
+
+
+def test_spool_and_hash_matches_plain_hash(tmp_path):
+    data = b"lecture" * 500000
+    dest = tmp_path / "spool.part"
+    key, size = spool_and_hash(io.BytesIO(data), str(dest), chunk_size=4096)
+    assert dest.read_bytes() == data
+    assert size == len(data)
+    assert (key, size) == hash_stream(io.BytesIO(data))
+
+
+def make_video(title):
+    user = User.query.first()
+    if user is None:
+        user = User(username="student")
+        db.session.add(user)
+        db.session.commit()
+    video = Video(title=title, filename=title, status="pending", author=user)
+    db.session.add(video)
+    return video
+
+
+def test_duplicate_upload_reuses_completed_content(app):
+    content, created = create_content("sha256:abc", file_path="static/uploads/abc.mp4")
+    first = make_video("first.mp4")
+    assert attach_video(first, content, created) is True
+    db.session.commit()
+
+    content.status = "completed"
+    content.transcript = "[0s] hello"
+    content.gemini_file_name = "files/abc"
+    db.session.commit()
+
+    again, created = create_content("sha256:abc")
+    assert created is False and again.id == content.id
+
+    second = make_video("copy.mp4")
+    assert attach_video(second, again, created) is False
+    db.session.commit()
+
+    assert second.status == "completed"
+    assert second.transcript == "[0s] hello"
+    assert second.gemini_file_name == "files/abc"
+    assert find_content("sha256:abc").ref_count == 2
+
+
+def test_in_flight_content_is_not_processed_twice(app):
+    content, created = create_content("sha256:def")
+    assert attach_video(make_video("a.mp4"), content, created) is True
+    assert attach_video(make_video("b.mp4"), content, False) is False
+
+
+def test_last_reference_removes_artifacts(app, tmp_path, monkeypatch):
+    unindexed = []
+    monkeypatch.setattr("backend.rag.delete_index", unindexed.append)
+    stored = tmp_path / "static" / "uploads" / "abc.mp4"
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"video")
+
+    content, created = create_content("sha256:abc", file_path="static/uploads/abc.mp4")
+    attach_video(make_video("a.mp4"), content, created)
+    attach_video(make_video("b.mp4"), content, False)
+    db.session.commit()
+
+    assert release_content(content) is False
+    assert stored.exists() and unindexed == []
+
+    assert release_content(content) is True
+    assert not stored.exists()
+    assert unindexed == [f"c{content.id}"]
+    assert VideoContent.query.count() == 0
+
+
+def test_last_reference_removes_transcript_segments(app, monkeypatch):
+    from backend.transcripts import store_segments
+    monkeypatch.setattr("backend.rag.delete_index", lambda key: None)
+    content, created = create_content("sha256:abc")
+    attach_video(make_video("a.mp4"), content, created)
+    db.session.commit()
+    assert store_segments(f"c{content.id}", "[00:00] intro\n[00:30] pivots") == 2
+
+    assert release_content(content) is True
+    # What the request teardown does with anything left uncommitted
+    db.session.rollback()
+    assert TranscriptSegment.query.count() == 0
+
+
+def test_content_reattached_during_release_is_kept(app, monkeypatch):
+    content, created = create_content("sha256:abc", gemini_file_name="files/abc")
+    attach_video(make_video("a.mp4"), content, created)
+    db.session.commit()
+    deleted = []
+    monkeypatch.setattr("backend.gemini_files.delete_gemini_file", deleted.append)
+
+    def attach_first(conn, cursor, statement, parameters, context, executemany):
+        # Another upload takes a reference between the count reaching zero and the delete
+        if statement.startswith("DELETE FROM video_content"):
+            cursor.execute("UPDATE video_content SET ref_count = ref_count + 1")
+    event.listen(db.engine, "before_cursor_execute", attach_first)
+    try:
+        assert release_content(content) is False
+    finally:
+        event.remove(db.engine, "before_cursor_execute", attach_first)
+
+    assert find_content("sha256:abc").ref_count == 1
+    assert deleted == []
+
+
+def test_release_configures_gemini_before_deleting(app, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr("backend.gemini_files._configured", False)
+    calls = []
+    monkeypatch.setattr("google.generativeai.configure", lambda api_key: calls.append("configure"))
+    monkeypatch.setattr("google.generativeai.delete_file", lambda name: calls.append(name))
+    content, created = create_content("sha256:abc", gemini_file_name="files/abc")
+    attach_video(make_video("a.mp4"), content, created)
+    db.session.commit()
+
+    assert release_content(content) is True
+    assert calls == ["configure", "files/abc"]
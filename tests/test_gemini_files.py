@@ -0,0 +1,117 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from backend.gemini_files import FileHandleCache, needs_visuals, request_visuals
+
+
+def make_cache(files, clock):
+    calls = []
+
+    def get_file(name):
+        calls.append(name)
+        if name not in files:
+            raise Exception("404 File not found")
+        return files[name]
+
+    return FileHandleCache(get_file=get_file, refresh_margin=timedelta(hours=2), clock=clock), calls
+
+
+def test_handle_is_fetched_once_then_served_from_cache(utc_clock, gemini_file):
+    handle = gemini_file("files/a", expiration_time=utc_clock.now + timedelta(hours=48))
+    cache, calls = make_cache({"files/a": handle}, utc_clock)
+
+    for _ in range(5):
+        assert cache.lookup("files/a") == (handle, True)
+    assert calls == ["files/a"]
+    assert cache.stats() == {"entries": 1, "hits": 4, "misses": 1}
+
+
+def test_handle_near_expiry_is_served_but_marked_stale(utc_clock, gemini_file):
+    handle = gemini_file("files/a", expiration_time=utc_clock.now + timedelta(hours=48))
+    cache, calls = make_cache({"files/a": handle}, utc_clock)
+    cache.lookup("files/a")
+
+    utc_clock.now += timedelta(hours=47)
+    assert cache.lookup("files/a") == (handle, False)
+    assert calls == ["files/a"]
+
+
+def test_expired_or_missing_handle_needs_refresh(utc_clock, gemini_file):
+    handle = gemini_file("files/a", expiration_time=utc_clock.now + timedelta(hours=48))
+    cache, calls = make_cache({"files/a": handle}, utc_clock)
+    cache.lookup("files/a")
+
+    utc_clock.now += timedelta(hours=49)
+    assert cache.lookup("files/a") == (None, False)
+    assert cache.lookup("files/gone") == (None, False)
+
+
+def test_processing_file_is_not_refreshed(utc_clock, gemini_file):
+    handle = gemini_file("files/new", "PROCESSING", utc_clock.now + timedelta(hours=48))
+    cache, _ = make_cache({"files/new": handle}, utc_clock)
+    assert cache.lookup("files/new") == (None, True)
+
+
+@pytest.mark.parametrize("question, visual", [
+    ("what does the quicksort diagram show", True),
+    ("What is written on the board at the start?", True),
+    ("which formula is on screen around 10:00", True),
+    ("what colour are the nodes in the figure", True),
+    ("What does the final circuit look like?", True),
+    ("Can you show me where recursion is explained?", False),
+    ("I don't see why the loop terminates", False),
+    ("How do you draw a conclusion from these graphs?", False),
+    ("what plots does the professor mention", False),
+    ("what is the board of directors responsible for", False),
+    ("Why are colours used for the red-black tree rules?", False),
+    ("is the proof written up anywhere", False),
+])
+def test_only_explicit_on_screen_questions_need_visuals(question, visual):
+    assert needs_visuals(question) is visual
+
+
+def test_audio_sources_never_request_visuals(monkeypatch):
+    enqueued = []
+    queue = SimpleNamespace(backend=SimpleNamespace(has_active_job=lambda kind, video_id: False),
+                            enqueue=lambda kind, video_id, payload: enqueued.append((kind, video_id)))
+    monkeypatch.setattr("backend.jobs.job_queue", queue)
+
+    assert not request_visuals(SimpleNamespace(id=1, filename="talk.m4a", gemini_media="audio"))
+    assert request_visuals(SimpleNamespace(id=2, filename="talk.mp4", gemini_media="audio"))
+    assert enqueued == [("refresh_gemini_file", 2)]
+
+
+def test_failed_refresh_keeps_the_finished_video(tmp_path, monkeypatch, gemini_file):
+    from flask import Flask
+    from backend import processing
+    from backend.extensions import db
+    from backend.models import User, Video
+
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    source = tmp_path / "t.mp4"
+    source.write_bytes(b"v" * 10)
+    with app.app_context():
+        db.create_all()
+        video = Video(title="t", filename="t.mp4", file_path=str(source), status="completed",
+                      gemini_file_name="files/old", gemini_media="audio", author=User(username="student"))
+        db.session.add(video)
+        db.session.commit()
+        video_id = video.id
+
+    deleted = []
+    monkeypatch.setenv("GOOGLE_API_KEY", "key")
+    monkeypatch.setattr(processing, "upload_to_gemini",
+                        lambda video, path, audio_only: (gemini_file("files/new", "PROCESSING"), "video", 10))
+    monkeypatch.setattr(processing, "delete_gemini_file", deleted.append)
+    monkeypatch.setattr("backend.poller.file_poller.watch",
+                        lambda name, size, on_ready, on_failed, on_pending: on_failed(name, "timed out"))
+    processing.refresh_gemini_file(video_id, app.app_context(), media="video")
+
+    with app.app_context():
+        video = db.session.get(Video, video_id)
+        assert (video.status, video.gemini_file_name, video.gemini_media) == ("completed", "files/old", "audio")
+    assert deleted == ["files/new"]
@@ -0,0 +1,118 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend import ingest, processing
+
+
+@pytest.fixture(name="spool")
+def spool_fixture(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "SPOOL_PATH", str(tmp_path / "spool"))
+    monkeypatch.setattr(ingest, "stage_stats", {})
+    return tmp_path
+
+
+def test_spooled_copy_skips_the_s3_download(spool, monkeypatch):
+    received = spool / "upload.part"
+    received.write_bytes(b"video" * 100)
+    ingest.keep_spool(str(received), "uploads/abc.mp4")
+
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr("backend.utils.download_from_s3",
+                        lambda *args: pytest.fail("downloaded from S3 despite a local copy"))
+    path, is_temp = processing.get_local_copy(SimpleNamespace(s3_key="uploads/abc.mp4", filename="abc.mp4"))
+
+    assert is_temp
+    assert open(path, "rb").read() == b"video" * 100
+    assert ingest.stats() == {"spool_hit": {"count": 1, "bytes": 500, "seconds": 0.0}}
+
+
+def test_falls_back_to_s3_without_local_copy(spool, monkeypatch):
+    def fake_download(bucket, key, path):
+        with open(path, "wb") as f:
+            f.write(b"x" * 42)
+        return True
+
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr("backend.utils.download_from_s3", fake_download)
+    path, is_temp = processing.get_local_copy(SimpleNamespace(s3_key="uploads/gone.mp4", filename="gone.mp4"))
+    os.remove(path)
+
+    assert is_temp
+    assert ingest.stats()["s3_download"]["bytes"] == 42
+
+
+def test_sweep_removes_abandoned_copies(spool):
+    os.makedirs(ingest.SPOOL_PATH)
+    old = os.path.join(ingest.SPOOL_PATH, "old.mp4")
+    new = os.path.join(ingest.SPOOL_PATH, "new.mp4")
+    for path in (old, new):
+        open(path, "wb").close()
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+
+    assert ingest.sweep_spool(max_age=3600) == 1
+    assert os.listdir(ingest.SPOOL_PATH) == ["new.mp4"]
+
+
+def _fake_upload(uploaded):
+    def upload_file(path, display_name, mime_type=None):
+        uploaded.append((open(path, "rb").read(), mime_type))
+        return SimpleNamespace(name="files/x", uri="uri")
+    return upload_file
+
+
+def test_audio_only_uploads_the_extracted_track(spool, monkeypatch):
+    video_path = spool / "lecture.mp4"
+    video_path.write_bytes(b"v" * 1000)
+    extracted = []
+
+    def extract_audio(path, output_path):
+        extracted.append(output_path)
+        with open(output_path, "wb") as f:
+            f.write(b"a" * 30)
+
+    uploaded = []
+    monkeypatch.setattr("google.generativeai.upload_file", _fake_upload(uploaded))
+    monkeypatch.setattr("backend.media.available", lambda: True)
+    monkeypatch.setattr("backend.media.extract_audio", extract_audio)
+    _, media, size = processing.upload_to_gemini(SimpleNamespace(title="Lecture"), str(video_path), True)
+
+    assert (media, size) == ("audio", 30)
+    assert uploaded == [(b"a" * 30, "audio/ogg")]
+    assert not os.path.exists(extracted[0])
+    assert ingest.stats()["audio_extract"]["bytes"] == 30
+
+
+def test_failed_extraction_uploads_the_video(spool, monkeypatch):
+    video_path = spool / "silent.mp4"
+    video_path.write_bytes(b"v" * 1000)
+
+    def extract_audio(path, output_path):
+        raise RuntimeError("no audio stream")
+
+    uploaded = []
+    monkeypatch.setattr("google.generativeai.upload_file", _fake_upload(uploaded))
+    monkeypatch.setattr("backend.media.available", lambda: True)
+    monkeypatch.setattr("backend.media.extract_audio", extract_audio)
+    _, media, size = processing.upload_to_gemini(SimpleNamespace(title="Silent"), str(video_path), True)
+
+    assert (media, size) == ("video", 1000)
+    assert uploaded == [(b"v" * 1000, None)]
+    assert video_path.exists()
+
+
+def test_chunked_transcription_keeps_the_local_copy(spool, monkeypatch):
+    fetched = spool / "fetched.mp4"
+    fetched.write_bytes(b"v" * 500)
+    monkeypatch.setattr("backend.transcription.CHUNKED", True)
+
+    assert processing._keep_local_copy(SimpleNamespace(s3_key="uploads/abc.mp4"), str(fetched))
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr("backend.utils.download_from_s3", lambda *args: pytest.fail("downloaded again"))
+    path, temp_file = processing.get_local_copy(SimpleNamespace(s3_key="uploads/abc.mp4", filename="abc.mp4"))
+    assert temp_file and open(path, "rb").read() == b"v" * 500
+
+    monkeypatch.setattr("backend.transcription.CHUNKED", False)
+    assert not processing._keep_local_copy(SimpleNamespace(s3_key="uploads/def.mp4"), path)
@@ -0,0 +1,229 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from backend.jobs import JobQueue, LocalJobBackend
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def make_queue(backend, workers=2, **kwargs):
+    return JobQueue(Flask(__name__), backend, workers=workers, poll_interval=0.05, **kwargs)
+
+
+def test_worker_pool_is_bounded():
+    backend = LocalJobBackend()
+    queue = make_queue(backend, workers=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def handler(video_id, app_context):
+        with lock:
+            active.append(video_id)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(video_id)
+
+    queue.register('process_video', handler)
+    for video_id in range(8):
+        queue.enqueue('process_video', video_id)
+
+    assert wait_for(lambda: backend.stats()['counts']['done'] == 8)
+    assert max(peak) <= 2
+    queue.stop()
+
+
+def test_failed_job_is_redelivered():
+    backend = LocalJobBackend()
+    queue = make_queue(backend, workers=1, retry_delay=0)
+    calls = []
+
+    def flaky(video_id, app_context):
+        calls.append(video_id)
+        if len(calls) == 1:
+            raise RuntimeError("worker crashed")
+
+    queue.register('process_video', flaky)
+    job_id = queue.enqueue('process_video', 1)
+
+    assert wait_for(lambda: backend.get(job_id).status == 'done')
+    assert calls == [1, 1]
+    assert backend.get(job_id).attempts == 2
+    queue.stop()
+
+
+def test_expired_lease_is_requeued():
+    backend = LocalJobBackend()
+    job_id = backend.push('process_video', 7)
+
+    # A worker claims the job and then dies without acking
+    claimed = backend.claim('dead-worker', lease_seconds=60)
+    assert claimed.id == job_id
+    backend._jobs[job_id].lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+
+    assert backend.requeue_expired() == 1
+    assert backend.get(job_id).status == 'queued'
+    # The dead worker can no longer ack a job it lost
+    backend.ack(job_id, 'dead-worker')
+    assert backend.get(job_id).status == 'queued'
+
+
+def test_stats_report_depth_and_latency():
+    backend = LocalJobBackend()
+    queue = make_queue(backend, workers=1)
+    queue.register('process_video', lambda video_id, app_context: None)
+    backend.push('process_video', 1)
+    backend.push('process_video', 2)
+
+    stats = queue.stats()
+    assert stats['depth'] == 2
+    assert stats['wait_seconds']['avg'] is None
+
+    queue.start()
+    assert wait_for(lambda: backend.stats()['counts']['done'] == 2)
+    stats = queue.stats()
+    assert stats['depth'] == 0
+    assert stats['wait_seconds']['avg'] is not None
+    assert stats['run_seconds']['p95'] is not None
+    queue.stop()
+
+
+def test_enqueue_only_queue_leaves_jobs_to_another_worker():
+    backend = LocalJobBackend()
+    web = make_queue(backend, workers=0)
+    web.register('process_video', lambda video_id, app_context: None)
+    job_id = web.enqueue('process_video', 1)
+
+    time.sleep(0.2)
+    assert backend.get(job_id).status == 'queued'
+
+    worker = make_queue(backend, workers=1)
+    worker.register('process_video', lambda video_id, app_context: None)
+    worker.start()
+    assert wait_for(lambda: backend.get(job_id).status == 'done')
+    worker.stop()
+
+
+def test_workers_booting_together_requeue_a_stale_video_once(tmp_path):
+    from backend.extensions import db
+    from backend.models import User, Video
+
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username="student")
+        db.session.add_all([user, Video(title="t", filename="t.mp4", file_path="static/uploads/t.mp4",
+                                        status="processing", author=user)])
+        db.session.commit()
+
+    class SlowBackend(LocalJobBackend):
+        # Widens the gap between "no live job" and the push, like a busy database
+        def has_active_job(self, kind, video_id):
+            time.sleep(0.05)
+            return super().has_active_job(kind, video_id)
+
+    backend = SlowBackend()
+    queues = [JobQueue(app, backend, workers=0) for _ in range(4)]
+    threads = [threading.Thread(target=queue.recover) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.stats()['counts']['queued'] == 1
+
+
+def test_recovery_leaves_videos_with_a_live_watch_lease(tmp_path):
+    from backend.extensions import db
+    from backend.models import User, Video
+
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        user = User(username="student")
+        watched = Video(title="w", filename="w.mp4", s3_key="uploads/w.mp4", status="processing",
+                        gemini_file_name="files/w", gemini_watch_until=now + timedelta(minutes=5), author=user)
+        lapsed = Video(title="l", filename="l.mp4", s3_key="uploads/l.mp4", status="processing",
+                       gemini_file_name="files/l", gemini_watch_until=now - timedelta(seconds=1), author=user)
+        db.session.add_all([user, watched, lapsed])
+        db.session.commit()
+        lapsed_id = lapsed.id
+
+    backend = LocalJobBackend()
+    assert JobQueue(app, backend, workers=0).recover() == 1
+    assert [job.video_id for job in backend._jobs.values()] == [lapsed_id]
+
+
+def test_recovery_requeues_one_video_per_content_in_flight(tmp_path):
+    from backend.extensions import db
+    from backend.models import User, Video, VideoContent
+
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        user = User(username="student")
+        leased = VideoContent(content_hash="sha256:a", status="processing", ref_count=2)
+        lapsed = VideoContent(content_hash="sha256:b", status="processing", ref_count=2)
+        db.session.add_all([user, leased, lapsed])
+        for content, until in ((leased, now + timedelta(minutes=5)), (lapsed, None)):
+            db.session.add_all([
+                Video(title="a", filename="a.mp4", s3_key="uploads/a.mp4", status="processing",
+                      gemini_watch_until=until, content=content, author=user),
+                # A duplicate attached while the first was in flight gets no job of its own
+                Video(title="b", filename="a.mp4", s3_key="uploads/a.mp4", status="processing",
+                      content=content, author=user),
+            ])
+        db.session.commit()
+        lapsed_ids = {video.id for video in lapsed.videos}
+
+    backend = LocalJobBackend()
+    assert JobQueue(app, backend, workers=0).recover() == 1
+    assert {job.video_id for job in backend._jobs.values()} <= lapsed_ids
+    assert JobQueue(app, backend, workers=0).recover() == 0
+
+
+def test_ready_file_queues_the_transcript_once(tmp_path, monkeypatch):
+    from backend import jobs, poller, processing
+    from backend.extensions import db
+    from backend.models import User, Video
+
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    watches = []
+    monkeypatch.setattr(poller.file_poller, "watch", lambda *args: watches.append(args))
+    queue = JobQueue(app, LocalJobBackend(), workers=0)
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    with app.app_context():
+        db.create_all()
+        video = Video(title="t", filename="t.mp4", status="processing", author=User(username="student"))
+        db.session.add(video)
+        db.session.commit()
+        # Two processes watching the same file after a lapsed lease
+        processing.wait_for_gemini_file(video.id, "files/t", 0)
+        processing.wait_for_gemini_file(video.id, "files/t", 0)
+        assert db.session.get(Video, video.id).gemini_watch_until > datetime.utcnow()
+
+    for _, _, on_ready, _, _ in watches:
+        on_ready(object())
+
+    assert queue.stats()['counts']['queued'] == 1
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect, text
+
+from backend.extensions import db
+from backend.migrations import upgrade_schema
+from backend.models import User, Video, ChatMessage
+from backend.pagination import keyset_page, decode_cursor
+
+
+@pytest.fixture(name="app")
+def app_fixture():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        yield app
+
+
+def test_keyset_pages_cover_every_video_once(app):
+    db.create_all()
+    user = User(username="student")
+    start = datetime(2026, 1, 1)
+    # Pairs of videos share a timestamp: the id breaks the tie
+    db.session.add_all([Video(title=f"v{i}", filename="v.mp4", author=user, transcript="x" * 1000,
+                              created_at=start + timedelta(minutes=i // 2)) for i in range(11)])
+    db.session.commit()
+    user_id = user.id
+    db.session.expunge_all()
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = keyset_page(Video.query.filter_by(user_id=user_id), Video.created_at, Video.id,
+                                   cursor=cursor, limit=4)
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert [v.title for v in seen] == [f"v{i}" for i in reversed(range(11))]
+    # Transcripts are not loaded for list pages
+    assert all('transcript' not in v.__dict__ for v in seen)
+
+
+def test_chat_history_pages_newest_first(app):
+    db.create_all()
+    video = Video(title="v", filename="v.mp4", author=User(username="student"))
+    start = datetime(2026, 1, 1)
+    db.session.add_all([ChatMessage(text=f"m{i}", sender="user", video=video, timestamp=start + timedelta(seconds=i))
+                        for i in range(5)])
+    db.session.commit()
+
+    query = ChatMessage.query.filter_by(video_id=video.id)
+    latest, cursor = keyset_page(query, ChatMessage.timestamp, ChatMessage.id, limit=3)
+    older, end = keyset_page(query, ChatMessage.timestamp, ChatMessage.id, cursor=cursor, limit=3)
+
+    assert [m.text for m in latest] == ["m4", "m3", "m2"]
+    assert ([m.text for m in older], end) == (["m1", "m0"], None)
+
+
+def test_bad_cursor_starts_from_the_top():
+    assert decode_cursor("garbage") is None
+    assert decode_cursor("2026-01-01T00:00:00_7") == (datetime(2026, 1, 1), 7)
+
+
+def test_existing_database_gets_new_indexes(app):
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(64), password_hash VARCHAR(256))'))
+        conn.execute(text('CREATE TABLE video (id INTEGER PRIMARY KEY, title VARCHAR(120), filename VARCHAR(120), '
+                          'status VARCHAR(20), created_at DATETIME, user_id INTEGER)'))
+
+    upgrade_schema()
+    upgrade_schema()  # idempotent
+
+    indexes = {i['name'] for i in inspect(db.engine).get_indexes('video')}
+    assert {'ix_video_user_created', 'ix_video_content_id'} <= indexes
+    assert 'ix_chat_message_video_timestamp' in {i['name'] for i in inspect(db.engine).get_indexes('chat_message')}
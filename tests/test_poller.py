@@ -0,0 +1,103 @@
+import time
+import threading
+
+import pytest
+
+from backend import resilience
+from backend.poller import GeminiFilePoller, next_delay, MAX_DELAY
+
+
+class FakeGemini:
+    """Each file reports PROCESSING for a fixed number of checks, then a final state."""
+
+    def __init__(self, make_file, checks_until_done, final_state="ACTIVE"):
+        self.make_file = make_file
+        self.remaining = dict(checks_until_done)
+        self.final_state = final_state
+        self.calls = []
+        self.threads = set()
+
+    def get_file(self, name):
+        self.calls.append(name)
+        self.threads.add(threading.current_thread().name)
+        self.remaining[name] -= 1
+        state = "PROCESSING" if self.remaining[name] > 0 else self.final_state
+        return self.make_file(name, state)
+
+
+def test_next_delay_grows_with_size_and_elapsed():
+    small = next_delay(1024 * 1024, 0)
+    large = next_delay(500 * 1024 * 1024, 0)
+    assert small < large
+    assert next_delay(1024 * 1024, 120) > small
+    assert next_delay(10 * 1024 ** 3, 3600) == MAX_DELAY
+
+
+def test_single_thread_polls_all_files(monkeypatch, gemini_file):
+    gemini = FakeGemini(gemini_file, {"files/a": 3, "files/b": 1, "files/c": 2})
+    poller = GeminiFilePoller(get_file=gemini.get_file)
+    ready = []
+    done = threading.Event()
+
+    def on_ready(f):
+        ready.append(f.name)
+        if len(ready) == 3:
+            done.set()
+
+    # Shrink the schedule so the test runs quickly
+    monkeypatch.setattr("backend.poller.next_delay", lambda size, elapsed: 0.01)
+    try:
+        for name in ("files/a", "files/b", "files/c"):
+            poller.watch(name, 0, on_ready, lambda name, reason: None)
+        assert done.wait(5)
+    finally:
+        poller.stop()
+
+    assert sorted(ready) == ["files/a", "files/b", "files/c"]
+    assert gemini.threads == {"gemini-file-poller"}
+    assert len(gemini.calls) == 6
+    assert poller.pending() == []
+
+
+def test_failed_and_timed_out_files_call_on_failed(monkeypatch, gemini_file):
+    gemini = FakeGemini(gemini_file, {"files/bad": 1, "files/slow": 10 ** 6}, final_state="FAILED")
+    poller = GeminiFilePoller(get_file=gemini.get_file, max_wait=0.2)
+    failures = {}
+
+    monkeypatch.setattr("backend.poller.next_delay", lambda size, elapsed: 0.01)
+    try:
+        for name in ("files/bad", "files/slow"):
+            poller.watch(name, 0, lambda f: None, lambda name, reason: failures.setdefault(name, reason))
+        deadline = time.time() + 5
+        while len(failures) < 2 and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        poller.stop()
+
+    assert failures == {"files/bad": "state FAILED", "files/slow": "timed out"}
+
+
+def test_state_checks_go_through_the_gemini_breaker(monkeypatch):
+    breaker = resilience.CircuitBreaker('gemini', threshold=1, reset_timeout=30)
+    breaker.record_failure(resilience.TRANSIENT)
+    monkeypatch.setattr(resilience, "breakers", {'gemini': breaker})
+    monkeypatch.setattr("google.generativeai.get_file", lambda name: pytest.fail("checked with the circuit open"))
+
+    with pytest.raises(resilience.CircuitOpenError):
+        GeminiFilePoller()._fetch("files/a")
+
+
+def test_pending_checks_renew_the_watch(monkeypatch, gemini_file):
+    gemini = FakeGemini(gemini_file, {"files/a": 3})
+    poller = GeminiFilePoller(get_file=gemini.get_file)
+    renewed = []
+    done = threading.Event()
+
+    monkeypatch.setattr("backend.poller.next_delay", lambda size, elapsed: 0.01)
+    try:
+        poller.watch("files/a", 0, lambda f: done.set(), lambda name, reason: None, renewed.append)
+        assert done.wait(5)
+    finally:
+        poller.stop()
+
+    assert renewed == ["files/a", "files/a"]
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from backend import jobs, rag
+from backend.extensions import db
+from backend.models import User, Video, Quiz
+from backend.quizzes import get_quiz, create_quiz, queue_quiz, build_quiz_variants, quiz_etag, quiz_payload
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path):
+    app = Flask(__name__)
+    app.root_path = str(tmp_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.fixture(name="gemini")
+def gemini_fixture(monkeypatch):
+    calls = []
+
+    def fake_generate_quiz(video, avoid_questions=None):
+        calls.append(list(avoid_questions or []))
+        return {"questions": [{"id": 1, "question": f"Question {len(calls)}?",
+                               "options": ["a", "b", "c", "d"], "correct_answer": 0}]}
+
+    monkeypatch.setattr(rag, "generate_quiz", fake_generate_quiz)
+    return calls
+
+
+def make_video():
+    user = User(username="student")
+    video = Video(title="lecture", filename="lecture.mp4", status="completed", author=user)
+    db.session.add_all([user, video])
+    db.session.commit()
+    return video
+
+
+def test_quizzes_are_versioned_and_avoid_earlier_questions(app, gemini):
+    video = make_video()
+    first, error = create_quiz(video)
+    second, _ = create_quiz(video)
+
+    assert error is None
+    assert (first.version, second.version) == (1, 2)
+    assert gemini == [[], ["Question 1?"]]
+    assert quiz_payload(second)["version"] == 2
+    assert quiz_etag(first) != quiz_etag(second)
+
+
+def test_get_quiz_serves_latest_or_cycles_through_variants(app, gemini):
+    video = make_video()
+    for _ in range(3):
+        create_quiz(video)
+
+    assert get_quiz(video.id).version == 3
+    assert get_quiz(video.id, version=2).version == 2
+    assert get_quiz(video.id, after=1).version == 2
+    assert get_quiz(video.id, after=3).version == 1
+    assert get_quiz(video.id, version=9) is None
+
+
+def test_background_job_tops_up_variants(app, gemini):
+    video = make_video()
+    create_quiz(video)
+
+    build_quiz_variants(video.id, app.app_context(), variants=3)
+    build_quiz_variants(video.id, app.app_context(), variants=3)
+
+    assert Quiz.query.filter_by(video_id=video.id).count() == 3
+    assert len(gemini) == 3
+
+
+def test_failed_generation_is_not_stored(app, monkeypatch):
+    video = make_video()
+    monkeypatch.setattr(rag, "generate_quiz", lambda video, avoid_questions=None: {"error": "quota"})
+
+    assert create_quiz(video) == (None, "quota")
+    assert Quiz.query.count() == 0
+    with pytest.raises(RuntimeError):
+        build_quiz_variants(video.id, app.app_context(), variants=1)
+
+
+def test_video_without_quizzes_gets_one_queued_once(app, gemini, monkeypatch):
+    queued = []
+    backend = SimpleNamespace(has_active_job=lambda kind, video_id: (kind, video_id) in queued)
+    monkeypatch.setattr(jobs, "job_queue", SimpleNamespace(
+        backend=backend, enqueue=lambda kind, video_id, payload=None: queued.append((kind, video_id))))
+    video = make_video()
+
+    assert queue_quiz(video) is True
+    assert queue_quiz(video) is True
+    assert queued == [("build_quiz_variants", video.id)]
+    # Generated by the job, never by the request
+    assert gemini == []
+
+    video.status = "processing"
+    assert queue_quiz(video) is False
+
+
+def test_failed_regeneration_is_an_error_response(tmp_path, monkeypatch):
+    from backend.app import create_app
+    monkeypatch.delenv("AWS_BUCKET_NAME", raising=False)
+    web = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / "web.db"),
+                      'UPLOAD_FOLDER': str(tmp_path / "uploads"), 'JOB_BACKEND': 'local'})
+    client = web.test_client()
+    client.post("/register", data={"username": "student", "password": "secret"})
+    with web.app_context():
+        video = Video(title="lecture", filename="lecture.mp4", status="processing", author=User.query.first())
+        db.session.add(video)
+        db.session.commit()
+        video_id = video.id
+
+    assert client.post(f"/video/{video_id}/quiz/regenerate").status_code == 409
+
+    with web.app_context():
+        db.session.get(Video, video_id).status = "completed"
+        db.session.commit()
+    monkeypatch.setattr(rag, "generate_quiz", lambda video, avoid_questions=None: {"error": "Gemini unavailable"})
+    response = client.post(f"/video/{video_id}/quiz/regenerate")
+    assert response.status_code == 502
+    assert response.get_json() == {"error": "Gemini unavailable"}
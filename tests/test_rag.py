@@ -0,0 +1,185 @@
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+# Mock chromadb before importing backend modules
+sys.modules.setdefault("chromadb", MagicMock())
+
+import pytest
+
+from backend import rag
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.queries = []
+
+    def add(self, documents, metadatas, ids):
+        self.docs.extend(zip(documents, metadatas))
+
+    def delete(self, where):
+        self.docs = [(d, m) for d, m in self.docs if m["video_id"] != where["video_id"]]
+
+    def query(self, query_texts, n_results, where):
+        self.queries.append(where)
+        words = set(query_texts[0].lower().split())
+        matches = [(doc, meta) for doc, meta in self.docs
+                   if meta["video_id"] == where["video_id"] and words & set(doc.lower().split())]
+        matches = matches[:n_results]
+        return {"documents": [[d for d, _ in matches]], "metadatas": [[m for _, m in matches]]}
+
+
+TRANSCRIPT = "\n".join([
+    "[0.0s -> 30.0s] welcome to the lecture on sorting",
+    "[30.0s -> 95.5s] quicksort picks a pivot and partitions the array",
+    "[95.5s -> 140.0s] mergesort splits the array in halves",
+    "[140.0s -> 200.0s] homework is due friday",
+])
+
+
+@pytest.fixture(name="collection")
+def collection_fixture(monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(rag, "get_collection", lambda: collection)
+    # One transcript line per chunk keeps the assertions readable
+    monkeypatch.setattr(rag, "CHUNK_TOKENS", 12)
+    monkeypatch.setattr(rag, "CHUNK_OVERLAP_TOKENS", 0)
+    rag._backfilled.clear()
+    return collection
+
+
+@pytest.fixture(name="gemini")
+def gemini_fixture(monkeypatch):
+    sent = []
+
+    def fake_generate(model, content, retries=3, initial_delay=1, lane='batch', deadline=None):
+        assert lane == 'interactive'
+        sent.append(content)
+        return SimpleNamespace(text="answer")
+
+    monkeypatch.setattr(rag, "configure_gemini", lambda: True)
+    monkeypatch.setattr("google.generativeai.GenerativeModel", lambda *a, **kw: object())
+    monkeypatch.setattr("backend.utils.generate_with_retry", fake_generate)
+    return sent
+
+
+def make_video(**fields):
+    defaults = dict(id=1, content_id=None, filename="lecture.mp4", transcript=TRANSCRIPT, gemini_file_name="files/x",
+                    gemini_media=None)
+    defaults.update(fields)
+    return SimpleNamespace(**defaults)
+
+
+def test_index_key_is_shared_by_duplicate_content():
+    assert rag.index_key(make_video(id=3)) == "3"
+    assert rag.index_key(make_video(id=3, content_id=9)) == rag.index_key(make_video(id=4, content_id=9))
+
+
+def test_build_prompt_orders_segments_with_timestamps():
+    prompt = rag.build_prompt([
+        {"text": "later", "start_time": 3700.0, "end_time": 3720.0},
+        {"text": "earlier", "start_time": 65.0, "end_time": None},
+    ], "why?")
+    assert prompt.index("[01:05] earlier") < prompt.index("[1:01:40 - 1:02:00] later")
+    assert prompt.endswith("Question: why?")
+
+
+def test_question_is_answered_from_retrieved_segments(collection, gemini):
+    video = make_video()
+    answer = rag.ask_question(video, "how does quicksort partition")
+
+    assert answer == {"text": "answer", "timestamps": [30.0]}
+    # Transcript indexed lazily on first use, then only the hit segment is sent
+    assert len(collection.docs) == 4
+    assert collection.queries[-1] == {"video_id": "1"}
+    [prompt] = gemini[0]
+    assert "quicksort picks a pivot" in prompt
+    assert "homework" not in prompt
+
+
+def test_falls_back_to_full_video_without_hits(collection, gemini, monkeypatch):
+    monkeypatch.setattr(rag, "get_video_file", lambda video: "VIDEO")
+    answer = rag.ask_question(make_video(), "xyzzy")
+
+    assert answer["timestamps"] == []
+    assert gemini[0][0] == "VIDEO"
+    assert gemini[0][-1] == "Question: xyzzy"
+
+
+def test_visual_question_sends_the_video_with_the_segments(collection, gemini, monkeypatch):
+    monkeypatch.setattr(rag, "get_video_file", lambda video: "VIDEO")
+    rag.ask_question(make_video(), "what does the quicksort diagram show")
+
+    assert gemini[0][0] == "VIDEO"
+    assert "quicksort picks a pivot" in gemini[0][1]
+
+
+def test_visual_question_on_audio_only_video_queues_the_video(collection, gemini, monkeypatch):
+    requested = []
+    monkeypatch.setattr(rag, "request_visuals", requested.append)
+    monkeypatch.setattr(rag, "get_video_file", lambda video: pytest.fail("sent the audio file as visuals"))
+    video = make_video(gemini_media="audio")
+
+    rag.ask_question(video, "what does the quicksort diagram show")
+    rag.ask_question(video, "how does quicksort partition")
+
+    assert requested == [video]
+    assert gemini[0][-1] == rag.VISUALS_PENDING_NOTE
+    assert rag.VISUALS_PENDING_NOTE not in gemini[1]
+
+
+def test_visual_question_on_audio_source_is_answered_from_the_audio(collection, gemini, monkeypatch):
+    monkeypatch.setattr(rag, "request_visuals", lambda video: pytest.fail("queued a video upload for an m4a"))
+    rag.ask_question(make_video(filename="lecture.m4a", gemini_media="audio"), "what does the quicksort diagram show")
+
+    assert rag.VISUALS_PENDING_NOTE not in gemini[0]
+
+
+def test_reindexing_replaces_previous_chunks(collection):
+    assert rag.index_transcript("1", TRANSCRIPT)
+    assert rag.index_transcript("1", "[0:00] a completely new transcript")
+    assert [d for d, _ in collection.docs] == ["a completely new transcript"]
+
+
+class StreamingModel:
+    """Streams the answer word by word; the first attempt is cut off by a rate limit."""
+
+    def __init__(self, words, fail_after=None):
+        self.words = words
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def generate_content(self, content, stream=False, request_options=None):
+        assert stream
+        self.calls += 1
+        for i, word in enumerate(self.words):
+            if self.calls == 1 and i == self.fail_after:
+                raise Exception("429 Resource exhausted")
+            yield SimpleNamespace(text=word)
+
+
+def test_stream_answer_yields_tokens_then_full_text(collection, monkeypatch):
+    model = StreamingModel(["Quick", "sort ", "pivots."])
+    monkeypatch.setattr(rag, "configure_gemini", lambda: True)
+    monkeypatch.setattr("google.generativeai.GenerativeModel", lambda *a, **kw: model)
+    rag.first_token_seconds.clear()
+
+    events = list(rag.stream_answer(make_video(), "how does quicksort partition"))
+
+    assert events[0] == ("meta", {"timestamps": [30.0]})
+    assert [d["text"] for e, d in events if e == "token"] == ["Quick", "sort ", "pivots."]
+    assert events[-1] == ("done", {"text": "Quicksort pivots.", "timestamps": [30.0]})
+    assert rag.first_token_stats()["count"] == 1
+
+
+def test_rate_limited_stream_restarts(collection, monkeypatch):
+    model = StreamingModel(["a", "b", "c"], fail_after=2)
+    monkeypatch.setattr(rag, "configure_gemini", lambda: True)
+    monkeypatch.setattr("google.generativeai.GenerativeModel", lambda *a, **kw: model)
+    monkeypatch.setattr("backend.utils.time.sleep", lambda seconds: None)
+
+    events = [e for e, _ in rag.stream_answer(make_video(), "quicksort")]
+
+    assert events == ["meta", "token", "token", "restart", "token", "token", "token", "done"]
+    assert model.calls == 2
@@ -0,0 +1,109 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from backend.ratelimit import Buckets, SharedBuckets, RateLimiter, estimate_tokens
+from backend import ratelimit, utils
+
+
+def test_buckets_refill_and_report_the_wait(clock):
+    buckets = Buckets(rpm=2, tpm=1000, clock=clock)
+
+    assert buckets.try_take(400) == 0
+    assert buckets.try_take(400) == 0
+    # Out of requests: one comes back every 30s
+    assert buckets.try_take(10) == 30.0
+    clock.now += 30
+    # A request is back and the tokens refilled to 700: 200 short at 1000/min
+    assert buckets.try_take(900) == 12.0
+    assert buckets.try_take(700) == 0
+
+
+def test_batch_leaves_a_reserve_for_interactive_calls(clock):
+    buckets = Buckets(rpm=10, tpm=0, clock=clock)
+    for _ in range(8):
+        assert buckets.try_take(0, reserve=0.2) == 0
+
+    assert buckets.try_take(0, reserve=0.2) > 0
+    assert buckets.try_take(0) == 0
+
+
+def test_response_usage_settles_the_estimate(clock):
+    buckets = Buckets(rpm=0, tpm=1000, clock=clock)
+    limiter = RateLimiter(buckets)
+    limiter.acquire('interactive', tokens=100)
+    limiter.settle(100, SimpleNamespace(usage_metadata=SimpleNamespace(total_token_count=700)))
+
+    assert buckets.snapshot()["tokens"] == 300
+    assert estimate_tokens(["x" * 400, object()]) == 101 + 30000
+
+
+def test_pause_holds_everyone_but_the_retrying_caller(clock):
+    buckets = Buckets(rpm=100, tpm=0, clock=clock)
+    buckets.pause(5)
+
+    assert buckets.try_take(0) == 5
+    assert buckets.try_take(0, honor_pause=False) == 0
+    clock.now += 5
+    assert buckets.try_take(0) == 0
+
+
+def test_interactive_callers_jump_the_batch_queue():
+    buckets = Buckets(rpm=600, tpm=0)
+    for _ in range(600):
+        buckets.try_take(0)
+    limiter = RateLimiter(buckets, batch_reserve=0)
+    order = []
+
+    def call(lane):
+        limiter.acquire(lane)
+        order.append(lane)
+
+    batch = threading.Thread(target=call, args=('batch',))
+    batch.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=call, args=('interactive',))
+    interactive.start()
+    batch.join(2)
+    interactive.join(2)
+
+    assert order == ['interactive', 'batch']
+    stats = limiter.stats()["lanes"]
+    assert stats["batch"]["admitted"] == 1 and stats["batch"]["wait_max"] > stats["interactive"]["wait_max"]
+
+
+def test_shared_buckets_are_one_budget(tmp_path):
+    path = str(tmp_path / "gemini.json")
+    first = SharedBuckets(path, rpm=10, tpm=0)
+    second = SharedBuckets(path, rpm=10, tpm=0)
+
+    for _ in range(6):
+        first.try_take(0)
+
+    assert second.snapshot()["requests"] < 5
+    assert second.try_take(0, reserve=0.5) > 0
+
+
+def test_every_process_shares_the_budget_by_default():
+    # Not only gunicorn workers: `python -m backend.worker` opens the same file
+    assert ratelimit.SHARED_STATE_PATH.endswith("gemini-rate-limit.json")
+    assert isinstance(ratelimit.gemini_limiter.buckets, SharedBuckets)
+
+
+def test_generate_with_retry_goes_through_the_limiter(monkeypatch):
+    calls = []
+    limiter = RateLimiter(Buckets(rpm=100, tpm=0))
+    monkeypatch.setattr("backend.ratelimit.gemini_limiter", limiter)
+    monkeypatch.setattr(utils.time, "sleep", lambda seconds: None)
+
+    class Model:
+        def generate_content(self, content, request_options=None):
+            calls.append(content)
+            if len(calls) == 1:
+                raise RuntimeError("429 Resource exhausted")
+            return SimpleNamespace(text="ok")
+
+    assert utils.generate_with_retry(Model(), "prompt", lane='interactive').text == "ok"
+    assert limiter.stats()["lanes"]["interactive"]["admitted"] == 2
+    # Everyone else waits out the backoff
+    assert limiter.stats()["buckets"]["paused_for"] > 0
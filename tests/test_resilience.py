@@ -0,0 +1,167 @@
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from google.api_core import exceptions as google_exceptions
+
+from backend import resilience, utils
+from backend.resilience import (CircuitBreaker, CircuitOpenError, Deadline, classify, retry_after,
+                                RATE_LIMIT, TRANSIENT, PERMANENT)
+
+
+def client_error(code, status, headers=None):
+    return ClientError({"Error": {"Code": code, "Message": code},
+                        "ResponseMetadata": {"HTTPStatusCode": status, "HTTPHeaders": headers or {}}}, "GetObject")
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "breakers", {name: CircuitBreaker(name, threshold=3, reset_timeout=30)
+                                                 for name in ('gemini', 's3', 'youtube')})
+    slept = []
+    monkeypatch.setattr(resilience.time, "sleep", slept.append)
+    return slept
+
+
+@pytest.mark.parametrize("error, kind", [
+    (google_exceptions.ResourceExhausted("quota"), RATE_LIMIT),
+    (google_exceptions.ServiceUnavailable("overloaded"), TRANSIENT),
+    (google_exceptions.InternalServerError("oops"), TRANSIENT),
+    (google_exceptions.InvalidArgument("bad file"), PERMANENT),
+    (client_error("SlowDown", 503), RATE_LIMIT),
+    (client_error("InternalError", 500), TRANSIENT),
+    (client_error("AccessDenied", 403), PERMANENT),
+    (EndpointConnectionError(endpoint_url="https://s3"), TRANSIENT),
+    (TimeoutError("read timed out"), TRANSIENT),
+    (Exception("ERROR: unable to download video data: HTTP Error 429: Too Many Requests"), RATE_LIMIT),
+    (Exception("ERROR: [youtube] abc: Video unavailable"), PERMANENT),
+    (Exception("ERROR: Connection reset by peer"), TRANSIENT),
+    (ValueError("unexpected"), PERMANENT),
+])
+def test_errors_are_classified(error, kind):
+    assert classify(error) == kind
+
+
+def test_server_retry_hints():
+    assert retry_after(client_error("SlowDown", 503, {"retry-after": "7"})) == 7.0
+    assert retry_after(Exception("429 Quota exceeded. Please retry in 12.5s.")) == 12.5
+    assert retry_after(Exception("retry_delay {\n  seconds: 33\n}")) == 33.0
+    assert retry_after(Exception("boom")) is None
+
+
+def test_transient_errors_are_retried_with_backoff(fresh_breakers):
+    results = [client_error("InternalError", 500), client_error("SlowDown", 503, {"retry-after": "4"}), "ok"]
+
+    def flaky():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert resilience.call('s3', flaky, retries=3, initial_delay=1) == "ok"
+    assert 1 <= fresh_breakers[0] < 2
+    assert fresh_breakers[1] == 4.0
+    assert resilience.stats()["s3"]["retries"] == 2
+
+
+def test_permanent_errors_are_not_retried(fresh_breakers):
+    def denied():
+        raise client_error("AccessDenied", 403)
+
+    with pytest.raises(ClientError):
+        resilience.call('s3', denied, retries=3)
+    assert fresh_breakers == []
+
+
+def test_retries_stop_at_the_deadline(fresh_breakers):
+    def slow_down():
+        raise client_error("SlowDown", 503, {"retry-after": "30"})
+
+    with resilience.deadline(10):
+        with pytest.raises(ClientError):
+            resilience.call('s3', slow_down, retries=3)
+    assert fresh_breakers == []
+    assert resilience.call_timeout('s3', Deadline(5)) <= 5
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_one_probe(clock):
+    breaker = CircuitBreaker('gemini', threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure(PERMANENT)
+    breaker.record_failure(TRANSIENT)
+    assert breaker.state == 'closed'
+    breaker.record_failure(TRANSIENT)
+    assert breaker.state == 'open'
+
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == 30
+    assert classify(raised.value) == TRANSIENT
+
+    clock.now += 30
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure(TRANSIENT)
+    assert breaker.state == 'open'
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats()["state"] == 'closed'
+    assert breaker.stats()["opened"] == 2
+
+
+def test_gemini_calls_fail_fast_while_the_circuit_is_open(monkeypatch):
+    class Model:
+        calls = 0
+
+        def generate_content(self, content, request_options=None):
+            Model.calls += 1
+            raise google_exceptions.ServiceUnavailable("overloaded")
+
+    # Three failures open the circuit; the remaining retries are not attempted
+    with pytest.raises(CircuitOpenError):
+        utils.generate_with_retry(Model(), "prompt", retries=5)
+    assert Model.calls == 3
+    with pytest.raises(CircuitOpenError):
+        utils.generate_with_retry(Model(), "prompt", retries=0)
+    assert resilience.stats()["gemini"]["rejected"] >= 1
+
+
+def test_abandoned_streamed_probe_does_not_wedge_the_circuit(monkeypatch, clock):
+    from backend.ratelimit import Buckets, RateLimiter
+    breaker = CircuitBreaker('gemini', threshold=1, reset_timeout=30, clock=clock, probe_timeout=300)
+    monkeypatch.setitem(resilience.breakers, 'gemini', breaker)
+    monkeypatch.setattr("backend.ratelimit.gemini_limiter", RateLimiter(Buckets(rpm=0, tpm=0)))
+
+    class Model:
+        def generate_content(self, content, stream=False, request_options=None):
+            return iter([SimpleNamespace(text="partial "), SimpleNamespace(text="answer")])
+
+    breaker.record_failure(TRANSIENT)
+    clock.now = 1000
+    stream = utils.stream_with_retry(Model(), "prompt")
+    assert next(stream) == "partial "
+    # The SSE client disconnects while the probe is streaming
+    stream.close()
+
+    assert breaker.before_call() is True
+    # A probe that never reports back stops blocking after probe_timeout
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 300
+    assert breaker.before_call() is True
+
+
+def test_s3_download_is_retried(monkeypatch, tmp_path):
+    attempts = []
+
+    def download_file(bucket, key, path):
+        attempts.append(key)
+        if len(attempts) == 1:
+            raise EndpointConnectionError(endpoint_url="https://s3")
+
+    monkeypatch.setattr(utils, "get_s3_client", lambda: SimpleNamespace(download_file=download_file))
+
+    assert utils.download_from_s3("bucket", "uploads/a.mp4", str(tmp_path / "a.mp4"))
+    assert len(attempts) == 2
@@ -0,0 +1,42 @@
+import pytest
+from botocore.stub import Stubber
+
+from backend import utils
+
+
+@pytest.fixture(name="s3")
+def s3_fixture(monkeypatch, clock):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("S3_ENDPOINT_URL", "http://localhost:9000")
+    monkeypatch.setattr(utils, "presigned_urls", utils.PresignedUrlCache(clock=clock))
+    utils.reset_s3_client()
+    yield clock
+    utils.reset_s3_client()
+
+
+def test_client_is_shared(s3):
+    client = utils.get_s3_client()
+    assert utils.get_s3_client() is client
+    assert client.meta.endpoint_url == "http://localhost:9000"
+    assert client.meta.config.max_pool_connections == utils.S3_MAX_POOL_CONNECTIONS
+
+
+def test_presigned_url_is_reused_until_close_to_expiry(s3):
+    url = utils.generate_presigned_url("bucket", "uploads/a.mp4", response_content_type="video/mp4")
+    assert url.startswith("http://localhost:9000/bucket/uploads/a.mp4")
+    assert utils.generate_presigned_url("bucket", "uploads/a.mp4", response_content_type="video/mp4") == url
+    # Different response type, different URL
+    assert utils.generate_presigned_url("bucket", "uploads/a.mp4", response_content_type="video/webm") != url
+
+    s3.now = 3600 - utils.PRESIGN_REUSE_MARGIN
+    utils.generate_presigned_url("bucket", "uploads/a.mp4", response_content_type="video/mp4")
+    assert utils.presigned_urls.stats() == {"entries": 2, "hits": 1, "misses": 3}
+
+
+def test_deleting_an_object_drops_its_urls(s3):
+    utils.generate_presigned_url("bucket", "uploads/a.mp4")
+    with Stubber(utils.get_s3_client()) as stub:
+        stub.add_response("delete_object", {}, {"Bucket": "bucket", "Key": "uploads/a.mp4"})
+        assert utils.delete_from_s3("bucket", "uploads/a.mp4")
+    assert utils.presigned_urls.stats()["entries"] == 0
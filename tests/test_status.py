@@ -0,0 +1,106 @@
+import time
+import threading
+
+import pytest
+from flask import Flask
+
+from backend import status
+from backend.app import create_app
+from backend.extensions import db
+from backend.models import User, Video
+from backend.processing import update_video
+from backend.status import bump_status_version, record_deletion, status_version, video_statuses, wait_for_change
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / "app.db")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def make_videos(*titles):
+    user = User(username="student")
+    videos = [Video(title=t, filename=t, status="pending", author=user) for t in titles]
+    db.session.add_all([user, *videos])
+    bump_status_version(videos)
+    db.session.commit()
+    return user, videos
+
+
+def test_status_changes_bump_the_owner_version(app):
+    user, (a, b) = make_videos("a", "b")
+    assert status_version(user.id) == 1
+
+    update_video(a, status="processing")
+    update_video(a, gemini_file_name="files/x")  # not a status change
+
+    assert status_version(user.id) == 2
+    assert video_statuses(user.id, since=1) == [{"id": a.id, "status": "processing"}]
+    assert sorted(v["id"] for v in video_statuses(user.id)) == [a.id, b.id]
+    assert video_statuses(user.id, since=2) == []
+
+
+def test_waiters_wake_on_commit(app):
+    user, (video,) = make_videos("a")
+    video_id, user_id = video.id, user.id
+
+    def finish():
+        with app.app_context():
+            update_video(db.session.get(Video, video_id), status="completed")
+
+    timer = threading.Timer(0.2, finish)
+    timer.start()
+    assert wait_for_change(user_id, 1, timeout=5) == 2
+    timer.join()
+
+    assert wait_for_change(user_id, 2, timeout=0.1) == 2
+
+
+def test_deleted_videos_are_reported_in_the_delta(app):
+    user, (a, b) = make_videos("a", "b")
+    deleted_id = a.id
+    record_deletion(a)
+    db.session.delete(a)
+    db.session.commit()
+
+    assert video_statuses(user.id, since=1) == [{"id": deleted_id, "status": "deleted"}]
+    assert video_statuses(user.id, since=2) == []
+    assert [v["id"] for v in video_statuses(user.id)] == [b.id]
+
+
+def test_status_long_poll_returns_on_change_or_after_the_wait(tmp_path, monkeypatch):
+    monkeypatch.delenv("AWS_BUCKET_NAME", raising=False)
+    web = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / "web.db"),
+                      'UPLOAD_FOLDER': str(tmp_path / "uploads"), 'JOB_BACKEND': 'local'})
+    client = web.test_client()
+    client.post("/register", data={"username": "student", "password": "secret"})
+    with web.app_context():
+        user = User.query.first()
+        video = Video(title="a", filename="a", status="pending", author=user)
+        db.session.add(video)
+        bump_status_version([video])
+        db.session.commit()
+        video_id = video.id
+
+    # Long polling off (the default): answered at once
+    started = time.monotonic()
+    assert client.get("/api/videos/status?since=1&wait=20").get_json() == {"version": 1, "videos": []}
+    assert time.monotonic() - started < 1
+
+    monkeypatch.setattr(status, "LONG_POLL_SECONDS", 5)
+
+    def finish():
+        with web.app_context():
+            update_video(db.session.get(Video, video_id), status="completed")
+    timer = threading.Timer(0.2, finish)
+    timer.start()
+    response = client.get("/api/videos/status?since=1&wait=20")
+    timer.join()
+    assert response.get_json() == {"version": 2, "videos": [{"id": video_id, "status": "completed"}]}
+
+    monkeypatch.setattr(status, "LONG_POLL_SECONDS", 0.2)
+    assert client.get("/api/videos/status?since=2&wait=20").get_json() == {"version": 2, "videos": []}
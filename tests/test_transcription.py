@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from backend import poller, resilience, transcription
+from backend.transcription import plan_ranges, stitch, transcribe_ranges
+
+
+def test_ranges_overlap_and_split_at_midpoint():
+    ranges = plan_ranges(1500, range_seconds=600, overlap=20)
+
+    assert [(r.start, r.end) for r in ranges] == [(0, 620), (600, 1220), (1200, 1500)]
+    assert [(r.keep_from, r.keep_to) for r in ranges] == [(0, 610), (610, 1210), (1210, float('inf'))]
+    assert len(plan_ranges(300, range_seconds=600, overlap=20)) == 1
+
+
+def test_stitch_offsets_timestamps_and_drops_overlap_repeats(monkeypatch):
+    monkeypatch.setattr(transcription, "OVERLAP_SECONDS", 20)
+    first, second = plan_ranges(900, range_seconds=600, overlap=20)
+    results = [
+        # Given out of order, as futures complete
+        (second, "[00:02] the boundary sentence\n[00:12] **Second part** begins\n[01:00] end"),
+        (first, "[00:00] welcome\n[09:50] near the end\n[10:03] the boundary sentence\n[10:15] ignored"),
+    ]
+
+    assert stitch(results).splitlines() == [
+        "[00:00] welcome",
+        "[09:50] near the end",
+        "[10:03] the boundary sentence",
+        "[10:12] Second part begins",
+        "[11:00] end",
+    ]
+
+
+def test_failed_ranges_are_retried_alone():
+    ranges = plan_ranges(1500, range_seconds=600, overlap=20)
+    calls = []
+    lock = threading.Lock()
+
+    def transcribe(path, time_range, workdir):
+        with lock:
+            calls.append(time_range.index)
+            if time_range.index == 1 and calls.count(1) < 3:
+                raise RuntimeError("429 Resource exhausted")
+        return f"[00:30] range {time_range.index}"
+
+    transcript = transcribe_ranges("lecture.mp4", ranges, transcribe=transcribe, parallelism=2, attempts=3)
+
+    assert sorted(calls) == [0, 1, 1, 1, 2]
+    assert transcript.splitlines() == ["[00:30] range 0", "[10:30] range 1", "[20:30] range 2"]
+
+
+def test_range_failing_every_attempt_fails_the_transcript():
+    def transcribe(path, time_range, workdir):
+        if time_range.index == 0:
+            raise RuntimeError("boom")
+        return "[00:01] ok"
+
+    with pytest.raises(RuntimeError, match="1 of 2"):
+        transcribe_ranges("lecture.mp4", plan_ranges(1000, range_seconds=600), transcribe=transcribe, attempts=2)
+
+
+def test_chunking_is_skipped_when_disabled_or_short(monkeypatch):
+    monkeypatch.setattr(transcription, "CHUNKED", False)
+    assert transcription.transcribe_in_ranges("lecture.mp4") is None
+
+    monkeypatch.setattr(transcription, "CHUNKED", True)
+    monkeypatch.setattr(transcription.media, "available", lambda: True)
+    monkeypatch.setattr(transcription.media, "probe_duration", lambda path: 300.0)
+    assert transcription.transcribe_in_ranges("lecture.mp4") is None
+
+
+def test_ranges_run_inside_the_callers_deadline():
+    seen = []
+
+    def transcribe(path, time_range, workdir):
+        seen.append(resilience.current_deadline())
+        return "[00:01] ok"
+
+    with resilience.deadline(60):
+        expected = resilience.current_deadline()
+        transcribe_ranges("lecture.mp4", plan_ranges(1500, range_seconds=600), transcribe=transcribe, parallelism=3)
+
+    assert seen == [expected] * 3
+
+
+def test_range_clips_are_polled_by_the_shared_poller(monkeypatch, gemini_file):
+    watched = []
+
+    class Poller:
+        max_wait = 5
+
+        def watch(self, name, size_bytes, on_ready, on_failed):
+            watched.append((name, size_bytes))
+            if name == "files/ok":
+                on_ready(gemini_file(name))
+            else:
+                on_failed(name, "FAILED")
+
+    monkeypatch.setattr(poller, "file_poller", Poller())
+
+    assert transcription._wait_active(gemini_file("files/ok", "PROCESSING"), 100).state.name == "ACTIVE"
+    with pytest.raises(RuntimeError, match="FAILED"):
+        transcription._wait_active(gemini_file("files/bad", "PROCESSING"), 100)
+    assert watched == [("files/ok", 100), ("files/bad", 100)]
@@ -0,0 +1,100 @@
+import pytest
+from flask import Flask
+
+from backend.extensions import db
+from backend.models import User, Video, TranscriptSegment
+from backend import transcripts
+from backend.transcripts import SegmentIndex, store_segments, get_index, resolve_timestamps
+
+TRANSCRIPT = "\n".join(f"[{i // 60:02d}:{i % 60:02d}] line {i // 10}" for i in range(0, 600, 10))
+
+
+@pytest.fixture(name="app")
+def app_fixture():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    transcripts._indexes.clear()
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def _video(transcript=TRANSCRIPT, username="student"):
+    video = Video(title="Lecture", filename="l.mp4", author=User(username=username),
+                  status="completed", transcript=transcript)
+    db.session.add(video)
+    db.session.commit()
+    return video
+
+
+def test_segment_index_lookups():
+    index = SegmentIndex([(20.0, 30.0, "c"), (0.0, 10.0, "a"), (10.0, 20.0, "b")])
+
+    assert index.texts == ["a", "b", "c"]
+    assert index.at(0) == 0
+    assert index.at(9.9) == 0
+    assert index.at(10) == 1
+    assert index.at(500) == 2
+    assert index.snap(25) == 20.0
+    assert [s["text"] for s in index.window(15)] == ["b", "c"]
+    assert [s["text"] for s in index.window(0, end=20)] == ["a", "b"]
+    assert len(index.window(0, limit=1)) == 1
+    assert SegmentIndex([]).at(5) is None
+
+
+def test_index_is_backfilled_from_transcript_and_cached(app):
+    video = _video()
+
+    index = get_index(video)
+
+    assert len(index) == 60
+    assert TranscriptSegment.query.filter_by(source_key=str(video.id)).count() == 60
+    assert index.window(125, limit=2)[0] == {"position": 12, "start_time": 120.0, "end_time": 130.0,
+                                             "text": "line 12"}
+    assert get_index(video) is index
+
+
+def test_store_segments_replaces_and_invalidates(app):
+    video = _video()
+    first = get_index(video)
+
+    assert store_segments(str(video.id), "[00:00] intro\n[00:30] outro") == 2
+
+    index = get_index(video)
+    assert index is not first
+    assert index.texts == ["intro", "outro"]
+
+
+def test_cached_index_follows_other_processes_writes(app):
+    video = _video()
+    first = get_index(video)
+    # Another worker rewrites, then deletes, the segments: this process's cache is not told
+    key = str(video.id)
+    TranscriptSegment.query.filter_by(source_key=key).delete()
+    db.session.add(TranscriptSegment(source_key=key, position=0, start_time=0.0, end_time=0.0,
+                                     text="rewritten", generation=1))
+    db.session.commit()
+
+    assert get_index(video) is not first
+    assert get_index(video).texts == ["rewritten"]
+
+    TranscriptSegment.query.filter_by(source_key=key).delete()
+    db.session.commit()
+    video.transcript = None
+    assert get_index(video) is None
+
+
+def test_video_without_transcript_has_no_index(app):
+    assert get_index(_video(transcript=None)) is None
+    assert get_index(_video(transcript="   \n", username="other")) is None
+
+
+def test_resolve_timestamps_snaps_mentioned_times(app):
+    video = _video()
+
+    times = resolve_timestamps(video, [42.0], "As shown at [01:23] and again around 5:07, ...")
+
+    assert times == [40.0, 80.0, 300.0]
+    # Times past the end of the lecture land on the last segment
+    assert resolve_timestamps(video, [], "see 59:00") == [590.0]
@@ -0,0 +1,210 @@
+import io
+import os
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from backend import uploads, utils
+from backend.extensions import db
+from backend.models import User, Upload
+from backend.uploads import create_upload, write_chunk, finish_upload, abort_upload, staging_dir, sweep_uploads
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="student"))
+        db.session.commit()
+        yield app
+
+
+class BrokenStream:
+    """Delivers some bytes, then fails like a dropped connection."""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size):
+        block = self.data.read(size)
+        if not block:
+            raise IOError("client disconnected")
+        return block
+
+
+class FakeS3:
+    def __init__(self):
+        self.parts = {}
+        self.objects = {}
+        self.aborted = False
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {"UploadId": "mp-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        data = Body.read()
+        self.parts[PartNumber] = data
+        return {"ETag": f'"{PartNumber}"'}
+
+    def get_paginator(self, name):
+        assert name == "list_parts"
+        parts = [{"PartNumber": n, "ETag": f'"{n}"', "Size": len(d)} for n, d in sorted(self.parts.items())]
+        return type("Paginator", (), {"paginate": lambda self, **kw: [{"Parts": parts}]})()
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[Key] = b"".join(self.parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def test_local_upload_resumes_after_dropped_chunk(app, tmp_path):
+    data = bytes(range(256)) * 4000
+    upload, _ = create_upload(1, "lecture.mp4", "video/mp4", len(data), str(tmp_path))
+
+    offset, error = write_chunk(upload, 0, BrokenStream(data[:300000]), str(tmp_path))
+    assert (offset, error) == (300000, None)
+    assert write_chunk(upload, 0, io.BytesIO(data), str(tmp_path)) == (None, "Offset mismatch, upload is at 300000")
+
+    assert write_chunk(upload, offset, io.BytesIO(data[offset:]), str(tmp_path)) == (len(data), None)
+    result, error = finish_upload(upload, str(tmp_path))
+
+    assert error is None
+    assert result["content_hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+    assert open(result["local_path"], "rb").read() == data
+    assert Upload.query.get(upload.id).status == "completed"
+
+
+def test_s3_upload_sends_parts_while_receiving(app, tmp_path, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr(utils, "get_s3_client", lambda: s3)
+    monkeypatch.setattr(uploads, "PART_SIZE", 1000)
+    data = b"x" * 2500 + b"y" * 700
+
+    upload, _ = create_upload(1, "lecture.mp4", "video/mp4", len(data), str(tmp_path))
+    write_chunk(upload, 0, io.BytesIO(data[:1800]), str(tmp_path))
+    write_chunk(upload, 1800, io.BytesIO(data[1800:]), str(tmp_path))
+    # Hash state lost (e.g. chunks handled by another worker): recomputed from S3
+    uploads._hashers.clear()
+    result, error = finish_upload(upload, str(tmp_path))
+
+    assert error is None
+    assert sorted(s3.parts) == [1, 2, 3, 4]
+    assert s3.objects[upload.s3_key] == data
+    assert result["s3_key"] == upload.s3_key
+    assert result["content_hash"] == "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def test_incomplete_or_oversized_uploads_are_rejected(app, tmp_path):
+    upload, _ = create_upload(1, "lecture.mp4", None, 10, str(tmp_path))
+    assert finish_upload(upload, str(tmp_path)) == (None, "Upload is empty")
+    assert write_chunk(upload, 0, io.BytesIO(b"a" * 20), str(tmp_path)) == (0, "Chunk exceeds the declared upload size")
+
+    write_chunk(upload, 0, io.BytesIO(b"a" * 4), str(tmp_path))
+    assert finish_upload(upload, str(tmp_path)) == (None, "Upload incomplete: 4 of 10 bytes received")
+
+    abort_upload(upload, str(tmp_path))
+    assert write_chunk(upload, 4, io.BytesIO(b"b"), str(tmp_path)) == (None, "Upload is not in progress")
+
+
+def test_s3_upload_keeps_a_local_copy_for_gemini(app, tmp_path, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr(utils, "get_s3_client", lambda: s3)
+    monkeypatch.setattr(uploads, "PART_SIZE", 1000)
+    data = bytes(range(256)) * 10
+
+    upload, _ = create_upload(1, "lecture.mp4", "video/mp4", len(data), str(tmp_path))
+    write_chunk(upload, 0, io.BytesIO(data), str(tmp_path))
+    result, _ = finish_upload(upload, str(tmp_path))
+
+    assert open(result["spool_path"], "rb").read() == data
+
+
+def test_concurrent_chunks_at_the_same_offset_are_refused(app, tmp_path):
+    upload, _ = create_upload(1, "lecture.mp4", None, None, str(tmp_path))
+    retried = []
+
+    class SlowClient:
+        """While its chunk is still arriving, the client retries it in a second request."""
+
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def read(self, size):
+            if not retried:
+                retried.append(write_chunk(upload, 0, io.BytesIO(b"b" * 100), str(tmp_path)))
+            return self.data.read(size)
+
+    assert write_chunk(upload, 0, SlowClient(b"a" * 100), str(tmp_path)) == (100, None)
+    assert retried == [(None, "Another chunk is being written")]
+
+    result, error = finish_upload(upload, str(tmp_path))
+    assert error is None
+    assert open(result["local_path"], "rb").read() == b"a" * 100
+
+
+def test_concurrent_finalize_and_chunks_are_refused(app, tmp_path, monkeypatch):
+    upload, _ = create_upload(1, "lecture.mp4", None, None, str(tmp_path))
+    write_chunk(upload, 0, io.BytesIO(b"a" * 100), str(tmp_path))
+    uploads._hashers.clear()
+    racing = []
+    hash_stream = uploads.hash_stream
+
+    def slow_hash(stream):
+        # Another finalize and a late PATCH arrive while this one is hashing
+        racing.append(finish_upload(upload, str(tmp_path)))
+        racing.append(write_chunk(upload, 100, io.BytesIO(b"b"), str(tmp_path)))
+        return hash_stream(stream)
+    monkeypatch.setattr(uploads, "hash_stream", slow_hash)
+
+    result, error = finish_upload(upload, str(tmp_path))
+    assert error is None and result["content_hash"].startswith("sha256:")
+    assert racing == [(None, "The upload is being written or finalised"), (None, "Another chunk is being written")]
+    assert finish_upload(upload, str(tmp_path)) == (None, "Upload is not in progress")
+
+
+def test_abandoned_uploads_are_swept(app, tmp_path, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setenv("AWS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr(utils, "get_s3_client", lambda: s3)
+    monkeypatch.setattr(uploads, "PART_SIZE", 1000)
+    abandoned, _ = create_upload(1, "old.mp4", None, None, str(tmp_path))
+    write_chunk(abandoned, 0, io.BytesIO(b"x" * 1500), str(tmp_path))
+    active, _ = create_upload(1, "new.mp4", None, None, str(tmp_path))
+    abandoned.updated_at = datetime.utcnow() - timedelta(days=2)
+    db.session.commit()
+
+    assert sweep_uploads(str(tmp_path), ttl=timedelta(hours=24)) == 1
+
+    assert s3.aborted
+    assert not os.path.exists(staging_dir(abandoned, str(tmp_path)))
+    assert Upload.query.get(abandoned.id).status == "aborted"
+    assert Upload.query.get(active.id).status == "uploading"
+    assert sweep_uploads(str(tmp_path), ttl=timedelta(hours=24)) == 0
+
+
+def test_patch_to_a_finished_upload_gives_no_offset_to_resume(tmp_path, monkeypatch):
+    from backend.app import create_app
+    monkeypatch.delenv("AWS_BUCKET_NAME", raising=False)
+    web = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / "web.db"),
+                      'UPLOAD_FOLDER': str(tmp_path / "uploads"), 'JOB_BACKEND': 'local'})
+    client = web.test_client()
+    client.post("/register", data={"username": "student", "password": "secret"})
+    upload_id = client.post("/uploads", json={"filename": "a.mp4", "size": 10}).get_json()["id"]
+
+    stale = client.patch(f"/uploads/{upload_id}", data=b"a" * 4, headers={"Upload-Offset": "4"})
+    assert stale.status_code == 409 and stale.headers["Upload-Offset"] == "0"
+
+    client.delete(f"/uploads/{upload_id}")
+    aborted = client.patch(f"/uploads/{upload_id}", data=b"a" * 4, headers={"Upload-Offset": "0"})
+    assert aborted.status_code == 409 and "Upload-Offset" not in aborted.headers
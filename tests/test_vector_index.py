@@ -0,0 +1,96 @@
+import numpy as np
+
+from backend.vector_index import NumpyCollection, HashingEmbedder, _append_rows
+
+
+SEGMENTS = [
+    "quicksort picks a pivot and partitions the array",
+    "mergesort splits the array into halves and merges them",
+    "the homework is due on friday",
+    "binary search halves the search interval each step",
+]
+
+
+def make_collection(path, video_id="1", segments=SEGMENTS):
+    collection = NumpyCollection(path=str(path))
+    collection.add(
+        documents=list(segments),
+        metadatas=[{"video_id": video_id, "start_time": float(i * 10)} for i in range(len(segments))],
+        ids=[f"{video_id}_{i}" for i in range(len(segments))],
+    )
+    return collection
+
+
+def test_embedder_rows_are_normalised():
+    vectors = HashingEmbedder(dim=256).embed(["hello world", "", "hello hello"])
+    assert vectors.shape == (3, 256)
+    assert np.allclose(np.linalg.norm(vectors[[0, 2]], axis=1), 1.0)
+    assert not vectors[1].any()
+
+
+def test_query_returns_best_segments_for_the_video_only(tmp_path):
+    collection = make_collection(tmp_path)
+    collection.add(documents=["quicksort in another lecture"], metadatas=[{"video_id": "2"}], ids=["2_0"])
+
+    result = collection.query(query_texts=["when is the homework due"], n_results=2, where={"video_id": "1"})
+    assert result["documents"][0][0] == "the homework is due on friday"
+    assert result["metadatas"][0][0]["start_time"] == 20.0
+    assert all(m["video_id"] == "1" for m in result["metadatas"][0])
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+
+def test_unrelated_question_has_no_hits(tmp_path):
+    collection = make_collection(tmp_path)
+    result = collection.query(query_texts=["photosynthesis"], n_results=3, where={"video_id": "1"})
+    assert result["documents"] == [[]]
+
+
+def test_appends_are_incremental_and_persisted(tmp_path):
+    collection = make_collection(tmp_path, segments=SEGMENTS[:2])
+    collection.add(documents=SEGMENTS[2:], metadatas=[{"video_id": "1", "start_time": 20.0},
+                                                       {"video_id": "1", "start_time": 30.0}],
+                   ids=["1_2", "1_3"])
+    # Re-adding existing ids is a no-op
+    collection.add(documents=SEGMENTS[:1], metadatas=[{"video_id": "1"}], ids=["1_0"])
+
+    reopened = NumpyCollection(path=str(tmp_path))
+    matrix = np.load(tmp_path / "1" / "vectors.npy", mmap_mode="r")
+    assert matrix.shape[0] == 4
+    assert reopened.count() == 4
+    result = reopened.query(query_texts=["binary search"], n_results=1, where={"video_id": "1"})
+    assert result["ids"] == [["1_3"]]
+
+
+def test_append_rows_grows_npy_in_place(tmp_path):
+    path = str(tmp_path / "m.npy")
+    first = np.random.rand(3, 8).astype(np.float32)
+    second = np.random.rand(1000, 8).astype(np.float32)
+    _append_rows(path, first)
+    _append_rows(path, second)
+    assert np.array_equal(np.load(path), np.vstack([first, second]))
+
+
+def test_delete_drops_a_video(tmp_path):
+    collection = make_collection(tmp_path)
+    collection.delete(where={"video_id": "1"})
+    assert collection.count() == 0
+    assert collection.query(query_texts=["quicksort"], n_results=3, where={"video_id": "1"})["ids"] == [[]]
+
+
+def test_collections_sharing_a_directory_see_each_others_writes(tmp_path):
+    # Two worker processes, each with its own collection over the same files
+    web = NumpyCollection(path=str(tmp_path))
+    assert web.count() == 0
+    worker = make_collection(tmp_path, segments=SEGMENTS[:2])
+
+    assert web.count() == 2
+    assert web.query(query_texts=["quicksort pivot"], n_results=1, where={"video_id": "1"})["ids"] == [["1_0"]]
+
+    worker.add(documents=SEGMENTS[2:], metadatas=[{"video_id": "1"}, {"video_id": "1"}], ids=["1_2", "1_3"])
+    web.add(documents=["quicksort in another lecture"], metadatas=[{"video_id": "2"}], ids=["2_0"])
+    assert worker.count() == web.count() == 5
+    assert web.query(query_texts=["binary search"], n_results=1, where={"video_id": "1"})["ids"] == [["1_3"]]
+
+    worker.delete(where={"video_id": "1"})
+    assert web.count() == 1
+    assert web.query(query_texts=["quicksort"], n_results=3, where={"video_id": "1"})["ids"] == [[]]
@@ -0,0 +1,127 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from backend import jobs, youtube
+from backend.extensions import db
+from backend.models import User, Video
+from backend.dedup import create_content
+from backend.status import video_statuses
+
+
+@pytest.fixture(name="app")
+def app_fixture(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.root_path = str(tmp_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    db.init_app(app)
+    monkeypatch.delenv("AWS_BUCKET_NAME", raising=False)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.fixture(name="enqueued")
+def enqueued_fixture(monkeypatch):
+    enqueued = []
+    queue = SimpleNamespace(enqueue=lambda kind, video_id, payload=None: enqueued.append((kind, video_id, payload)))
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    return enqueued
+
+
+def run_job(app, video, **kwargs):
+    youtube.ingest_youtube(video.id, app.app_context(), "https://www.youtube.com/watch?v=abc", **kwargs)
+    # The job committed through its own session
+    db.session.expire_all()
+    return Video.query.get(video.id)
+
+
+def make_video():
+    user = User(username="student")
+    video = Video(title="YouTube: link", filename="youtube.mp4", status="pending", author=user)
+    db.session.add_all([user, video])
+    db.session.commit()
+    return video
+
+
+def fake_download(seen, data=b"frames" * 100):
+    def download(url, path, format_spec=None, progress_hook=None, max_filesize=None):
+        seen.append(format_spec)
+        progress_hook({"status": "downloading", "downloaded_bytes": len(data) // 2,
+                       "total_bytes": len(data), "info_dict": {}})
+        seen.append(video_statuses(Video.query.first().user_id))
+        with open(path, "wb") as f:
+            f.write(data)
+        progress_hook({"status": "finished", "total_bytes": len(data)})
+        return True
+    return download
+
+
+def test_format_spec_caps_height_and_bitrate():
+    spec = youtube.format_spec(max_height=480, max_tbr=1500, audio=False)
+    assert spec.startswith("bestvideo[height<=480][tbr<=1500][ext=mp4]+bestaudio[ext=m4a]")
+    assert "best[height<=480][tbr<=1500]" in spec
+    assert youtube.format_spec(audio=True) == "bestaudio[ext=m4a]/bestaudio"
+
+
+def test_progress_spans_video_and_audio_and_is_throttled(monkeypatch):
+    written = []
+    monkeypatch.setattr(youtube, "set_progress", lambda video, percent: written.append(percent))
+    now = [0.0]
+    reporter = youtube.ProgressReporter(object(), interval=2.0, clock=lambda: now[0])
+    info = {"requested_formats": [{"filesize": 800}, {"filesize_approx": 200}]}
+
+    reporter({"status": "downloading", "downloaded_bytes": 400, "info_dict": info})
+    now[0] = 1.0
+    reporter({"status": "downloading", "downloaded_bytes": 600, "info_dict": info})
+    reporter({"status": "finished", "total_bytes": 800})
+    now[0] = 3.0
+    reporter({"status": "downloading", "downloaded_bytes": 100, "info_dict": info})
+
+    # The 60% update came too soon; the audio stream continues from the video's 80%
+    assert written == [40, 90]
+
+
+def test_download_is_stored_and_queued_for_processing(app, enqueued, monkeypatch):
+    seen = []
+    monkeypatch.setattr("backend.utils.download_youtube_video", fake_download(seen))
+    video = make_video()
+
+    video = run_job(app, video, content_key="youtube:abc", audio_only=True)
+
+    assert seen[0] == youtube.format_spec()
+    assert seen[1] == [{"id": video.id, "status": "downloading", "progress": 50}]
+    assert video.content.content_hash == "youtube:abc"
+    assert video.content.source_url == "https://www.youtube.com/watch?v=abc"
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], "abc.mp4"))
+    assert video.status == "pending" and video.download_progress is None
+    assert enqueued == [("process_video", video.id, {"audio_only": True})]
+
+
+def test_content_added_while_queued_is_reused(app, enqueued, monkeypatch):
+    monkeypatch.setattr("backend.utils.download_youtube_video",
+                        lambda *args, **kwargs: pytest.fail("downloaded a known video"))
+    content, _ = create_content("youtube:abc", file_path="static/uploads/abc.mp4")
+    content.status = "processing"
+    video = make_video()
+
+    video = run_job(app, video, content_key="youtube:abc")
+
+    assert video.content_id == content.id and video.status == "processing"
+    assert enqueued == []
+
+
+def test_failed_download_marks_the_video_failed(app, enqueued, monkeypatch):
+    def broken(url, path, **kwargs):
+        with open(path + ".part", "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("ERROR: Private video")
+    monkeypatch.setattr("backend.utils.download_youtube_video", broken)
+    video = make_video()
+
+    assert run_job(app, video).status == "failed"
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
+    assert enqueued == []